@@ -1,11 +1,96 @@
+import threading
+import time
+
 import pygame
 
 initial_fill_color = (255, 0, 255, 0xff)
 
+# the most wall-clock time the scheduler will try to catch up on: beyond this, e.g. after the window was dragged or the
+# process was suspended, the owed time is dropped rather than repaid in one long burst of steps.
+max_catch_up_sec = 0.25
+
+# the most render frames skipped in a row while the simulation is behind, so the window never stops updating.
+max_skipped_frames = 4
+
+
+class FixedTimestepScheduler(object):
+    """
+    Advances a simulation in fixed increments of simulated time, paced by wall-clock time rather than by the frame rate.
+    - each call to `advance` runs as many whole steps as the wall time elapsed since the last call has paid for.
+    - alternatively, `start_worker` runs the same loop on a background thread: the kernel releases the GIL while it
+      steps, so steps overlap whatever the main thread does outside `lock`.
+    - `lock` is held around every step; hold it while reading simulation state that must not change mid-read, and no
+      longer: e.g. copy the fields a frame needs under it, then draw from the copy.
+    """
+
+    def __init__(self, step_cb, sim_updates_per_sec=60, max_substeps_per_frame=8):
+        self.step_cb = step_cb
+        self.step_interval = 1.0 / sim_updates_per_sec
+        self.max_substeps_per_frame = max_substeps_per_frame
+        self.accumulator = 0.0
+        self.last_time = None
+        self.step_count = 0
+        self.lock = threading.Lock()
+
+        self.worker_thread = None
+        self.is_worker_running = False
+
+    def advance(self):
+        """
+        Runs the steps owed for the wall time elapsed since the last call, up to `max_substeps_per_frame`.
+        :return: True if the simulation has caught up with wall time, False if steps are still owed.
+        """
+
+        now = time.perf_counter()
+        if self.last_time is None:
+            self.last_time = now
+        self.accumulator = min(self.accumulator + now - self.last_time, max_catch_up_sec)
+        self.last_time = now
+
+        substep_count = 0
+        while self.accumulator >= self.step_interval and substep_count < self.max_substeps_per_frame:
+            with self.lock:
+                self.step_cb()
+            self.accumulator -= self.step_interval
+            self.step_count += 1
+            substep_count += 1
+
+        return self.accumulator < self.step_interval
+
+    def start_worker(self):
+        self.is_worker_running = True
+        self.worker_thread = threading.Thread(target=self.run_worker, name="simulation-worker", daemon=True)
+        self.worker_thread.start()
+
+    def stop_worker(self):
+        if self.worker_thread is not None:
+            self.is_worker_running = False
+            self.worker_thread.join()
+            self.worker_thread = None
+
+    def run_worker(self):
+        while self.is_worker_running:
+            caught_up = self.advance()
+            if caught_up:
+                # sleeping until the next step is due:
+                time.sleep(max(self.step_interval - self.accumulator, 0.0))
+
 
 def run(width, height, caption,
         run_menu_cb=None, render_cb=None, init_cb=None, de_init_cb=None, should_yield_to_menu_cb=None,
-        desired_updates_per_sec=60):
+        desired_updates_per_sec=60,
+        step_cb=None, sim_updates_per_sec=60, max_substeps_per_frame=8, step_in_worker_thread=False, capture_cb=None):
+    """
+    Runs the app: alternates between the menu (`run_menu_cb`) and the simulation loop until either asks to quit.
+    - `render_cb` draws a frame; rendering is capped at `desired_updates_per_sec`.
+    - `step_cb`, if given, advances the simulation at a fixed `sim_updates_per_sec`, independently of rendering: up to
+      `max_substeps_per_frame` steps run per frame, and frames are skipped (a few at a time) while the simulation is
+      behind. With `step_in_worker_thread`, stepping happens on a background thread instead.
+    - while stepping, `render_cb` runs with the scheduler's lock held, so that no step changes the state it draws,
+      unless `capture_cb` is given: `capture_cb` then runs under the lock, to copy the state the next frame needs, and
+      `render_cb` draws from that copy without the lock, overlapping the worker thread's steps.
+    """
+
     #
     # Validating params:
     #
@@ -61,9 +146,14 @@ def run(width, height, caption,
         if not keep_running:
             break
 
+        # a fresh scheduler per visit, so that time spent in the menu is not owed to the simulation:
+        scheduler = None
+        if step_cb is not None:
+            scheduler = FixedTimestepScheduler(step_cb, sim_updates_per_sec, max_substeps_per_frame)
+
         keep_running = run_simulation(
             screen, init_cb, de_init_cb, render_cb, should_yield_to_menu_cb, pygame_widgets_event_listener_list, clock,
-            desired_updates_per_sec
+            desired_updates_per_sec, scheduler, step_in_worker_thread, capture_cb
         )
         if not keep_running:
             break
@@ -73,7 +163,8 @@ def run(width, height, caption,
 
 def run_simulation(
         screen, init_cb, de_init_cb, render_cb, should_yield_to_menu_cb,
-        pygame_widgets_event_listener_list, clock, desired_updates_per_sec
+        pygame_widgets_event_listener_list, clock, desired_updates_per_sec,
+        scheduler=None, step_in_worker_thread=False, capture_cb=None
 ):
     # by default, when the simulation ends, the app loops back to the main menu.
     # this attribute can be set to 'False' before returning to change this.
@@ -87,6 +178,10 @@ def run_simulation(
     # DEBUG: filling screen with magenta/fuchsia
     screen.fill(initial_fill_color)
 
+    if scheduler is not None and step_in_worker_thread:
+        scheduler.start_worker()
+
+    skipped_frame_count = 0
     is_running = True
     while is_running:
         #
@@ -121,17 +216,41 @@ def run_simulation(
                 keep_running = True
                 break
 
+        #
+        # Stepping:
+        # - while the simulation is behind wall time, rendering is skipped (for a few frames at most) so that the
+        #   physics keeps its pace.
+        #
+
+        if scheduler is not None and not step_in_worker_thread:
+            caught_up = scheduler.advance()
+            if not caught_up and skipped_frame_count < max_skipped_frames:
+                skipped_frame_count += 1
+                continue
+        skipped_frame_count = 0
+
         #
         # Rendering:
         #
 
         screen.fill(initial_fill_color)
-        render_cb(screen)
+        if scheduler is None:
+            render_cb(screen)
+        elif capture_cb is not None:
+            with scheduler.lock:
+                capture_cb()
+            render_cb(screen)
+        else:
+            with scheduler.lock:
+                render_cb(screen)
         pygame.display.flip()
 
         # Sleeping:
         clock.tick(desired_updates_per_sec)
 
+    if scheduler is not None:
+        scheduler.stop_worker()
+
     if de_init_cb is not None:
         de_init_cb()
 
@@ -0,0 +1,757 @@
+#!/usr/bin/env python3.9
+
+"""
+Headless throughput benchmark for `Simulator.step`.
+- builds a grid per requested size and steps it back-to-back, with no display and no frame-rate cap.
+- reports steps/sec, ms/step broken down by pipeline stage, and peak RSS; `--json` emits the same as a JSON document
+  so results can be compared across commits.
+- `--compare-precision` instead runs each grid size in every `Simulator.precision`, reporting throughput, mass drift,
+  and how far each precision's fields end up from the double-precision run's.
+- `--compare-blocking` likewise runs each grid size with `Simulator.relaxation_block_depth` 1 and N on the same grid,
+  reporting the bandwidth the `diffuse` sweeps sustain at each depth and the blocked run's speedup.
+- `--compare-active-tiles` likewise runs each grid size with and without `Simulator.active_tiles`, reporting the
+  speedup and how far the tiled run's fields end up from the full run's.
+- `--ny` times rectangular grids instead, e.g. `256 --ny 144` for a 16:9 domain, whose cost should follow the cell
+  count rather than the longer edge.
+- `--obstacles` times grids with a solid cylinder in the fluid's path (see `Simulator.set_obstacles`), for comparison
+  with the same run without it.
+- `--compare-advection` instead rotates a slotted disc of density through one revolution under each
+  `Simulator.advection_scheme`, reporting the cost per step and how much of the disc's detail survives, so that a
+  corrected scheme at n/2 can be weighed against the semi-Lagrangian one at n.
+- `--3d` times `fluids.simulator3d.Simulator3D` on n^3 grids instead, reporting the memory its fields take.
+Run with `python -m fluids.bench` once the extension module is built.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from . import simulator
+from . import simulator3d
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows: peak RSS is then reported as `None`.
+    resource = None
+
+
+DEFAULT_GRID_SIZES = (64, 128, 256, 512)
+TARGET_UPDATES_PER_SEC = 60.0
+
+# `Simulator` properties set by `compare_precisions` and `compare_active_tiles`, unless overridden:
+PRECISION_COMPARISON_OPTIONS = {'diffusion': 1e-3, 'viscosity': 1e-3}
+
+# the depth `compare_blocking` measures against depth 1, unless `--relaxation-block-depth` sets another:
+DEFAULT_COMPARISON_BLOCK_DEPTH = 4
+
+
+def create_bench_sim(n, sim_options=None, ny=None):
+    """
+    Creates a simulator seeded with a centered square of moving fluid, so every kernel does real work.
+    :param n: number of non-border cells per edge, or along x only if `ny` is given
+    :param sim_options: a dict of `Simulator` properties to set, e.g. {'thread_count': 4}; 'precision' is passed to
+        the constructor instead, and 'obstacles', if True, places a solid cylinder downstream of the square.
+    :param ny: number of non-border cells along y, for a rectangular grid
+    :return: the new Simulator instance
+    """
+
+    sim_options = dict(sim_options or {})
+    precision = sim_options.pop('precision', simulator.PRECISION_SINGLE)
+    obstacles = sim_options.pop('obstacles', False)
+    sim = simulator.Simulator(n, init_diffusion=1.0, init_viscosity=1.0, time_rate=0.01, precision=precision, ny=ny)
+    for name, value in sim_options.items():
+        setattr(sim, name, value)
+
+    size_x, size_y = sim.shape
+    if obstacles:
+        xs, ys = np.indices(sim.shape)
+        radius = max(min(sim.nx, sim.ny) // 8, 1)
+        sim.set_obstacles((xs - 2 * size_x // 3) ** 2 + (ys - size_y // 2) ** 2 <= radius ** 2)
+
+    square_size = max(min(sim.nx, sim.ny) // 8, 1)
+    square_x = slice((size_x - square_size) // 2, (size_x + square_size) // 2)
+    square_y = slice((size_y - square_size) // 2, (size_y + square_size) // 2)
+    density = sim.density_view()
+    vx = sim.vx_view()
+    vy = sim.vy_view()
+    density[square_x, square_y] = 1.0
+    vx[square_x, square_y] = 10.0
+    vy[square_x, square_y] = 5.0
+
+    return sim
+
+
+def time_steps(sim, step_count):
+    """
+    Runs `step_count` steps back-to-back.
+    :return: the total wall-clock time taken, in seconds.
+    """
+
+    start_time = time.perf_counter()
+    for i in range(step_count):
+        sim.step()
+    return time.perf_counter() - start_time
+
+
+def peak_rss_bytes():
+    """
+    :return: this process's peak resident set size so far, in bytes, or `None` if unavailable.
+    """
+
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return max_rss if sys.platform == "darwin" else 1024 * max_rss
+
+
+def bench_grid_size(n, step_count=None, min_duration_sec=1.0, sim_options=None, ny=None):
+    """
+    Benchmarks one grid size.
+    :param n: number of non-border cells per edge, or along x only if `ny` is given
+    :param step_count: the number of steps to time, or `None` to run for about `min_duration_sec`
+    :param min_duration_sec: see `step_count`
+    :param sim_options: see `create_bench_sim`
+    :param ny: number of non-border cells along y, for a rectangular grid
+    :return: a dict of results, ready for JSON serialization
+    """
+
+    sim = create_bench_sim(n, sim_options, ny)
+    ny = sim.ny
+
+    # warming up, then (unless told otherwise) sizing the run so that it lasts about `min_duration_sec`:
+    warmup_time = time_steps(sim, 1)
+    if step_count is None:
+        step_count = max(int(min_duration_sec / max(warmup_time, 1e-9)), 3)
+
+    sim.stage_timing = True
+    sim.reset_stage_times()
+    total_time = time_steps(sim, step_count)
+    stage_times = sim.stage_times
+    last_step_stats = sim.last_step_stats
+    # the size of one field value, which the `diffuse` sweeps read and write: 8 bytes in double precision, else 4.
+    value_size = sim.density_view().itemsize
+
+    sim.dispose()
+
+    # each relaxation sweep reads `x` and `x0` and writes `x` once per interior cell, at least; dividing that traffic by
+    # the time spent gives the bandwidth the `diffuse` sweeps effectively sustain.
+    diffuse_sweep_count = sum(
+        last_step_stats[stage_name]['iterations'] for stage_name in ('diffuse_vx', 'diffuse_vy', 'diffuse_density')
+    )
+    diffuse_bytes_per_step = diffuse_sweep_count * 3 * n * ny * value_size
+    diffuse_time_per_step = stage_times['diffuse'] / step_count
+
+    return {
+        'n': n,
+        'ny': ny,
+        'steps': step_count,
+        'seconds': total_time,
+        'steps_per_sec': step_count / total_time,
+        'ms_per_step': 1e3 * total_time / step_count,
+        'stage_ms_per_step': {
+            stage_name: 1e3 * stage_time / step_count
+            for stage_name, stage_time in stage_times.items()
+        },
+        'diffuse_effective_gb_per_sec': diffuse_bytes_per_step / diffuse_time_per_step / 1e9,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'last_step_stats': last_step_stats,
+    }
+
+
+def bench_batch(n, batch_size, step_count=None, min_duration_sec=1.0, sim_options=None):
+    """
+    Benchmarks a `BatchSimulator` of `batch_size` members, each seeded like `create_bench_sim`.
+    :param sim_options: see `create_bench_sim`; `thread_count` spreads members over threads, the rest applies to every
+        member.
+    :return: a dict of results, ready for JSON serialization
+    """
+
+    member_options = dict(sim_options or {})
+    thread_count = member_options.pop('thread_count', 1)
+    if member_options.pop('precision', simulator.PRECISION_SINGLE) != simulator.PRECISION_SINGLE:
+        raise ValueError("batch members are always single-precision")
+    batch = simulator.BatchSimulator(batch_size, n, init_diffusion=1.0, init_viscosity=1.0, time_rate=0.01)
+    batch.thread_count = thread_count
+    batch.configure(**member_options)
+
+    seed_sim = create_bench_sim(n)
+    for block, view in zip(
+            (batch.density_block(), batch.vx_block(), batch.vy_block()),
+            (seed_sim.density_view(), seed_sim.vx_view(), seed_sim.vy_view())
+    ):
+        block[:] = view
+    seed_sim.dispose()
+
+    warmup_time = time_steps(batch, 1)
+    if step_count is None:
+        step_count = max(int(min_duration_sec / max(warmup_time, 1e-9)), 3)
+    total_time = time_steps(batch, step_count)
+
+    batch.dispose()
+
+    return {
+        'n': n,
+        'batch_size': batch_size,
+        'steps': step_count,
+        'seconds': total_time,
+        'steps_per_sec': step_count / total_time,
+        'member_steps_per_sec': batch_size * step_count / total_time,
+        'ms_per_step': 1e3 * total_time / step_count,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def bench_volume(n, step_count=None, min_duration_sec=1.0, sim_options=None):
+    """
+    Benchmarks a `Simulator3D` of n^3 cells, seeded with a centered cube of moving fluid.
+    :param sim_options: a dict of `Simulator3D` properties to set, e.g. {'thread_count': 4}
+    :return: a dict of results, ready for JSON serialization
+    """
+
+    sim = simulator3d.Simulator3D(n, init_diffusion=1.0, init_viscosity=1.0, time_rate=0.01)
+    for name, value in (sim_options or {}).items():
+        setattr(sim, name, value)
+
+    cube_size = max(n // 8, 1)
+    cube = slice((n + 2 - cube_size) // 2, (n + 2 + cube_size) // 2)
+    sim.density_view()[cube, cube, cube] = 1.0
+    sim.vx_view()[cube, cube, cube] = 10.0
+    sim.vy_view()[cube, cube, cube] = 5.0
+    sim.vz_view()[cube, cube, cube] = 2.5
+
+    warmup_time = time_steps(sim, 1)
+    if step_count is None:
+        step_count = max(int(min_duration_sec / max(warmup_time, 1e-9)), 3)
+    total_time = time_steps(sim, step_count)
+    field_bytes = sim.nbytes
+
+    sim.dispose()
+
+    return {
+        'n': n,
+        'steps': step_count,
+        'seconds': total_time,
+        'steps_per_sec': step_count / total_time,
+        'ms_per_step': 1e3 * total_time / step_count,
+        'field_bytes': field_bytes,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def check_fused_equivalence(n, step_count=20, sim_options=None):
+    """
+    Steps the same seeded grid with the staged and with the fused kernels (see `Simulator.fused_step`), adding sources
+    every step, and compares the results.
+    :param sim_options: see `create_bench_sim`
+    :return: a dict of results, ready for JSON serialization; the fields should match exactly, which
+        `tests/test_fused.py` asserts across settings.
+    """
+
+    final_states = []
+    for fused_step in (False, True):
+        sim = create_bench_sim(n, sim_options)
+        sim.fused_step = fused_step
+        for i in range(step_count):
+            sim.add_density((n // 4, n // 4), 1.0)
+            sim.add_velocity((n // 2, n // 4), (2.0, -1.0))
+            sim.step()
+        final_states.append((sim.dump_density_array(), sim.dump_vx_array(), sim.dump_vy_array(), sim.last_step_stats))
+        sim.dispose()
+
+    staged_state, fused_state = final_states
+    return {
+        'n': n,
+        'steps': step_count,
+        'max_abs_difference': max(
+            float(np.abs(staged_field - fused_field).max())
+            for staged_field, fused_field in zip(staged_state[:3], fused_state[:3])
+        ),
+        'same_solve_stats': staged_state[3] == fused_state[3],
+    }
+
+
+def interior_mass(sim):
+    density = sim.density_view()
+    return float(density[1:-1, 1:-1].sum(dtype=np.float64))
+
+
+def compare_precisions(n, step_count=100, sim_options=None):
+    """
+    Runs the same seeded grid for `step_count` steps in each of `Simulator.precision`'s modes.
+    - the grid diffuses gently (see `PRECISION_COMPARISON_OPTIONS`): at large `n`, the usual bench constants wash the
+      seed out within ~100 steps, leaving values too small for their drift to mean anything.
+    :param sim_options: see `create_bench_sim`; these override `PRECISION_COMPARISON_OPTIONS`, and any 'precision' is
+        overridden.
+    :return: a list of dicts of results, one per precision, ready for JSON serialization:
+        - mass_drift is (final - initial) / initial interior mass, which the scheme itself does not keep at 0.
+        - max_density_error and max_velocity_error are the largest differences from the double-precision run's fields,
+          i.e. the round-off each precision accumulated.
+    """
+
+    options = dict(PRECISION_COMPARISON_OPTIONS)
+    options.update(sim_options or {})
+
+    runs = {}
+    for precision in simulator.precision_codes:
+        sim = create_bench_sim(n, dict(options, precision=precision))
+        initial_mass = interior_mass(sim)
+        total_time = time_steps(sim, step_count)
+        runs[precision] = {
+            'fields': [np.array(view, dtype=np.float64) for view in (sim.density_view(), sim.vx_view(), sim.vy_view())],
+            'seconds': total_time,
+            'mass_drift': (interior_mass(sim) - initial_mass) / initial_mass,
+        }
+        sim.dispose()
+
+    reference_fields = runs[simulator.PRECISION_DOUBLE]['fields']
+    results = []
+    for precision, run in runs.items():
+        density_error, vx_error, vy_error = (
+            float(np.abs(field - reference_field).max())
+            for field, reference_field in zip(run['fields'], reference_fields)
+        )
+        results.append({
+            'n': n,
+            'precision': precision,
+            'steps': step_count,
+            'ms_per_step': 1e3 * run['seconds'] / step_count,
+            'steps_per_sec': step_count / run['seconds'],
+            'mass_drift': run['mass_drift'],
+            'max_density_error': density_error,
+            'max_velocity_error': max(vx_error, vy_error),
+        })
+    return results
+
+
+def compare_blocking(n, block_depth=DEFAULT_COMPARISON_BLOCK_DEPTH, step_count=None, min_duration_sec=1.0,
+                     sim_options=None):
+    """
+    Times the same seeded grid with relaxation sweeps unblocked (depth 1) and blocked `block_depth` deep (see
+    `Simulator.relaxation_block_depth`), over the same number of steps.
+    :param step_count: the number of steps to time per run, or `None` to size both runs by the unblocked one's
+        `min_duration_sec`
+    :param sim_options: see `create_bench_sim`; any 'relaxation_block_depth' is overridden.
+    :return: a list of dicts of results, one per depth, ready for JSON serialization: `bench_grid_size`'s, plus
+        - diffuse_speedup, the unblocked run's `diffuse` time over this run's.
+    """
+
+    results = []
+    for depth in (1, block_depth):
+        result = bench_grid_size(n, step_count, min_duration_sec, dict(sim_options or {}, relaxation_block_depth=depth))
+        step_count = result['steps']
+        result['relaxation_block_depth'] = depth
+        results.append(result)
+
+    unblocked_diffuse_ms = results[0]['stage_ms_per_step']['diffuse']
+    for result in results:
+        result['diffuse_speedup'] = unblocked_diffuse_ms / result['stage_ms_per_step']['diffuse']
+    return results
+
+
+def compare_active_tiles(n, step_count=50, sim_options=None):
+    """
+    Runs the same seeded grid for `step_count` steps on the whole grid, then restricted to its active tiles (see
+    `Simulator.active_tiles`). The grid diffuses gently, as in `compare_precisions`, so that the fluid stays local.
+    :param sim_options: see `create_bench_sim`; these override `PRECISION_COMPARISON_OPTIONS`, and any 'active_tiles'
+        is overridden.
+    :return: a list of dicts of results, one per run, ready for JSON serialization:
+        - mean_tile_fraction is the mean fraction of tiles processed per step (1 for the full run).
+        - mass_drift is as in `compare_precisions`.
+        - max_density_error and max_velocity_error are the largest differences from the full run's fields.
+    """
+
+    options = dict(PRECISION_COMPARISON_OPTIONS)
+    options.update(sim_options or {})
+
+    runs = {}
+    for active_tiles in (False, True):
+        sim = create_bench_sim(n, dict(options, active_tiles=active_tiles))
+        initial_mass = interior_mass(sim)
+        tile_fraction_total = 0.0
+        start_time = time.perf_counter()
+        for i in range(step_count):
+            sim.step()
+            tile_fraction_total += sim.last_step_stats['active_tile_fraction']
+        total_time = time.perf_counter() - start_time
+        runs[active_tiles] = {
+            'fields': [np.array(view, dtype=np.float64) for view in (sim.density_view(), sim.vx_view(), sim.vy_view())],
+            'seconds': total_time,
+            'mean_tile_fraction': tile_fraction_total / step_count,
+            'mass_drift': (interior_mass(sim) - initial_mass) / initial_mass,
+        }
+        sim.dispose()
+
+    reference_fields = runs[False]['fields']
+    results = []
+    for active_tiles, run in runs.items():
+        density_error, vx_error, vy_error = (
+            float(np.abs(field - reference_field).max())
+            for field, reference_field in zip(run['fields'], reference_fields)
+        )
+        results.append({
+            'n': n,
+            'active_tiles': active_tiles,
+            'steps': step_count,
+            'ms_per_step': 1e3 * run['seconds'] / step_count,
+            'steps_per_sec': step_count / run['seconds'],
+            'mean_tile_fraction': run['mean_tile_fraction'],
+            'mass_drift': run['mass_drift'],
+            'max_density_error': density_error,
+            'max_velocity_error': max(vx_error, vy_error),
+        })
+    return results
+
+
+def slotted_disc(sim):
+    """
+    :return: Zalesak's slotted disc, as a density field of `sim`'s shape: a disc of radius 0.15 centered at (0.5, 0.75)
+        of the unit square, with a slot 0.05 wide cut into it from below. It lies within 0.4 of the grid's center.
+    """
+
+    xs, ys = np.indices(sim.shape)
+    xs = (xs - 0.5) / sim.nx
+    ys = (ys - 0.5) / sim.ny
+    disc = (xs - 0.5) ** 2 + (ys - 0.75) ** 2 <= 0.15 ** 2
+    slot = (np.abs(xs - 0.5) <= 0.025) & (ys <= 0.85)
+    return (disc & ~slot).astype(np.float32)
+
+
+def rotating_flow(sim, angular_speed):
+    """
+    :return: the (vx, vy) fields of a solid rotation about the grid's center, out to a radius of 0.45 of the unit
+        square, which then fades to rest by 0.5. The flow is divergence-free and stays off the walls.
+    """
+
+    xs, ys = np.indices(sim.shape)
+    xs = (xs - 0.5) / sim.nx - 0.5
+    ys = (ys - 0.5) / sim.ny - 0.5
+    fade = np.clip((0.5 - np.hypot(xs, ys)) / 0.05, 0.0, 1.0)
+    return -angular_speed * fade * ys, angular_speed * fade * xs
+
+
+def compare_advection_schemes(n, step_count=None, sim_options=None):
+    """
+    Rotates a slotted disc of density (see `slotted_disc`) once around the grid's center under each advection scheme,
+    without diffusion, and compares the result with the initial disc, which exact advection would return.
+    - density is stepped alone (see `Simulator.step_density`), through the same fixed rotation (see `rotating_flow`):
+      the velocity is never advected or projected, so every scheme is measured on exactly that flow.
+    :param step_count: the number of steps per revolution, or `None` for 2n, which moves the disc's far edge ~1.25
+        cells per step at any grid size
+    :param sim_options: see `create_bench_sim`; any 'advection_scheme', 'diffusion' or 'viscosity' is overridden.
+    :return: a list of dicts of results, one per scheme, ready for JSON serialization:
+        - l1_error is sum(|density - disc|) / sum(disc), which compares across grid sizes.
+        - variance_retained is the density's variance over the initial disc's: 1 for perfectly kept detail.
+        - peak_density is the density's maximum, which the disc starts at 1.
+        With the default step counts, expect l1_error of about 1.0 / 0.87 / 0.52 (semi-Lagrangian / MacCormack /
+        BFECC) at n=64, falling to about 0.63 / 0.33 / 0.19 at n=256. The corrected schemes keep the peak at ~1, where
+        semi-Lagrangian smears it down to 0.57 (n=64) - 0.89 (n=256).
+    """
+
+    if step_count is None:
+        step_count = 2 * n
+    options = dict(sim_options or {})
+    precision = options.pop('precision', simulator.PRECISION_SINGLE)
+    options.pop('obstacles', None)
+
+    results = []
+    for scheme in simulator.advection_scheme_codes:
+        sim = simulator.Simulator(n, init_diffusion=0.0, init_viscosity=0.0, time_rate=0.01, precision=precision)
+        for name, value in options.items():
+            setattr(sim, name, value)
+        sim.advection_scheme = scheme
+
+        disc = slotted_disc(sim)
+        density = sim.density_view()
+        density[:] = disc
+        sim.vx_view()[:], sim.vy_view()[:] = rotating_flow(sim, 2 * np.pi / (step_count * sim.dt))
+
+        sim.stage_timing = True
+        sim.reset_stage_times()
+        start_time = time.perf_counter()
+        for i in range(step_count):
+            sim.step_density()
+        total_time = time.perf_counter() - start_time
+        stage_times = sim.stage_times
+
+        interior = (slice(1, -1), slice(1, -1))
+        final_density = np.array(density[interior], dtype=np.float64)
+        initial_density = disc[interior].astype(np.float64)
+        results.append({
+            'n': n,
+            'advection_scheme': scheme,
+            'steps': step_count,
+            'seconds': total_time,
+            'ms_per_step': 1e3 * total_time / step_count,
+            'advect_ms_per_step': 1e3 * stage_times['advect'] / step_count,
+            'l1_error': float(np.abs(final_density - initial_density).sum() / initial_density.sum()),
+            'variance_retained': float(final_density.var() / initial_density.var()),
+            'peak_density': float(final_density.max()),
+        })
+        sim.dispose()
+    return results
+
+
+def print_advection_results_header():
+    print(f"{'n':>6} {'scheme':>16} {'steps':>7} {'ms/step':>10} {'advect ms':>10} {'total sec':>10} {'L1 error':>10} "
+          f"{'variance':>9} {'peak':>7}")
+
+
+def print_advection_results_rows(results):
+    for result in results:
+        print(
+            f"{result['n']:>6} {result['advection_scheme']:>16} {result['steps']:>7} {result['ms_per_step']:>10.3f} "
+            f"{result['advect_ms_per_step']:>10.3f} {result['seconds']:>10.3f} {result['l1_error']:>10.4f} "
+            f"{result['variance_retained']:>9.4f} {result['peak_density']:>7.4f}"
+        )
+
+
+def print_blocking_results_header():
+    print(f"{'n':>6} {'depth':>6} {'steps':>7} {'ms/step':>10} {'steps/sec':>10} {'diffuse ms':>11} "
+          f"{'diffuse GB/s':>13} {'speedup':>8}")
+
+
+def print_blocking_results_rows(results):
+    for result in results:
+        print(
+            f"{result['n']:>6} {result['relaxation_block_depth']:>6} {result['steps']:>7} "
+            f"{result['ms_per_step']:>10.3f} {result['steps_per_sec']:>10.1f} "
+            f"{result['stage_ms_per_step']['diffuse']:>11.3f} {result['diffuse_effective_gb_per_sec']:>13.2f} "
+            f"{result['diffuse_speedup']:>7.2f}x"
+        )
+
+
+def print_active_tile_results_header():
+    print(f"{'n':>6} {'tiles':>6} {'steps':>7} {'ms/step':>10} {'steps/sec':>10} {'tile frac':>10} {'mass drift':>12} "
+          f"{'density err':>12} {'velocity err':>13}")
+
+
+def print_active_tile_results_rows(results):
+    for result in results:
+        print(
+            f"{result['n']:>6} {'on' if result['active_tiles'] else 'off':>6} {result['steps']:>7} "
+            f"{result['ms_per_step']:>10.3f} {result['steps_per_sec']:>10.1f} {result['mean_tile_fraction']:>10.3f} "
+            f"{result['mass_drift']:>12.3e} {result['max_density_error']:>12.3e} {result['max_velocity_error']:>13.3e}"
+        )
+
+
+def print_precision_results_header():
+    print(f"{'n':>6} {'precision':>10} {'steps':>7} {'ms/step':>10} {'steps/sec':>10} {'mass drift':>12} "
+          f"{'density err':>12} {'velocity err':>13}")
+
+
+def print_precision_results_rows(results):
+    for result in results:
+        print(
+            f"{result['n']:>6} {result['precision']:>10} {result['steps']:>7} {result['ms_per_step']:>10.3f} "
+            f"{result['steps_per_sec']:>10.1f} {result['mass_drift']:>12.3e} {result['max_density_error']:>12.3e} "
+            f"{result['max_velocity_error']:>13.3e}"
+        )
+
+
+def describe_environment():
+    """
+    :return: metadata identifying the machine and source revision a benchmark ran on.
+    """
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def print_results_header():
+    header = f"{'n':>6} {'ny':>6} {'steps':>7} {'ms/step':>10} {'steps/sec':>10} {'60 Hz?':>7}"
+    header += "".join(f" {stage_name:>11}" for stage_name in simulator.PIPELINE_STAGE_NAMES)
+    header += f" {'diffuse GB/s':>13} {'peak RSS':>10}"
+    print(header)
+
+
+def print_results_row(result):
+    meets_target = "yes" if result['steps_per_sec'] >= TARGET_UPDATES_PER_SEC else "no"
+    row = (
+        f"{result['n']:>6} {result['ny']:>6} {result['steps']:>7} {result['ms_per_step']:>10.3f} "
+        f"{result['steps_per_sec']:>10.1f} {meets_target:>7}"
+    )
+    row += "".join(
+        f" {result['stage_ms_per_step'][stage_name]:>11.3f}" for stage_name in simulator.PIPELINE_STAGE_NAMES
+    )
+    row += f" {result['diffuse_effective_gb_per_sec']:>13.2f}"
+    peak_rss = result['peak_rss_bytes']
+    row += f" {peak_rss / 2**20:>8.1f}MB" if peak_rss is not None else f" {'n/a':>10}"
+    print(row)
+
+
+def print_batch_results_header():
+    print(f"{'n':>6} {'batch':>7} {'steps':>7} {'ms/step':>10} {'steps/sec':>10} {'member steps/sec':>17} {'peak RSS':>10}")
+
+
+def print_batch_results_row(result):
+    row = (
+        f"{result['n']:>6} {result['batch_size']:>7} {result['steps']:>7} {result['ms_per_step']:>10.3f} "
+        f"{result['steps_per_sec']:>10.1f} {result['member_steps_per_sec']:>17.1f}"
+    )
+    peak_rss = result['peak_rss_bytes']
+    row += f" {peak_rss / 2**20:>8.1f}MB" if peak_rss is not None else f" {'n/a':>10}"
+    print(row)
+
+
+def print_volume_results_header():
+    print(f"{'n':>6} {'steps':>7} {'ms/step':>10} {'steps/sec':>10} {'fields':>10} {'peak RSS':>10}")
+
+
+def print_volume_results_row(result):
+    row = (
+        f"{result['n']:>6} {result['steps']:>7} {result['ms_per_step']:>10.3f} {result['steps_per_sec']:>10.1f} "
+        f"{result['field_bytes'] / 2**20:>8.1f}MB"
+    )
+    peak_rss = result['peak_rss_bytes']
+    row += f" {peak_rss / 2**20:>8.1f}MB" if peak_rss is not None else f" {'n/a':>10}"
+    print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times `Simulator.step` at several grid sizes, headless.")
+    parser.add_argument("sizes", nargs="*", type=int, default=DEFAULT_GRID_SIZES,
+                        help="grid sizes (n) to benchmark")
+    parser.add_argument("--steps", type=int, default=None,
+                        help="number of steps to time per grid size (default: run for --min-duration)")
+    parser.add_argument("--min-duration", type=float, default=1.0,
+                        help="approximate number of seconds spent timing each grid size")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="number of threads used by the parallel loops")
+    parser.add_argument("--relaxation", default=simulator.RELAXATION_GAUSS_SEIDEL,
+                        choices=sorted(simulator.relaxation_order_codes),
+                        help="relaxation order used by `diffuse` and `project`")
+    parser.add_argument("--pressure-solver", default=simulator.PRESSURE_SOLVER_RELAXATION,
+                        choices=sorted(simulator.pressure_solver_codes),
+                        help="linear solver used by `project`")
+    parser.add_argument("--relaxation-block-depth", type=int, default=1,
+                        help="relaxation sweeps fused per pass over the grid (temporal blocking; 1 => off)")
+    parser.add_argument("--compare-blocking", action="store_true",
+                        help="instead of timing one depth, compare diffuse bandwidth at depth 1 and at "
+                             f"--relaxation-block-depth (or {DEFAULT_COMPARISON_BLOCK_DEPTH} if that is 1)")
+    parser.add_argument("--precision", default=simulator.PRECISION_SINGLE, choices=list(simulator.precision_codes),
+                        help="the type of the grid's values (see `Simulator.precision`)")
+    parser.add_argument("--compare-precision", action="store_true",
+                        help="instead of timing one precision, compare throughput and drift across all of them")
+    parser.add_argument("--fused", action="store_true",
+                        help="step with the fused kernels (see `Simulator.fused_step`)")
+    parser.add_argument("--check-fused", action="store_true",
+                        help="instead of timing, check that the fused kernels match the staged ones at each size")
+    parser.add_argument("--active-tiles", action="store_true",
+                        help="restrict steps to the grid's active tiles (see `Simulator.active_tiles`)")
+    parser.add_argument("--compare-active-tiles", action="store_true",
+                        help="instead of timing one setting, compare speed and error with and without active tiles")
+    parser.add_argument("--advection", default=simulator.ADVECTION_SEMI_LAGRANGIAN,
+                        choices=list(simulator.advection_scheme_codes),
+                        help="the scheme `advect` moves fields with (see `Simulator.advection_scheme`)")
+    parser.add_argument("--compare-advection", action="store_true",
+                        help="instead of timing one scheme, compare cost and detail retention across all of them")
+    parser.add_argument("--batch", type=int, default=None,
+                        help="step this many grids of each size together, as one `BatchSimulator`")
+    parser.add_argument("--ny", type=int, default=None,
+                        help="time rectangular grids of `ny` cells along y, and each size's `n` along x")
+    parser.add_argument("--obstacles", action="store_true",
+                        help="place a solid cylinder in the fluid's path (see `Simulator.set_obstacles`)")
+    parser.add_argument("--3d", dest="volume", action="store_true",
+                        help="time `Simulator3D` on n^3 grids instead (only --threads and --relaxation apply)")
+    parser.add_argument("--json", action="store_true",
+                        help="print results as a JSON document instead of a table")
+    args = parser.parse_args()
+    if args.volume and (
+            args.check_fused or args.compare_precision or args.compare_active_tiles or args.compare_advection or
+            args.compare_blocking or args.batch or args.ny is not None or args.obstacles
+    ):
+        parser.error("--3d only applies to plain timing runs")
+    if args.ny is not None and (
+            args.check_fused or args.compare_precision or args.compare_active_tiles or args.compare_advection or
+            args.compare_blocking or args.batch
+    ):
+        parser.error("--ny only applies to plain timing runs")
+    if args.obstacles and (args.batch or args.compare_advection or args.compare_blocking):
+        parser.error("--obstacles does not apply to --batch, --compare-advection or --compare-blocking runs")
+
+    sim_options = {
+        'thread_count': args.threads,
+        'relaxation': args.relaxation,
+        'pressure_solver': args.pressure_solver,
+        'relaxation_block_depth': args.relaxation_block_depth,
+        'fused_step': args.fused,
+        'active_tiles': args.active_tiles,
+        'precision': args.precision,
+        'obstacles': args.obstacles,
+        'advection_scheme': args.advection,
+    }
+
+    if args.check_fused:
+        for n in args.sizes:
+            result = check_fused_equivalence(n, sim_options=sim_options)
+            print(json.dumps(result) if args.json else
+                  f"n={n}: max |staged - fused| = {result['max_abs_difference']:.3g}, "
+                  f"same solve stats: {result['same_solve_stats']}")
+        return
+
+    if args.compare_precision:
+        # every precision runs the same number of steps, so that their drifts compare:
+        run_bench = lambda n: compare_precisions(n, args.steps or 100, sim_options)
+        print_header, print_row = print_precision_results_header, print_precision_results_rows
+    elif args.compare_blocking:
+        block_depth = args.relaxation_block_depth if args.relaxation_block_depth > 1 else DEFAULT_COMPARISON_BLOCK_DEPTH
+        run_bench = lambda n: compare_blocking(n, block_depth, args.steps, args.min_duration, sim_options)
+        print_header, print_row = print_blocking_results_header, print_blocking_results_rows
+    elif args.compare_active_tiles:
+        run_bench = lambda n: compare_active_tiles(n, args.steps or 50, sim_options)
+        print_header, print_row = print_active_tile_results_header, print_active_tile_results_rows
+    elif args.compare_advection:
+        run_bench = lambda n: compare_advection_schemes(n, args.steps, sim_options)
+        print_header, print_row = print_advection_results_header, print_advection_results_rows
+    elif args.volume:
+        volume_options = {'thread_count': args.threads, 'relaxation': args.relaxation}
+        run_bench = lambda n: bench_volume(n, args.steps, args.min_duration, volume_options)
+        print_header, print_row = print_volume_results_header, print_volume_results_row
+    elif args.batch is None:
+        run_bench = lambda n: bench_grid_size(n, args.steps, args.min_duration, sim_options, args.ny)
+        print_header, print_row = print_results_header, print_results_row
+    else:
+        run_bench = lambda n: bench_batch(n, args.batch, args.steps, args.min_duration, sim_options)
+        print_header, print_row = print_batch_results_header, print_batch_results_row
+
+    if not args.json:
+        print_header()
+
+    results = []
+    for n in args.sizes:
+        results.append(run_bench(n))
+        if not args.json:
+            # printing as we go, since large grids take a while:
+            print_row(results[-1])
+
+    if args.json:
+        report = {
+            'environment': describe_environment(),
+            'options': dict(sim_options, batch_size=args.batch, ny=args.ny, volume=args.volume),
+            'results': results,
+        }
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
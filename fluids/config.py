@@ -1,6 +1,271 @@
-# TODO: consider reading this file from a config file at top-scope.
-#   - this would allow us to tweak properties of the runtime
-#   - if we make this auto-reload, we can change sim properties without UI
+"""
+Runtime configuration: simulator settings read from a TOML or JSON file, which a running simulator can follow live.
+- a file holds any of `SETTING_TYPES`' settings as top-level keys; the others keep their `DEFAULT_CONFIG` values, e.g.
+      n = 128
+      precision = "mixed"
+      time_rate = 0.001
+      pressure_solver = "multigrid"
+      pressure_tolerance = 1e-4
+- `ConfigWatcher` polls the file's modification time on a background thread, and queues each new version that parses;
+  `ConfigWatcher.apply_pending` then applies it between two steps, so the step loop never touches the file system.
+- `n` and `precision` fix a simulator's grid, so changing them takes a new simulator (see `create_simulator`).
+"""
+
+import json
+import os
+import threading
+
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11 has no TOML parser built in: TOML files then need the `tomli` backport, but JSON files always work.
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+from . import presets
+from . import simulator
+
 
 updates_per_sec = 60.0
 dt = 1.0 / updates_per_sec
+
+# the type of each setting a config file may hold:
+SETTING_TYPES = {
+    'n': int,
+    'precision': str,
+    'thread_count': int,
+    'time_rate': float,
+    'diffusion': float,
+    'viscosity': float,
+    'relaxation': str,
+    'pressure_solver': str,
+    'pressure_max_iterations': int,
+    'pressure_tolerance': float,
+    'diffusion_max_iterations': int,
+    'diffusion_tolerance': float,
+    'advection_scheme': str,
+}
+
+# the settings fixed when a simulator is created:
+CONSTRUCTION_SETTING_NAMES = ('n', 'precision')
+
+# the settings `apply_config` sets on a running simulator, in this order:
+LIVE_SETTING_NAMES = tuple(name for name in SETTING_TYPES if name not in CONSTRUCTION_SETTING_NAMES)
+
+DEFAULT_CONFIG = {
+    'n': 32,
+    'precision': simulator.PRECISION_SINGLE,
+    'thread_count': 1,
+    'time_rate': presets.DEFAULT_TIME_RATE_VALUE,
+    'diffusion': float(presets.DEFAULT_DIFFUSION_VALUE),
+    'viscosity': float(presets.DEFAULT_VISCOSITY_VALUE),
+    'relaxation': simulator.RELAXATION_GAUSS_SEIDEL,
+    'pressure_solver': simulator.PRESSURE_SOLVER_RELAXATION,
+    'pressure_max_iterations': 20,
+    'pressure_tolerance': 1e-4,
+    'diffusion_max_iterations': 20,
+    'diffusion_tolerance': 0.0,
+    'advection_scheme': simulator.ADVECTION_SEMI_LAGRANGIAN,
+}
+
+
+def load_config(path):
+    """
+    Reads a config file: TOML if its name ends in '.toml', JSON otherwise.
+    :return: a dict holding every setting of `SETTING_TYPES`, defaulted from `DEFAULT_CONFIG`.
+    :raise ValueError: if the file does not parse, or holds unknown settings or values of the wrong type.
+    """
+
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError(f"cannot read {path}: TOML needs Python >= 3.11 or the `tomli` package")
+        with open(path, "rb") as config_file:
+            try:
+                settings = tomllib.load(config_file)
+            except tomllib.TOMLDecodeError as error:
+                raise ValueError(f"cannot parse {path}: {error}") from None
+    else:
+        with open(path, "r") as config_file:
+            try:
+                settings = json.load(config_file)
+            except json.JSONDecodeError as error:
+                raise ValueError(f"cannot parse {path}: {error}") from None
+
+    if not isinstance(settings, dict):
+        raise ValueError(f"{path} must hold a table of settings, got {type(settings).__name__}")
+    return validate_config(settings)
+
+
+def validate_config(settings):
+    """
+    :param settings: a dict mapping some of `SETTING_TYPES` to values
+    :return: a copy of `DEFAULT_CONFIG` updated with `settings`, with integer values of float settings made floats.
+    :raise ValueError: if `settings` holds unknown settings or values of the wrong type.
+    """
+
+    unknown_names = set(settings) - set(SETTING_TYPES)
+    if unknown_names:
+        raise ValueError(f"unknown settings {sorted(unknown_names)}: expected some of {list(SETTING_TYPES)}")
+
+    config = dict(DEFAULT_CONFIG)
+    for name, value in settings.items():
+        setting_type = SETTING_TYPES[name]
+        if setting_type is float and isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        if type(value) is not setting_type:
+            raise ValueError(f"setting {name!r} must be a {setting_type.__name__}, got {value!r}")
+        config[name] = value
+
+    return config
+
+
+def create_simulator(config, **kwargs):
+    """
+    Creates a simulator with every setting of a config.
+    :param config: a dict as returned by `load_config`
+    :param kwargs: other `Simulator` constructor arguments, e.g. `max_display_updates_per_sec`
+    :return: the new Simulator instance
+    """
+
+    sim = simulator.Simulator(
+        config['n'], init_diffusion=config['diffusion'], init_viscosity=config['viscosity'],
+        time_rate=config['time_rate'], precision=config['precision'], **kwargs
+    )
+    apply_config(sim, config)
+    return sim
+
+
+def apply_config(sim, config):
+    """
+    Sets every live setting of a config on a simulator; call it between steps.
+    Either every setting is applied, or, if the simulator rejects one, none is.
+    :param config: a dict as returned by `load_config`
+    :return: the names of the `CONSTRUCTION_SETTING_NAMES` whose value differs from the simulator's, which only take
+        effect in a new simulator (see `create_simulator`).
+    :raise ValueError: if the simulator rejects a setting's value.
+    """
+
+    # a config's `n` describes square grids: a rectangular simulator never matches it.
+    current_values = {'n': (sim.nx, sim.ny), 'precision': sim.precision}
+    config_values = {'n': (config['n'], config['n']), 'precision': config['precision']}
+    changed_names = [name for name in CONSTRUCTION_SETTING_NAMES if config_values[name] != current_values[name]]
+
+    previous_values = {name: getattr(sim, name) for name in LIVE_SETTING_NAMES}
+    try:
+        for name in LIVE_SETTING_NAMES:
+            if getattr(sim, name) != config[name]:
+                setattr(sim, name, config[name])
+    except ValueError:
+        for name, value in previous_values.items():
+            setattr(sim, name, value)
+        raise
+
+    return changed_names
+
+
+def file_signature(path):
+    """
+    :return: what `ConfigWatcher` compares to tell whether a file changed: its modification time and size, or `None`
+        if it does not exist.
+    """
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ConfigWatcher(object):
+    """
+    Follows a config file: each version of it that loads is queued, for `apply_pending` to apply between steps.
+    - `poll` checks the file once; `start` runs it every `poll_interval_sec` on a background thread.
+    - a version that fails to load or apply is skipped, and its error kept in `last_error`; the simulator keeps its
+      current settings, and the next version of the file is tried as usual.
+    """
+
+    def __init__(self, path, poll_interval_sec=0.5):
+        """
+        Loads the file's current version into `config`.
+        :raise ValueError: if the file does not load (see `load_config`).
+        """
+
+        self.path = path
+        self.poll_interval_sec = poll_interval_sec
+        self.signature = file_signature(path)
+        self.config = load_config(path)
+        self.last_error = None
+
+        self.lock = threading.Lock()
+        self.pending_config = None
+        self.poll_thread = None
+        self.stop_event = threading.Event()
+
+    def poll(self):
+        """
+        Queues the file's new version, if it changed since the last poll and loads.
+        :return: True if a new version was queued
+        """
+
+        signature = file_signature(self.path)
+        if signature is None or signature == self.signature:
+            return False
+        self.signature = signature
+
+        try:
+            config = load_config(self.path)
+        except (OSError, ValueError) as error:
+            self.last_error = error
+            return False
+
+        with self.lock:
+            self.pending_config = config
+        return True
+
+    def start(self):
+        if self.poll_thread is not None:
+            return
+        self.stop_event.clear()
+        self.poll_thread = threading.Thread(target=self.run_poll_loop, name="config-watcher", daemon=True)
+        self.poll_thread.start()
+
+    def stop(self):
+        if self.poll_thread is None:
+            return
+        self.stop_event.set()
+        self.poll_thread.join()
+        self.poll_thread = None
+
+    def run_poll_loop(self):
+        while not self.stop_event.wait(self.poll_interval_sec):
+            self.poll()
+
+    def apply_pending(self, sim):
+        """
+        Applies the last queued version of the file to `sim`, if any (see `apply_config`); call it between steps.
+        Without a queued version, this only takes a lock.
+        :return: the names of the settings that changed but need a new simulator (see `apply_config`).
+        """
+
+        with self.lock:
+            config, self.pending_config = self.pending_config, None
+        if config is None:
+            return []
+
+        try:
+            rebuild_names = apply_config(sim, config)
+        except ValueError as error:
+            self.last_error = error
+            return []
+
+        self.config = config
+        return rebuild_names
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
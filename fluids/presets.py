@@ -0,0 +1,122 @@
+"""
+Initial conditions shared by the demos and the parameter sweep: a centered square of fluid, optionally set in motion
+by one of several velocity-field presets (the ones offered by demo-4's menu).
+"""
+
+import math
+
+import numpy as np
+
+from . import simulator
+
+
+VELOCITY_FIELD_CODE_NONE = 'n'
+VELOCITY_FIELD_CODE_OUTFLOW = 'o'
+VELOCITY_FIELD_CODE_SPIRAL = 's'
+VELOCITY_FIELD_CODE_UP = 'u'
+VELOCITY_FIELD_CODE_DOWN = 'd'
+
+DEFAULT_VELOCITY_FIELD_CODE = VELOCITY_FIELD_CODE_NONE
+DEFAULT_VISCOSITY_VALUE = 1
+DEFAULT_DIFFUSION_VALUE = 1
+DEFAULT_TIME_RATE_VALUE = 0.001
+
+
+def create_sim(
+        sim_size,
+        viscosity_input=DEFAULT_VISCOSITY_VALUE,
+        diffusion_input=DEFAULT_DIFFUSION_VALUE,
+        time_rate_input=DEFAULT_TIME_RATE_VALUE,
+        velocity_field_code=DEFAULT_VELOCITY_FIELD_CODE
+):
+    sim = simulator.Simulator(
+        sim_size,
+        init_diffusion=diffusion_input,
+        init_viscosity=viscosity_input,
+        time_rate=time_rate_input
+
+    )
+    reset_sim(sim, velocity_field_code)
+    return sim
+
+
+def reset_sim(sim, velocity_field_code, clear_all=True):
+    # positioning 'the square':
+    square_density = 1.0
+    square_size = 8
+    size_x, size_y = sim.shape
+    square_x_offset = (size_x - square_size) // 2
+    square_y_offset = (size_y - square_size) // 2
+
+    # clearing simulation if requested:
+    if clear_all:
+        # wiping out everything currently in the sim cells: density and velocity tables.
+        sim.clear_density_and_velocity()
+
+        # re-adding a centered solid square of fluid with constant velocity
+        xs, ys = np.mgrid[
+            square_x_offset:square_size + square_x_offset,
+            square_y_offset:square_size + square_y_offset
+        ]
+        sim.add_density_at(xs, ys, square_density, immediate=True)
+
+    # FIXME: why is the velocity field only applied to the initial square?
+    #       - why not the whole state?
+    #       - must change bounds of the `np.mgrid` slices below: simple fix.
+
+    # applying the appropriate initial velocity field:
+    # - each field is computed over a whole block of cells at once, then added in a single call.
+    if velocity_field_code == VELOCITY_FIELD_CODE_OUTFLOW:
+        strength_factor = 1.0
+
+        xs, ys = np.mgrid[
+            square_x_offset:square_size + square_x_offset,
+            square_y_offset:square_size + square_y_offset
+        ]
+
+        # modulating velocity by Y-component
+        vx = strength_factor * (10 * (xs - (square_size/2 + square_x_offset)))
+        vy = strength_factor * (10 * (ys - (square_size/2 + square_y_offset)))
+        sim.add_velocity_at(xs, ys, vx, vy, immediate=True)
+
+    elif velocity_field_code == VELOCITY_FIELD_CODE_SPIRAL:
+        strength_factor = 0.05
+
+        xs, ys = np.mgrid[
+            int(square_x_offset/2):2*square_size + square_x_offset,
+            int(square_y_offset/2):2*square_size + square_y_offset
+        ]
+
+        x_diff = xs - (square_size//2 + square_x_offset)
+        y_diff = ys - (square_size//2 + square_y_offset)
+        theta = np.arctan(y_diff/(x_diff+.00001)) + np.where(x_diff > 0, 0, math.pi)
+
+        rad = np.sqrt(x_diff**2 + y_diff**2)
+
+        vx = 100*rad*(np.sin(theta))
+        vy = 100*rad*(np.cos(theta))
+
+        vx *= strength_factor
+        vy *= strength_factor
+
+        sim.add_velocity_at(xs, ys, vx, vy, immediate=True)
+
+    elif velocity_field_code == VELOCITY_FIELD_CODE_UP or velocity_field_code == VELOCITY_FIELD_CODE_DOWN:
+        strength_factor = 100.0
+
+        xs, ys = np.mgrid[0:square_size, 0:square_size]
+        vx = 0 * strength_factor
+        vy = -100 * strength_factor
+
+        if velocity_field_code == VELOCITY_FIELD_CODE_UP:
+            sim.add_velocity_at(xs, ys, vx, vy, immediate=True)
+        elif velocity_field_code == VELOCITY_FIELD_CODE_DOWN:
+            sim.add_velocity_at(xs, ys, vx, -vy, immediate=True)
+
+    elif velocity_field_code == VELOCITY_FIELD_CODE_NONE:
+        # do nothing.
+        pass
+
+    else:
+        print(f'Invalid velocity field code: {velocity_field_code}')
+        raise NotImplementedError("Invalid velocity field selected in menu.")
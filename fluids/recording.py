@@ -0,0 +1,509 @@
+#!/usr/bin/env python3.9
+
+"""
+Records simulation frames (density, vx, vy) to disk and replays them.
+
+File layout (all integers little-endian):
+- a 64-byte header: magic, format version, nx, ny, storage dtype, encoding flags, keyframe interval and dt.
+  - version 1 files held square grids, with n and size = n + 2 in place of nx and ny; they still load.
+- one chunk per frame: a 16-byte chunk header (payload length, chunk flags, step index), then the payload, padded to a
+  multiple of 16 bytes so that raw payloads can be viewed in place as float arrays.
+  - the payload is the three fields back to back, stored as float32 or (with `quantize`) float16.
+  - with `delta`, non-key frames store the bitwise XOR of their stored values against the previous frame's: slowly
+    changing fields then XOR to mostly-zero bits, which compress well, and decoding is exact.
+  - with `compress`, the (possibly delta-encoded) payload is zlib-compressed.
+- a footer: the offset of every chunk, then the index's offset, the frame count and an end marker.
+  A file whose recorder never closed (e.g. after a crash) has no footer; its index is then rebuilt by walking the chunks.
+
+The recorder appends through a memory map that grows by doubling, and the reader memory-maps the file, so neither
+holds more than a couple of frames in memory whatever the length of the run.
+
+Run with `python -m fluids.recording out.flrec` to record a headless run.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+FILE_MAGIC = b"FLUIDREC"
+FOOTER_MAGIC = b"FLRECEND"
+FORMAT_VERSION = 2
+
+HEADER_FORMAT = struct.Struct("<8sIIIIIId24x")
+CHUNK_HEADER_FORMAT = struct.Struct("<IIQ")
+FOOTER_FORMAT = struct.Struct("<QQ8s")
+CHUNK_ALIGNMENT = 16
+
+FIELD_NAMES = ('density', 'vx', 'vy')
+
+# storage dtypes, by the code written to the header:
+STORAGE_DTYPES = {
+    0: np.dtype(np.float32),
+    1: np.dtype(np.float16),
+}
+
+# the unsigned integer types whose bits are XOR-ed by delta encoding, by storage dtype size:
+DELTA_DTYPES = {
+    4: np.dtype(np.uint32),
+    2: np.dtype(np.uint16),
+}
+
+# header encoding flags:
+ENCODING_ZLIB = 0x1
+ENCODING_DELTA = 0x2
+
+# chunk flags:
+CHUNK_KEYFRAME = 0x1
+
+INITIAL_CAPACITY_BYTES = 1 << 20
+
+
+def aligned(byte_count):
+    return (byte_count + CHUNK_ALIGNMENT - 1) // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+
+
+class FrameRecorder(object):
+    """
+    Appends frames of a fixed-shape grid to a recording file.
+    - frames are written as they are appended; `close` (or leaving a `with` block) writes the index footer and trims
+      the file to its final length.
+    """
+
+    def __init__(self, path, n, dt=0.0, quantize=False, compress=True, delta=True, keyframe_interval=30,
+                 compression_level=1, ny=None):
+        """
+        :param path: the file to create (overwritten if it exists)
+        :param n: number of non-border cells per edge of the recorded grid, or along x only if `ny` is given
+        :param dt: the simulated time between frames, stored for replay
+        :param quantize: whether to store values as float16 (values beyond +/-65504 become infinite)
+        :param compress: whether to zlib-compress frames
+        :param delta: whether to store frames between keyframes as deltas against the previous frame
+        :param keyframe_interval: the number of frames between keyframes when `delta` is set; replay seeks decode at
+            most this many frames.
+        :param compression_level: the zlib level, from 1 (fastest) to 9 (smallest)
+        :param ny: number of non-border cells along y, for rectangular grids
+        """
+
+        self.nx = n
+        self.ny = n if ny is None else ny
+        self.shape = (self.nx + 2, self.ny + 2)
+        self.cell_count = self.shape[0] * self.shape[1]
+        self.storage_dtype = np.dtype(np.float16 if quantize else np.float32)
+        self.delta_dtype = DELTA_DTYPES[self.storage_dtype.itemsize]
+        self.compress = compress
+        self.delta = delta
+        self.keyframe_interval = max(keyframe_interval, 1)
+        self.compression_level = compression_level
+
+        self.frame_count = 0
+        self.chunk_offsets = []
+
+        # the stored (possibly quantized) values of the frame being encoded and of the previous one:
+        self.current = np.empty((len(FIELD_NAMES),) + self.shape, dtype=self.storage_dtype)
+        self.previous = np.empty_like(self.current)
+        self.encoded = np.empty_like(self.current)
+
+        encoding_flags = (ENCODING_ZLIB if compress else 0) | (ENCODING_DELTA if delta else 0)
+        dtype_code = next(code for code, dtype in STORAGE_DTYPES.items() if dtype == self.storage_dtype)
+        header = HEADER_FORMAT.pack(
+            FILE_MAGIC, FORMAT_VERSION, self.nx, self.ny, dtype_code, encoding_flags, self.keyframe_interval, dt
+        )
+
+        self.file = open(path, "w+b")
+        self.capacity = 0
+        self.map = None
+        self.grow(max(INITIAL_CAPACITY_BYTES, len(header)))
+        self.map[:len(header)] = header
+        self.write_offset = len(header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def for_simulator(cls, path, sim, **kwargs):
+        """
+        Creates a recorder shaped for `sim`'s grid; keyword arguments are forwarded to the constructor.
+        """
+        return cls(path, sim.nx, dt=sim.dt, ny=sim.ny, **kwargs)
+
+    def append_simulator(self, sim, step_index=None):
+        """
+        Appends `sim`'s current fields, read through its zero-copy views.
+        """
+        if step_index is None:
+            step_index = sim.last_step_stats['step_index']
+        self.append(sim.density_view(), sim.vx_view(), sim.vy_view(), step_index)
+
+    def append(self, density, vx, vy, step_index=None):
+        """
+        Appends one frame.
+        :param density: a (nx + 2, ny + 2) array indexed as [x, y]
+        :param vx: see `density`
+        :param vy: see `density`
+        :param step_index: the simulation step this frame was taken at; defaults to the frame's own index.
+        """
+
+        for field_index, field in enumerate((density, vx, vy)):
+            if np.shape(field) != self.shape:
+                raise ValueError(f"expected a {self.shape} field, got shape {np.shape(field)}")
+            np.copyto(self.current[field_index], field, casting='same_kind')
+
+        is_keyframe = not self.delta or self.frame_count % self.keyframe_interval == 0
+        if is_keyframe:
+            payload = self.current
+        else:
+            np.bitwise_xor(
+                self.current.view(self.delta_dtype), self.previous.view(self.delta_dtype),
+                out=self.encoded.view(self.delta_dtype)
+            )
+            payload = self.encoded
+        if self.compress:
+            payload = zlib.compress(payload, self.compression_level)
+        payload = memoryview(payload).cast('B')
+
+        chunk_flags = CHUNK_KEYFRAME if is_keyframe else 0
+        chunk_header = CHUNK_HEADER_FORMAT.pack(
+            len(payload), chunk_flags, self.frame_count if step_index is None else step_index
+        )
+        chunk_size = len(chunk_header) + aligned(len(payload))
+        if self.write_offset + chunk_size > self.capacity:
+            self.grow(max(2 * self.capacity, self.write_offset + chunk_size))
+
+        payload_offset = self.write_offset + len(chunk_header)
+        self.map[self.write_offset:payload_offset] = chunk_header
+        self.map[payload_offset:payload_offset + len(payload)] = payload
+        self.chunk_offsets.append(self.write_offset)
+        self.write_offset += chunk_size
+        self.frame_count += 1
+
+        self.current, self.previous = self.previous, self.current
+
+    def grow(self, capacity):
+        """
+        Extends the file to `capacity` bytes and remaps it.
+        - the extension reads as zeros, i.e. as a zero-length chunk, which marks the end of an unfinished recording.
+        """
+
+        if self.map is not None:
+            self.map.close()
+        self.file.truncate(capacity)
+        self.map = mmap.mmap(self.file.fileno(), capacity, access=mmap.ACCESS_WRITE)
+        self.capacity = capacity
+
+    def close(self):
+        """
+        Writes the index footer and trims the file. Closing twice is harmless.
+        """
+
+        if self.file is None:
+            return
+
+        self.map.flush()
+        self.map.close()
+        self.map = None
+
+        self.file.truncate(self.write_offset)
+        self.file.seek(self.write_offset)
+        self.file.write(np.asarray(self.chunk_offsets, dtype='<u8').tobytes())
+        self.file.write(FOOTER_FORMAT.pack(self.write_offset, self.frame_count, FOOTER_MAGIC))
+        self.file.close()
+        self.file = None
+
+
+class FrameReplay(object):
+    """
+    Random access to the frames of a recording, through a read-only memory map.
+    - `frame(i)` decodes frame `i`. Reading frames in order decodes each one once; seeking backwards or far ahead
+      decodes forward from the nearest keyframe.
+    - returned arrays alias internal buffers (or, for raw float32 recordings, the file itself): they stay valid only
+      until the next `frame` call, and are read-only.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.map) < HEADER_FORMAT.size:
+            raise ValueError(f"{path!r} is too short to be a recording")
+        (
+            magic, version, self.nx, self.ny, dtype_code, encoding_flags, self.keyframe_interval, self.dt
+        ) = HEADER_FORMAT.unpack_from(self.map, 0)
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path!r} is not a recording")
+        if version == 1:
+            # the header's (n, size) pair of a square grid:
+            self.ny = self.nx
+        elif version != FORMAT_VERSION:
+            raise ValueError(f"{path!r} has unsupported format version {version}")
+
+        self.shape = (self.nx + 2, self.ny + 2)
+        self.cell_count = self.shape[0] * self.shape[1]
+        self.storage_dtype = STORAGE_DTYPES[dtype_code]
+        self.delta_dtype = DELTA_DTYPES[self.storage_dtype.itemsize]
+        self.compress = bool(encoding_flags & ENCODING_ZLIB)
+        self.delta = bool(encoding_flags & ENCODING_DELTA)
+        self.frame_shape = (len(FIELD_NAMES),) + self.shape
+        self.raw_payload_size = len(FIELD_NAMES) * self.cell_count * self.storage_dtype.itemsize
+
+        self.chunk_offsets = self.read_index()
+
+        # the last decoded frame, as stored, and as float32 for callers:
+        self.decoded_index = None
+        self.decoded = np.empty(self.frame_shape, dtype=self.storage_dtype)
+        self.decoded_float32 = np.empty(self.frame_shape, dtype=np.float32)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.chunk_offsets)
+
+    @property
+    def size(self):
+        """
+        the number of cells per edge, borders included, of a square grid
+        :raise ValueError: for a rectangular grid, which has no single size (see `shape`)
+        """
+        if self.nx != self.ny:
+            raise ValueError(f"a {self.nx}x{self.ny} recording has no single size: use `shape` instead")
+        return self.shape[0]
+
+    @property
+    def frame_count(self):
+        return len(self.chunk_offsets)
+
+    def read_index(self):
+        """
+        :return: the offset of every chunk, from the footer if there is one, else by walking the chunks.
+        """
+
+        file_size = len(self.map)
+        if file_size >= HEADER_FORMAT.size + FOOTER_FORMAT.size:
+            index_offset, frame_count, magic = FOOTER_FORMAT.unpack_from(self.map, file_size - FOOTER_FORMAT.size)
+            if magic == FOOTER_MAGIC:
+                return np.frombuffer(self.map, dtype='<u8', count=frame_count, offset=index_offset).tolist()
+
+        chunk_offsets = []
+        offset = HEADER_FORMAT.size
+        while offset + CHUNK_HEADER_FORMAT.size <= file_size:
+            payload_size, chunk_flags, step_index = CHUNK_HEADER_FORMAT.unpack_from(self.map, offset)
+            chunk_end = offset + CHUNK_HEADER_FORMAT.size + payload_size
+            if payload_size == 0 or chunk_end > file_size:
+                break
+            chunk_offsets.append(offset)
+            offset = offset + CHUNK_HEADER_FORMAT.size + aligned(payload_size)
+        return chunk_offsets
+
+    def chunk(self, frame_index):
+        """
+        :return: (chunk flags, step index, payload memoryview) of a frame, without decoding it.
+        """
+
+        offset = self.chunk_offsets[frame_index]
+        payload_size, chunk_flags, step_index = CHUNK_HEADER_FORMAT.unpack_from(self.map, offset)
+        payload_offset = offset + CHUNK_HEADER_FORMAT.size
+        return chunk_flags, step_index, memoryview(self.map)[payload_offset:payload_offset + payload_size]
+
+    def step_index(self, frame_index):
+        return self.chunk(frame_index)[1]
+
+    def stored_frame(self, frame_index, payload):
+        """
+        :return: a frame's payload as a (3, nx + 2, ny + 2) array of stored values
+        """
+
+        if self.compress:
+            payload = zlib.decompress(payload)
+        return np.frombuffer(payload, dtype=self.storage_dtype, count=len(FIELD_NAMES) * self.cell_count)\
+            .reshape(self.frame_shape)
+
+    def frame(self, frame_index):
+        """
+        Decodes a frame.
+        :param frame_index: in [0, frame_count); negative indices count from the end.
+        :return: (density, vx, vy) as (nx + 2, ny + 2) float32 arrays indexed as [x, y].
+        """
+
+        if frame_index < 0:
+            frame_index += self.frame_count
+        if not 0 <= frame_index < self.frame_count:
+            raise IndexError(f"frame {frame_index} out of range for a recording of {self.frame_count} frames")
+
+        if self.delta:
+            # decoding forward from the nearest keyframe, or from the last decoded frame if that is closer:
+            keyframe_index = frame_index
+            while keyframe_index > 0 and not self.chunk(keyframe_index)[0] & CHUNK_KEYFRAME:
+                keyframe_index -= 1
+            if self.decoded_index is not None and keyframe_index <= self.decoded_index <= frame_index:
+                first_index = self.decoded_index + 1
+            else:
+                first_index = keyframe_index
+
+            for i in range(first_index, frame_index + 1):
+                chunk_flags, _, payload = self.chunk(i)
+                stored = self.stored_frame(i, payload)
+                if chunk_flags & CHUNK_KEYFRAME:
+                    np.copyto(self.decoded, stored)
+                else:
+                    np.bitwise_xor(
+                        self.decoded.view(self.delta_dtype), stored.view(self.delta_dtype),
+                        out=self.decoded.view(self.delta_dtype)
+                    )
+            self.decoded_index = frame_index
+            stored = self.decoded
+        else:
+            stored = self.stored_frame(frame_index, self.chunk(frame_index)[2])
+
+        if stored.dtype == np.float32:
+            fields = stored
+        else:
+            np.copyto(self.decoded_float32, stored)
+            fields = self.decoded_float32
+        fields = fields.view()
+        fields.flags.writeable = False
+        return fields[0], fields[1], fields[2]
+
+    def close(self):
+        if self.map is not None:
+            # frames of raw recordings may still alias the map: rather than closing it under them, it is dropped, and
+            # unmapped once the last of them is gone.
+            self.map = None
+            self.file.close()
+            self.file = None
+
+
+class ReplaySimulator(object):
+    """
+    Plays a recording back through the read-only part of the `Simulator` interface (`size`, `shape`, `ix`, `*_view`,
+    `dump_*_array`, `step`), so renderers written for a live simulation can draw it without re-simulating.
+    - each `step` advances to the next frame; at the end, playback loops to the start if `loop` is set, else holds the
+      last frame.
+    """
+
+    def __init__(self, replay, loop=True):
+        self.replay = replay
+        self.loop = loop
+        self.frame_index = 0
+        self.fields = replay.frame(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
+
+    @classmethod
+    def open(cls, path, loop=True):
+        return cls(FrameReplay(path), loop)
+
+    def dispose(self):
+        self.fields = None
+        self.replay.close()
+
+    @property
+    def size(self):
+        return self.replay.size
+
+    @property
+    def nx(self):
+        return self.replay.nx
+
+    @property
+    def ny(self):
+        return self.replay.ny
+
+    @property
+    def shape(self):
+        return self.replay.shape
+
+    @property
+    def cell_count(self):
+        return self.replay.cell_count
+
+    @property
+    def dt(self):
+        return self.replay.dt
+
+    def ix(self, x, y):
+        return x * self.shape[1] + y
+
+    def step(self):
+        next_index = self.frame_index + 1
+        if next_index >= self.replay.frame_count:
+            next_index = 0 if self.loop else self.frame_index
+        self.seek(next_index)
+
+    def seek(self, frame_index):
+        self.fields = self.replay.frame(frame_index)
+        self.frame_index = frame_index if frame_index >= 0 else frame_index + self.replay.frame_count
+
+    @property
+    def last_step_stats(self):
+        return {'step_index': self.replay.step_index(self.frame_index)}
+
+    def density_view(self):
+        return self.fields[0]
+
+    def vx_view(self):
+        return self.fields[1]
+
+    def vy_view(self):
+        return self.fields[2]
+
+    def dump_density_array(self):
+        return self.density_view().flatten()
+
+    def dump_vx_array(self):
+        return self.vx_view().flatten()
+
+    def dump_vy_array(self):
+        return self.vy_view().flatten()
+
+    def dump_velocity_array(self):
+        return np.stack((self.dump_vx_array(), self.dump_vy_array()), axis=-1)
+
+
+def main():
+    from . import bench
+
+    parser = argparse.ArgumentParser(description="Records a headless simulation run.")
+    parser.add_argument("path", help="the recording file to write")
+    parser.add_argument("--n", type=int, default=128, help="number of non-border cells per edge")
+    parser.add_argument("--steps", type=int, default=600, help="number of steps to record")
+    parser.add_argument("--quantize", action="store_true", help="store values as float16")
+    parser.add_argument("--no-compress", action="store_true", help="do not zlib-compress frames")
+    parser.add_argument("--no-delta", action="store_true", help="store every frame whole")
+    parser.add_argument("--keyframe-interval", type=int, default=30, help="frames between keyframes")
+    args = parser.parse_args()
+
+    sim = bench.create_bench_sim(args.n)
+    recorder_options = {
+        'quantize': args.quantize,
+        'compress': not args.no_compress,
+        'delta': not args.no_delta,
+        'keyframe_interval': args.keyframe_interval,
+    }
+    with FrameRecorder.for_simulator(args.path, sim, **recorder_options) as recorder:
+        recorder.append_simulator(sim, step_index=0)
+        for i in range(args.steps):
+            sim.step()
+            recorder.append_simulator(sim)
+    sim.dispose()
+
+    raw_size = (args.steps + 1) * len(FIELD_NAMES) * (args.n + 2) ** 2 * np.dtype(np.float32).itemsize
+    file_size = os.path.getsize(args.path)
+    print(f"recorded {args.steps + 1} frames: {file_size / 2**20:.2f}MB ({file_size / raw_size:.1%} of raw float32)")
+
+
+if __name__ == "__main__":
+    main()
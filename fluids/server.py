@@ -0,0 +1,372 @@
+#!/usr/bin/env python3.9
+
+"""
+Streams a headless simulation to remote viewers over TCP on localhost, and takes source-injection commands back.
+
+Protocol (all integers little-endian):
+- the server sends messages, each a 28-byte header (see `MESSAGE_HEADER_FORMAT`: magic, message type, flags, step
+  index, size_x, size_y, payload length) followed by the payload.
+  - `MESSAGE_FRAME`: the density field, quantized to uint8 over [0, density_scale] and laid out as the
+    (size_x, size_y) array of `Simulator.density_view`, borders included.
+    - with `FRAME_DELTA`, the payload is the bitwise XOR of the frame against the last frame sent to the same client,
+      which a client decodes exactly; with `FRAME_ZLIB`, the payload is zlib-compressed. `FRAME_KEYFRAME` marks frames
+      that decode on their own.
+  - `MESSAGE_ERROR`: a UTF-8 description of a command that was rejected.
+- a client sends commands, one JSON object per line, e.g.
+      {"cmd": "add_density", "x": 32, "y": 40, "amount": 50.0}
+      {"cmd": "add_velocity", "x": [31, 32], "y": [40, 40], "vx": 0.0, "vy": 20.0}
+      {"cmd": "encoding", "delta": false}
+  `x`, `y` and the amounts take scalars or lists, as `Simulator.add_density_at` does; sources apply to the next step,
+  unless `"immediate": true`. `encoding` switches the connection's frames between delta-encoded and whole.
+- the simulation never waits for a viewer: each client holds at most one pending frame, which a newer frame replaces
+  while the client's socket is still draining the previous one. Slow viewers thus drop frames, and delta frames are
+  always taken against the frame that client last received.
+Run with `python -m fluids.server --n 128` once the extension module is built; `FrameDecoder` decodes frames.
+"""
+
+import argparse
+import asyncio
+import json
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from . import presets
+
+MESSAGE_MAGIC = b"FLFR"
+MESSAGE_HEADER_FORMAT = struct.Struct("<4sBBxxQIII")
+
+# message types:
+MESSAGE_FRAME = 0
+MESSAGE_ERROR = 1
+
+# frame flags:
+FRAME_KEYFRAME = 0x1
+FRAME_DELTA = 0x2
+FRAME_ZLIB = 0x4
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# the most wall-clock time the step loop tries to catch up on, as `app.max_catch_up_sec`:
+max_catch_up_sec = 0.25
+
+# the longest command line a client may send, in bytes:
+max_command_bytes = 1 << 20
+
+
+class FrameServer(object):
+    """
+    Steps a simulator at a fixed rate and streams its density to every connected client (see the module's protocol).
+    - steps run on a worker thread (the kernel releases the GIL), so the event loop keeps serving clients meanwhile.
+    - commands are queued as they arrive and applied between two steps, so they never race a step.
+    """
+
+    def __init__(self, sim, host=DEFAULT_HOST, port=DEFAULT_PORT, steps_per_sec=60.0, frame_interval=1,
+                 density_scale=1.0, delta=True, keyframe_interval=30, compression_level=1):
+        """
+        :param sim: the simulator to step
+        :param host: the address to listen on; the default accepts local connections only
+        :param port: the port to listen on, or 0 to pick a free one (see `port` once started)
+        :param steps_per_sec: the simulation's pace, or `None` to step as fast as possible
+        :param frame_interval: the number of steps between two published frames
+        :param density_scale: the density quantized to 255; densities beyond it saturate
+        :param delta: whether new connections receive delta-encoded frames (see the `encoding` command)
+        :param keyframe_interval: the number of frames between keyframes sent to a delta-encoding client
+        :param compression_level: the zlib level of delta-encoded frames, from 1 (fastest) to 9 (smallest)
+        """
+
+        self.sim = sim
+        self.host = host
+        self.port = port
+        self.step_interval = None if steps_per_sec is None else 1.0 / steps_per_sec
+        self.frame_interval = max(frame_interval, 1)
+        self.density_scale = density_scale
+        self.delta = delta
+        self.keyframe_interval = max(keyframe_interval, 1)
+        self.compression_level = compression_level
+
+        self.step_count = 0
+        self.clients = set()
+        self.client_tasks = set()
+        self.pending_commands = []
+        self.server = None
+
+        # the quantization's scratch space, reused by every frame:
+        self.scaled_density = np.empty(sim.shape, dtype=np.float32)
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle_client, self.host, self.port, limit=max_command_bytes
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for client in list(self.clients):
+            client.close()
+        # closed connections read as EOF, which ends their handlers:
+        await asyncio.gather(*self.client_tasks, return_exceptions=True)
+
+    async def run(self, step_count=None):
+        """
+        Steps the simulator, publishing a frame every `frame_interval` steps, until cancelled or `step_count` steps ran.
+        """
+
+        next_step_time = time.perf_counter()
+        steps_left = step_count
+        while steps_left is None or steps_left > 0:
+            if steps_left is not None:
+                steps_left -= 1
+            self.apply_pending_commands()
+            await asyncio.to_thread(self.sim.step)
+            self.step_count += 1
+            if self.step_count % self.frame_interval == 0:
+                self.publish_frame()
+
+            if self.step_interval is None:
+                # yielding to the clients' tasks between steps:
+                await asyncio.sleep(0)
+                continue
+            next_step_time = max(next_step_time + self.step_interval, time.perf_counter() - max_catch_up_sec)
+            await asyncio.sleep(max(next_step_time - time.perf_counter(), 0.0))
+
+    def publish_frame(self):
+        """
+        Quantizes the density once, and hands the frame to every client, replacing any frame it has yet to send.
+        """
+
+        if not self.clients:
+            return
+        np.multiply(self.sim.density_view(), 255.0 / self.density_scale, out=self.scaled_density)
+        np.clip(self.scaled_density, 0.0, 255.0, out=self.scaled_density)
+        frame = self.scaled_density.astype(np.uint8)
+        for client in self.clients:
+            client.offer_frame(self.step_count, frame)
+
+    def apply_pending_commands(self):
+        commands, self.pending_commands = self.pending_commands, []
+        for client, command in commands:
+            try:
+                apply_command(self.sim, command)
+            except (KeyError, TypeError, ValueError, IndexError) as error:
+                client.send_error(f"rejected {command!r}: {error}")
+
+    async def handle_client(self, reader, writer):
+        client = ClientConnection(self, writer)
+        self.clients.add(client)
+        self.client_tasks.add(asyncio.current_task())
+        sender = asyncio.create_task(client.send_frames())
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    # a reset connection, or a command line beyond `max_command_bytes`:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    command = json.loads(line)
+                    if not isinstance(command, dict):
+                        raise ValueError("a command must be a JSON object")
+                except ValueError as error:
+                    client.send_error(f"unreadable command: {error}")
+                    continue
+
+                if command.get('cmd') == 'encoding':
+                    client.delta = bool(command.get('delta', self.delta))
+                    client.previous_frame = None
+                else:
+                    self.pending_commands.append((client, command))
+        finally:
+            self.clients.discard(client)
+            self.client_tasks.discard(asyncio.current_task())
+            sender.cancel()
+            client.close()
+
+
+class ClientConnection(object):
+    """
+    One viewer: a one-frame mailbox, drained by `send_frames` as fast as the client's socket accepts data.
+    """
+
+    def __init__(self, server, writer):
+        self.server = server
+        self.writer = writer
+        self.delta = server.delta
+
+        # the newest frame not yet sent, if any, as (step index, uint8 array):
+        self.pending_frame = None
+        self.frame_ready = asyncio.Event()
+
+        # the last frame sent, which the next delta frame is taken against:
+        self.previous_frame = None
+        self.frames_since_keyframe = 0
+
+        self.sent_frame_count = 0
+        self.dropped_frame_count = 0
+
+    def offer_frame(self, step_index, frame):
+        if self.pending_frame is not None:
+            self.dropped_frame_count += 1
+        self.pending_frame = (step_index, frame)
+        self.frame_ready.set()
+
+    async def send_frames(self):
+        try:
+            while True:
+                await self.frame_ready.wait()
+                self.frame_ready.clear()
+                step_index, frame = self.pending_frame
+                self.pending_frame = None
+
+                self.writer.write(self.encode_frame(step_index, frame))
+                # while this waits on a slow client, newer frames replace `pending_frame` rather than queue up:
+                await self.writer.drain()
+                self.sent_frame_count += 1
+        except ConnectionError:
+            self.close()
+
+    def encode_frame(self, step_index, frame):
+        size_x, size_y = frame.shape
+        if not self.delta:
+            flags = FRAME_KEYFRAME
+            payload = frame.tobytes()
+        else:
+            is_keyframe = self.previous_frame is None or self.frames_since_keyframe >= self.server.keyframe_interval - 1
+            if is_keyframe:
+                flags = FRAME_KEYFRAME | FRAME_ZLIB
+                payload = frame
+                self.frames_since_keyframe = 0
+            else:
+                flags = FRAME_DELTA | FRAME_ZLIB
+                payload = np.bitwise_xor(frame, self.previous_frame)
+                self.frames_since_keyframe += 1
+            payload = zlib.compress(payload.tobytes(), self.server.compression_level)
+            self.previous_frame = frame
+
+        header = MESSAGE_HEADER_FORMAT.pack(
+            MESSAGE_MAGIC, MESSAGE_FRAME, flags, step_index, size_x, size_y, len(payload)
+        )
+        return header + payload
+
+    def send_error(self, description):
+        payload = description.encode()
+        # errors are rare and small: they skip the backpressure of frames, and go out ahead of the next one.
+        self.writer.write(MESSAGE_HEADER_FORMAT.pack(MESSAGE_MAGIC, MESSAGE_ERROR, 0, 0, 0, 0, len(payload)) + payload)
+
+    def close(self):
+        self.writer.close()
+
+
+def apply_command(sim, command):
+    """
+    Applies one client command (see the module's protocol) to a simulator.
+    :raise KeyError, TypeError, ValueError, IndexError: if the command is malformed or targets cells off the grid.
+    """
+
+    name = command['cmd']
+    xs = np.atleast_1d(command['x'])
+    ys = np.atleast_1d(command['y'])
+    immediate = bool(command.get('immediate', False))
+    if name == 'add_density':
+        sim.add_density_at(xs, ys, command['amount'], immediate=immediate)
+    elif name == 'add_velocity':
+        sim.add_velocity_at(xs, ys, command.get('vx', 0.0), command.get('vy', 0.0), immediate=immediate)
+    else:
+        raise ValueError(f"unknown command: {name!r}")
+
+
+class FrameDecoder(object):
+    """
+    Rebuilds one client's frames from the messages it receives.
+    """
+
+    def __init__(self):
+        self.frame = None
+
+    def decode(self, flags, size_x, size_y, payload):
+        """
+        :return: the frame, as a (size_x, size_y) uint8 array that later frames overwrite; copy it to keep it.
+        :raise ValueError: for a delta frame that does not follow a frame of the same shape
+        """
+
+        if flags & FRAME_ZLIB:
+            payload = zlib.decompress(payload)
+        values = np.frombuffer(payload, dtype=np.uint8).reshape(size_x, size_y)
+
+        if flags & FRAME_DELTA:
+            if self.frame is None or self.frame.shape != values.shape:
+                raise ValueError("received a delta frame before its keyframe")
+            np.bitwise_xor(self.frame, values, out=self.frame)
+        else:
+            self.frame = values.copy()
+        return self.frame
+
+
+async def read_message(reader):
+    """
+    Reads one server message from a client's stream.
+    :return: (message type, flags, step index, size_x, size_y, payload)
+    :raise asyncio.IncompleteReadError: if the connection closes mid-message
+    """
+
+    header = await reader.readexactly(MESSAGE_HEADER_FORMAT.size)
+    magic, message_type, flags, step_index, size_x, size_y, payload_length = MESSAGE_HEADER_FORMAT.unpack(header)
+    if magic != MESSAGE_MAGIC:
+        raise ValueError(f"not a frame server message: {magic!r}")
+    payload = await reader.readexactly(payload_length)
+    return message_type, flags, step_index, size_x, size_y, payload
+
+
+async def serve(sim, step_count=None, **server_options):
+    """
+    Runs a `FrameServer` until cancelled (e.g. by Ctrl-C) or `step_count` steps ran.
+    :param server_options: see `FrameServer`
+    """
+
+    server = FrameServer(sim, **server_options)
+    await server.start()
+    print(f"streaming a {sim.nx}x{sim.ny} grid on {server.host}:{server.port}")
+    try:
+        await server.run(step_count)
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streams a headless simulation to viewers over TCP.")
+    parser.add_argument("--n", type=int, default=128, help="number of non-border cells per edge")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="the address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="the port to listen on")
+    parser.add_argument("--steps-per-sec", type=float, default=60.0,
+                        help="the simulation's pace (0 => as fast as possible)")
+    parser.add_argument("--frame-interval", type=int, default=1, help="steps between two published frames")
+    parser.add_argument("--density-scale", type=float, default=1.0, help="the density shown at full intensity")
+    parser.add_argument("--no-delta", action="store_true", help="send every frame whole by default")
+    parser.add_argument("--threads", type=int, default=1, help="number of threads used by the parallel loops")
+    args = parser.parse_args()
+
+    sim = presets.create_sim(args.n)
+    sim.thread_count = args.threads
+    try:
+        asyncio.run(serve(
+            sim, host=args.host, port=args.port, steps_per_sec=args.steps_per_sec or None,
+            frame_interval=args.frame_interval, density_scale=args.density_scale, delta=not args.no_delta
+        ))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.dispose()
+
+
+if __name__ == "__main__":
+    main()
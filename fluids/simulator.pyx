@@ -1,3 +1,5 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True, initializedcheck=False
+
 """
 Implements this module as a 'kernel' that can be used by the rest of the
 application.
@@ -7,10 +9,27 @@ import ctypes
 from typing import *
 from ctypes import *
 
+import os
+import struct
+
 import numpy as np
 
+from cython.parallel cimport prange
 from libc.stdlib cimport malloc, calloc, free
-from libc.string cimport memset
+from libc.string cimport memset, memcpy
+from libc.math cimport sqrt, INFINITY
+from posix.time cimport clock_gettime, timespec, CLOCK_MONOTONIC
+
+
+# the value types the solver kernels are compiled for (see `Simulator.precision`): `real` types a grid's fields, and
+# `pressure_real` its pressure solve, which may be wider.
+ctypedef fused real:
+    float
+    double
+
+ctypedef fused pressure_real:
+    float
+    double
 
 
 #
@@ -20,53 +39,268 @@ from libc.string cimport memset
 #
 
 
-cdef FluidGrid* singleton_fg = NULL;
+# relaxation orders accepted by `Simulator.relaxation`:
+# - 'gauss-seidel' sweeps cells in lexicographic order, which is inherently serial.
+# - 'red-black' updates a checkerboard's red cells, then its black cells; each half-sweep runs across `thread_count`
+#   threads.
+RELAXATION_GAUSS_SEIDEL = "gauss-seidel"
+RELAXATION_RED_BLACK = "red-black"
+
+relaxation_order_codes = {
+    RELAXATION_GAUSS_SEIDEL: RELAXATION_ORDER_LEXICOGRAPHIC,
+    RELAXATION_RED_BLACK: RELAXATION_ORDER_RED_BLACK,
+}
+
+# pressure solvers accepted by `Simulator.pressure_solver`:
+# - 'relaxation' runs `pressure_max_iterations` sweeps in the `relaxation` order (Stam's original scheme).
+# - 'multigrid' runs geometric multigrid V-cycles until the residual drops below `pressure_tolerance`.
+# - 'conjugate-gradient' runs Jacobi-preconditioned conjugate gradient iterations, with the same stopping rule.
+PRESSURE_SOLVER_RELAXATION = "relaxation"
+PRESSURE_SOLVER_MULTIGRID = "multigrid"
+PRESSURE_SOLVER_CONJUGATE_GRADIENT = "conjugate-gradient"
+
+pressure_solver_codes = {
+    PRESSURE_SOLVER_RELAXATION: PRESSURE_SOLVER_CODE_RELAXATION,
+    PRESSURE_SOLVER_MULTIGRID: PRESSURE_SOLVER_CODE_MULTIGRID,
+    PRESSURE_SOLVER_CONJUGATE_GRADIENT: PRESSURE_SOLVER_CODE_CONJUGATE_GRADIENT,
+}
+
+# field precisions accepted by `Simulator(precision=...)`:
+# - 'single' stores and solves everything in float32, the fastest.
+# - 'double' stores and solves everything in float64, e.g. for validation runs; field views are then float64.
+# - 'mixed' stores the fields in float32, but solves for pressure (divergence, residuals and all) in float64.
+PRECISION_SINGLE = "single"
+PRECISION_DOUBLE = "double"
+PRECISION_MIXED = "mixed"
+
+precision_codes = {
+    PRECISION_SINGLE: PRECISION_CODE_SINGLE,
+    PRECISION_DOUBLE: PRECISION_CODE_DOUBLE,
+    PRECISION_MIXED: PRECISION_CODE_MIXED,
+}
+
+# wall conditions at obstacles (see `Simulator.set_obstacles`) accepted by `Simulator.obstacle_slip`:
+# - 'no-slip' makes fluid stick to obstacles: both velocity components vanish at their walls.
+# - 'free-slip' lets fluid slide along them: only the component normal to a wall vanishes, as at the grid's border.
+OBSTACLE_SLIP_NO_SLIP = "no-slip"
+OBSTACLE_SLIP_FREE_SLIP = "free-slip"
+
+obstacle_slip_codes = {
+    OBSTACLE_SLIP_NO_SLIP: OBSTACLE_SLIP_CODE_NO_SLIP,
+    OBSTACLE_SLIP_FREE_SLIP: OBSTACLE_SLIP_CODE_FREE_SLIP,
+}
+
+# advection schemes accepted by `Simulator.advection_scheme`:
+# - 'semi-lagrangian' traces each cell back along the velocity and interpolates there bilinearly (Stam's original
+#   scheme): one pass per field, but each pass smooths the field a little more.
+# - 'maccormack' advects the result back again to estimate the scheme's error, and corrects by half of it: 3 passes.
+# - 'bfecc' (back and forth error compensation and correction) corrects the field before advecting it again: 4 passes.
+# both corrected schemes clamp each cell to the values its back-trace interpolated between, so they create no new
+# extrema and stay as stable as the semi-Lagrangian scheme.
+ADVECTION_SEMI_LAGRANGIAN = "semi-lagrangian"
+ADVECTION_MACCORMACK = "maccormack"
+ADVECTION_BFECC = "bfecc"
+
+advection_scheme_codes = {
+    ADVECTION_SEMI_LAGRANGIAN: ADVECTION_SCHEME_CODE_SEMI_LAGRANGIAN,
+    ADVECTION_MACCORMACK: ADVECTION_SCHEME_CODE_MACCORMACK,
+    ADVECTION_BFECC: ADVECTION_SCHEME_CODE_BFECC,
+}
+
+# the stages a tick runs, one after the other:
+PIPELINE_STAGE_NAMES = (
+    'add_source',
+    'diffuse',
+    'project',
+    'advect',
+)
+
+# the stages timed by `Simulator.stage_times` and the profiler (see `Simulator.profiling`), in `TimedStage` order:
+# - 'boundary' covers every pass setting border cells, all of which run within one of the pipeline stages.
+# - 'step' covers whole ticks.
+TIMED_STAGE_NAMES = PIPELINE_STAGE_NAMES + (
+    'boundary',
+    'step',
+)
+
+cdef enum TimedStage:
+    TIMED_STAGE_ADD_SOURCE
+    TIMED_STAGE_DIFFUSE
+    TIMED_STAGE_PROJECT
+    TIMED_STAGE_ADVECT
+    TIMED_STAGE_BOUNDARY
+    TIMED_STAGE_STEP
+    TIMED_STAGE_COUNT
+
+# the profiler's histograms bin durations by powers of 2: bin k counts the ticks that spent [2^k, 2^(k+1)) ns in a
+# stage, except that bin 0 starts at 0 and the last bin has no upper bound.
+cdef enum:
+    PROFILE_BIN_COUNT = 40
+
+PROFILE_BIN_EDGES_SEC = np.array([0.0] + [2.0**k / 1e9 for k in range(1, PROFILE_BIN_COUNT)] + [np.inf])
+
+# the number of ticks the profiler keeps by default, i.e. 4 seconds of simulation at 60 steps/sec:
+DEFAULT_PROFILE_WINDOW = 240
+
+# the most sweeps `Simulator.relaxation_block_depth` may fuse into one pass over the grid:
+cdef enum:
+    MAX_RELAXATION_BLOCK_DEPTH = 16
+
+# the linear solves reported by `Simulator.last_step_stats`, in the order a tick runs them:
+STEP_STAGE_NAMES = (
+    'diffuse_vx',
+    'diffuse_vy',
+    'project_diffused',
+    'project_advected',
+    'diffuse_density',
+)
 
 
 class Simulator(object):
-    def __init__(self, n: int, init_diffusion, init_viscosity, max_display_updates_per_sec=60.0, time_rate=1.0):
-        global singleton_fg
-
-        assert singleton_fg == NULL
+    def __init__(self, n: int, init_diffusion, init_viscosity, max_display_updates_per_sec=60.0, time_rate=1.0,
+                 thread_count=1, relaxation=RELAXATION_GAUSS_SEIDEL, pressure_solver=PRESSURE_SOLVER_RELAXATION,
+                 precision=PRECISION_SINGLE, ny=None):
+        """
+        :param n: the number of non-border cells per edge, or along x only if `ny` is given
+        :param ny: the number of non-border cells along y, for rectangular grids (see `shape`)
+        """
+        try:
+            precision_code = precision_codes[precision]
+        except KeyError:
+            raise ValueError(f"unknown precision: {precision!r}") from None
 
         self.max_display_updates_per_sec = max_display_updates_per_sec
         self.internal_time_rate = time_rate
-        singleton_fg = new_fg(n, init_diffusion, init_viscosity, self.dt)
+        self.grid = FluidGridOwner(n, n if ny is None else ny, init_diffusion, init_viscosity, self.dt, precision_code)
+        self.thread_count = thread_count
+        self.relaxation = relaxation
+        self.pressure_solver = pressure_solver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
 
     def ix(self, x, y):
-        return ix(singleton_fg, x, y)
+        return ix(grid_of(self), x, y)
 
     def step(self):
-        advance_fg_state_by_one_tick(singleton_fg)
+        cdef FluidGrid* fg = grid_of(self)
+        with nogil:
+            advance_fg_state_by_one_tick(fg)
 
-    def dispose(self):
-        global singleton_fg
+    def step_density(self):
+        """
+        Advances density alone by one tick, through the current velocity, which is left as it is: density sources are
+        added, density diffuses and is advected as in `step`, and velocity sources stay pending until the next `step`.
+        - moves a scalar through a prescribed flow, e.g. to measure `advection_scheme`'s error on a known velocity.
+        - always runs the staged kernels over the whole grid (see `fused_step` and `active_tiles`).
+        """
+        cdef FluidGrid* fg = grid_of(self)
+        with nogil:
+            advance_density_by_one_tick(fg)
 
-        del_fg(singleton_fg)
-        singleton_fg = NULL
+    def dispose(self):
+        """
+        Releases this simulator's grid.
+        The grid is freed immediately, unless a field view still aliases it, in which case it is freed along with the
+        last such view.
+        Using the simulator after this call raises a `ValueError`.
+        """
+        self.grid = None
 
     @property
     def cell_count(self):
-        return singleton_fg.cell_count
+        return grid_of(self).cell_count
 
     @property
     def size(self):
-        return singleton_fg.size
+        """
+        the number of cells per edge, borders included, of a square grid
+        :raise ValueError: for a rectangular grid, which has no single size (see `shape`)
+        """
+        fg = grid_of(self)
+        if fg.size_x != fg.size_y:
+            raise ValueError(f"a {fg.nx}x{fg.ny} grid has no single size: use `shape` instead")
+        return fg.size_x
+
+    @property
+    def nx(self):
+        return grid_of(self).nx
+
+    @property
+    def ny(self):
+        return grid_of(self).ny
+
+    @property
+    def shape(self):
+        """
+        the shape of the grid's fields, borders included: (nx + 2, ny + 2), indexed as [x, y]
+        - cells are square whatever the grid's shape: the longer edge spans a unit length, over `max(nx, ny)` cells.
+        """
+        fg = grid_of(self)
+        return fg.size_x, fg.size_y
 
     def dump_vx_array(self):
-        return np.array([singleton_fg.vx[i] for i in range(singleton_fg.cell_count)])
+        return self.vx_view().flatten()
 
     def dump_vy_array(self):
-        return np.array([singleton_fg.vy[i] for i in range(singleton_fg.cell_count)])
+        return self.vy_view().flatten()
 
     def dump_velocity_array(self):
-        return np.array([
-            np.array((vx, vy))
-            for (vx, vy) in zip(self.dump_vy_array(), self.dump_vy_array())
-        ])
+        return np.stack((self.dump_vx_array(), self.dump_vy_array()), axis=-1)
 
     def dump_density_array(self):
-        return np.array([singleton_fg.density[i] for i in range(singleton_fg.cell_count)])
+        return self.density_view().flatten()
+
+    def density_view(self):
+        """
+        Returns a zero-copy view of the density field.
+        The view aliases the grid's own buffer, so it tracks every later `step` and keeps the grid alive.
+        :return: an (nx + 2, ny + 2) float32 array indexed as [x, y] (float64 if `precision` is 'double').
+        """
+        fg = grid_of(self)
+        return new_field_view(self.grid, fg.density, fg.size_x, fg.size_y, fg_value_size(fg))
+
+    def vx_view(self):
+        """
+        Returns a zero-copy view of the X-velocity field (see `density_view`).
+        :return: an (nx + 2, ny + 2) float32 array indexed as [x, y] (float64 if `precision` is 'double').
+        """
+        fg = grid_of(self)
+        return new_field_view(self.grid, fg.vx, fg.size_x, fg.size_y, fg_value_size(fg))
+
+    def vy_view(self):
+        """
+        Returns a zero-copy view of the Y-velocity field (see `density_view`).
+        :return: an (nx + 2, ny + 2) float32 array indexed as [x, y] (float64 if `precision` is 'double').
+        """
+        fg = grid_of(self)
+        return new_field_view(self.grid, fg.vy, fg.size_x, fg.size_y, fg_value_size(fg))
+
+    def copy_density_into(self, out):
+        """
+        Copies the density field into a preallocated buffer without allocating.
+        :param out: a C-contiguous (nx + 2, ny + 2) float32 array (float64 if `precision` is 'double').
+        :return: `out`
+        """
+        fg = grid_of(self)
+        return copy_field_into(fg, fg.density, out)
+
+    def copy_vx_into(self, out):
+        """
+        Copies the X-velocity field into a preallocated buffer (see `copy_density_into`).
+        """
+        fg = grid_of(self)
+        return copy_field_into(fg, fg.vx, out)
+
+    def copy_vy_into(self, out):
+        """
+        Copies the Y-velocity field into a preallocated buffer (see `copy_density_into`).
+        """
+        fg = grid_of(self)
+        return copy_field_into(fg, fg.vy, out)
 
     @property
     def dt(self):
@@ -83,324 +317,3151 @@ class Simulator(object):
         updates the time rate
         :param value: new time rate (1 => real-time)
         """
-        global singleton_fg
         self.internal_time_rate = value
-        singleton_fg.dt = self.dt
+        grid_of(self).dt = self.dt
 
     @property
     def diffusion(self):
-        global singleton_fg
-        return singleton_fg.diffusion
+        return grid_of(self).diffusion
 
     @diffusion.setter
     def diffusion(self, new_diffusion):
-        global singleton_fg
-        singleton_fg.diffusion = new_diffusion
+        grid_of(self).diffusion = new_diffusion
 
     @property
     def viscosity(self):
-        global singleton_fg
-        return singleton_fg.viscosity
+        return grid_of(self).viscosity
 
     @viscosity.setter
     def viscosity(self, new_viscosity):
-        global singleton_fg
-        singleton_fg.viscosity = new_viscosity
+        grid_of(self).viscosity = new_viscosity
 
-    def add_density(self, pos_xy: Tuple[int, int], amount: float):
-        x, y = pos_xy
-        global singleton_fg
-        fg_add_density(singleton_fg, x, y, amount)
+    @property
+    def precision(self):
+        """
+        the type of the grid's values, chosen at construction: one of `PRECISION_SINGLE`, `PRECISION_DOUBLE` or
+        `PRECISION_MIXED`
+        """
+        code = grid_of(self).precision
+        return next(name for name, name_code in precision_codes.items() if name_code == code)
 
-    def add_velocity(self, pos_xy: Tuple[int, int], amount_xy: Tuple[float, float]):
-        global singleton_fg
-        x, y = pos_xy
-        amount_x, amount_y = amount_xy
-        fg_add_velocity(singleton_fg, x, y, amount_x, amount_y)
+    @property
+    def thread_count(self):
+        return grid_of(self).thread_count
 
-    def clear_density_and_velocity(self):
-        fg_soft_reset(singleton_fg)
+    @thread_count.setter
+    def thread_count(self, new_thread_count):
+        """
+        sets the number of OpenMP threads used by the parallel loops
+        :param new_thread_count: a positive thread count, or `None` to use every available CPU.
+        :raise ValueError: for a `BatchSimulator.member`, which always steps on one thread
+        """
+        if isinstance(self.grid, BatchMemberHandle):
+            raise ValueError("members step on one thread each: set BatchSimulator.thread_count instead")
+        if new_thread_count is None:
+            new_thread_count = os.cpu_count() or 1
+        if new_thread_count < 1:
+            raise ValueError(f"thread_count must be positive, got {new_thread_count}")
+        grid_of(self).thread_count = new_thread_count
 
+    @property
+    def relaxation(self):
+        code = grid_of(self).relaxation_order
+        return next(name for name, name_code in relaxation_order_codes.items() if name_code == code)
 
-#
-#
-# `FluidGrid`: data for pressure & velocity of fluid
-# in a dense-enough square grid.
-# - exists in C-space only, designed to be maximally efficient
-# - todo: consider if n = size (Ash) or n = size-2 (Stam) (using Stam)
-#
-#
+    @relaxation.setter
+    def relaxation(self, new_relaxation):
+        """
+        selects the cell ordering used by the `diffuse` and `project` relaxation sweeps
+        :param new_relaxation: `RELAXATION_GAUSS_SEIDEL` or `RELAXATION_RED_BLACK`
+        """
+        try:
+            grid_of(self).relaxation_order = relaxation_order_codes[new_relaxation]
+        except KeyError:
+            raise ValueError(f"unknown relaxation order: {new_relaxation!r}") from None
 
-cdef struct FluidGrid:
-    # Voxel header data:
-    int n;
-    int size;
-    int cell_count;
-    float dt;
-    float diffusion;
-    float viscosity;
+    @property
+    def pressure_solver(self):
+        code = grid_of(self).pressure_solver
+        return next(name for name, name_code in pressure_solver_codes.items() if name_code == code)
 
-    # Per-voxel attribute arrays:
-    float* density;
-    float* vx;
-    float* vy;
+    @pressure_solver.setter
+    def pressure_solver(self, new_pressure_solver):
+        """
+        selects the linear solver used by the `project` step
+        :param new_pressure_solver: one of `PRESSURE_SOLVER_RELAXATION`, `PRESSURE_SOLVER_MULTIGRID` or
+            `PRESSURE_SOLVER_CONJUGATE_GRADIENT`; multigrid runs conjugate gradients while the grid has obstacles.
+        """
+        try:
+            code = pressure_solver_codes[new_pressure_solver]
+        except KeyError:
+            raise ValueError(f"unknown pressure solver: {new_pressure_solver!r}") from None
 
-    # stores attributes of the last frame
-    float* density_prev;
-    float* vx_prev;
-    float* vy_prev;
+        fg = grid_of(self)
+        if code != PRESSURE_SOLVER_CODE_RELAXATION:
+            fg_ensure_pressure_workspace(fg)
+        fg.pressure_solver = code
 
+    @property
+    def pressure_tolerance(self):
+        return grid_of(self).pressure_tolerance
 
-cdef inline ix(FluidGrid* fg, int x, int y):
-    """
-    Translates (x, y) tuple into a flat (index) that can be used to look up
-    voxel attributes in an attribute list.
-    Note that data is stored in COLUMN major order.
-    :param fg: the grid whose encapsulated voxel attributes to look up. 
-    :param x: the x-index of the voxel to query.
-    :param y: the y-index of the voxel to query.
-    :return: a unique integer index used to access the properties of the voxel at (x,y) in fg. 
-    """
+    @pressure_tolerance.setter
+    def pressure_tolerance(self, new_tolerance):
+        """
+        sets the relative residual (|div - A p| / |div|) at which the pressure solve stops early
+        """
+        if new_tolerance < 0:
+            raise ValueError(f"pressure_tolerance must be non-negative, got {new_tolerance}")
+        grid_of(self).pressure_tolerance = new_tolerance
 
-    assert fg.size == fg.n+2
+    @property
+    def pressure_max_iterations(self):
+        return grid_of(self).pressure_max_iterations
 
-    return (
-        (x * fg.size) +
-        (y * 1)
-    )
+    @pressure_max_iterations.setter
+    def pressure_max_iterations(self, new_max_iterations):
+        """
+        caps the relaxation sweeps, V-cycles or CG iterations run by each pressure solve
+        """
+        if new_max_iterations < 1:
+            raise ValueError(f"pressure_max_iterations must be positive, got {new_max_iterations}")
+        grid_of(self).pressure_max_iterations = new_max_iterations
 
+    @property
+    def diffusion_tolerance(self):
+        return grid_of(self).diffusion_tolerance
 
-cdef (FluidGrid*) new_fg(int n, int diffusion, int viscosity, float dt):
-    """
-    Creates a new fluid square. The method implemented is crucially stable over
-    large time-steps, making it suitable for slow dt.
-    :param n: number of non-border cells per edge
-    :param diffusion: the simulation's diffusion constant
-    :param viscosity: the fluid's viscosity constant
-    :param dt: delta-time, a time-step used to simulate fluid movement.
-    :return: the new FluidGrid instance
-    """
+    @diffusion_tolerance.setter
+    def diffusion_tolerance(self, new_tolerance):
+        """
+        sets the relative residual at which the `diffuse` sweeps stop early (0 => always run the maximum)
+        """
+        if new_tolerance < 0:
+            raise ValueError(f"diffusion_tolerance must be non-negative, got {new_tolerance}")
+        grid_of(self).diffusion_tolerance = new_tolerance
 
-    fg = <FluidGrid*>malloc(sizeof(FluidGrid))
-    fg.n = n
-    fg.size = n+2
-    fg.cell_count = fg.size * fg.size
-    fg.dt = dt
-    fg.diffusion = diffusion
-    fg.viscosity = viscosity
+    @property
+    def diffusion_max_iterations(self):
+        return grid_of(self).diffusion_max_iterations
 
-    voxel_count = fg.size * fg.size
+    @diffusion_max_iterations.setter
+    def diffusion_max_iterations(self, new_max_iterations):
+        """
+        caps the relaxation sweeps run by each `diffuse` call
+        """
+        if new_max_iterations < 1:
+            raise ValueError(f"diffusion_max_iterations must be positive, got {new_max_iterations}")
+        grid_of(self).diffusion_max_iterations = new_max_iterations
 
-    fg.density = <float*>calloc(voxel_count, sizeof(float))
-    fg.vx = <float*>calloc(voxel_count, sizeof(float))
-    fg.vy = <float*>calloc(voxel_count, sizeof(float))
+    @property
+    def relaxation_block_depth(self):
+        return grid_of(self).relaxation_block_depth
 
-    fg.density_prev = <float *> calloc(voxel_count, sizeof(float))
-    fg.vx_prev = <float*>calloc(voxel_count, sizeof(float))
-    fg.vy_prev = <float*>calloc(voxel_count, sizeof(float))
+    @relaxation_block_depth.setter
+    def relaxation_block_depth(self, new_depth):
+        """
+        sets how many relaxation sweeps run per pass over the grid (temporal blocking; 1 => off, the default)
+        - with a depth of k, one pass updates each row k times while its neighborhood is still in cache, so large grids
+          stream through memory k times less often. Results are unchanged when no tolerance is set.
+        - blocked sweeps run on one thread, and check their tolerance once per pass rather than once per sweep.
+        - ignored while the grid has obstacles (see `set_obstacles`).
+        :param new_depth: in [1, MAX_RELAXATION_BLOCK_DEPTH]
+        """
+        if not 1 <= new_depth <= MAX_RELAXATION_BLOCK_DEPTH:
+            raise ValueError(
+                f"relaxation_block_depth must be in [1, {MAX_RELAXATION_BLOCK_DEPTH}], got {new_depth}"
+            )
+        grid_of(self).relaxation_block_depth = new_depth
 
-    z = fg.vx_prev[0]
+    @property
+    def fused_step(self):
+        return grid_of(self).fused_step_enabled
 
-    return fg
+    @fused_step.setter
+    def fused_step(self, enabled):
+        """
+        selects the fused step kernels, which make fewer passes over the grid per tick for the same results: sources are
+        added inside the first diffusion sweep, both velocity components diffuse and advect together, and border cells
+        are set inline (off by default). Steps with obstacles run the staged kernels (see `set_obstacles`).
+        """
+        grid_of(self).fused_step_enabled = enabled
 
+    @property
+    def active_tiles(self):
+        return grid_of(self).active_tiles != NULL
 
-cdef fg_soft_reset(FluidGrid* fg):
-    voxel_count = fg.size * fg.size
+    @active_tiles.setter
+    def active_tiles(self, enabled):
+        """
+        enables or disables active-tile tracking (off by default): each step then runs only on the tiles holding values
+        above `active_tile_threshold`, and on a halo around them, and zeroes the rest of the grid. This trades a small
+        error for speed on large grids where the fluid occupies a small region. Steps run on the whole grid as usual
+        when too many tiles are active, and under the fused step, temporal blocking, a pressure solver other than
+        relaxation, or obstacles (see `set_obstacles`).
+        """
+        fg = grid_of(self)
+        if enabled and fg.active_tiles == NULL:
+            fg_enable_active_tiles(fg)
+        elif not enabled:
+            del_active_tiles(fg.active_tiles)
+            fg.active_tiles = NULL
 
-    memset(fg.density, 0, voxel_count * sizeof(float))
-    memset(fg.vx, 0, voxel_count * sizeof(float))
-    memset(fg.vy, 0, voxel_count * sizeof(float))
+    @property
+    def active_tile_size(self):
+        return grid_of(self).active_tile_size
 
-    memset(fg.density_prev, 0, voxel_count * sizeof(float))
-    memset(fg.vx_prev, 0, voxel_count * sizeof(float))
-    memset(fg.vy_prev, 0, voxel_count * sizeof(float))
+    @active_tile_size.setter
+    def active_tile_size(self, new_tile_size):
+        """
+        sets the width, in cells, of the tiles tracked by `active_tiles` (16 by default)
+        """
+        if new_tile_size < 1:
+            raise ValueError(f"active_tile_size must be positive, got {new_tile_size}")
+        fg = grid_of(self)
+        fg.active_tile_size = new_tile_size
+        if fg.active_tiles != NULL:
+            fg_enable_active_tiles(fg)
 
+    @property
+    def active_tile_halo(self):
+        return grid_of(self).active_tile_halo
 
-cdef del_fg(FluidGrid* fg):
-    """
-    Deletes the argument fluid square, relinquishing all memory resources
-    used for it.
-    :param fg: the fluid-square to de-initialize.
-    """
+    @active_tile_halo.setter
+    def active_tile_halo(self, new_halo):
+        """
+        sets how many tiles around each active tile are processed too (2 by default). The halo must be wide enough to
+        hold whatever diffuses or is advected out of the active tiles within one step, or it is lost.
+        """
+        if new_halo < 0:
+            raise ValueError(f"active_tile_halo must be non-negative, got {new_halo}")
+        grid_of(self).active_tile_halo = new_halo
 
-    free(<void*>fg.density)
-    free(<void*>fg.vx)
-    free(<void*>fg.vy)
+    @property
+    def active_tile_threshold(self):
+        return grid_of(self).active_tile_threshold
 
-    free(<void*>fg.density_prev)
-    free(<void*>fg.vx_prev)
-    free(<void*>fg.vy_prev)
+    @active_tile_threshold.setter
+    def active_tile_threshold(self, new_threshold):
+        """
+        sets the magnitude a density, velocity or source value must exceed for its tile to be active (1e-3 by default)
+        """
+        if new_threshold < 0:
+            raise ValueError(f"active_tile_threshold must be non-negative, got {new_threshold}")
+        grid_of(self).active_tile_threshold = new_threshold
 
-    free(<void*>fg)
+    @property
+    def active_tile_max_fraction(self):
+        return grid_of(self).active_tile_max_fraction
 
+    @active_tile_max_fraction.setter
+    def active_tile_max_fraction(self, new_fraction):
+        """
+        sets the largest fraction of tiles a step may process while restricted to them (0.5 by default); steps that
+        would process more run on the whole grid, which is faster than restricted sweeps over most of it.
+        """
+        if not 0 <= new_fraction <= 1:
+            raise ValueError(f"active_tile_max_fraction must be in [0, 1], got {new_fraction}")
+        grid_of(self).active_tile_max_fraction = new_fraction
 
-cdef fg_add_density(FluidGrid* fg, int x, int y, float amount):
-    """
-    Add fluid density (as though from a source) at the specified cell. 
-    :param fg: the container fluid-square to update
-    :param x: the x-coordinate at which to add density
-    :param y: the y-coordinate at which to add density
-    :param amount: the amount of fluid to add per-cell
-    """
+    def active_tile_mask(self):
+        """
+        :return: a (tiles_x, tiles_y) boolean array indexed as [tx, ty], True for each tile the last step processed
+            (all of them after a step on the whole grid), or `None` while `active_tiles` is off.
+        """
+        cdef ActiveTiles* tiles = grid_of(self).active_tiles
+        if tiles == NULL:
+            return None
+        processed_tiles = np.array(<unsigned char[:tiles.tiles_x * tiles.tiles_y]>tiles.processed_tiles, dtype=bool)
+        return processed_tiles.reshape(tiles.tiles_x, tiles.tiles_y)
 
-    n = fg.n
-    fg.density[ix(fg, x, y)] += amount
+    def set_obstacles(self, mask):
+        """
+        Replaces the grid's obstacles: solid cells, which fluid neither enters nor crosses.
+        - obstacles' walls are handled inside the solver's stencils, as the border is, with no passes of their own; a
+          grid without obstacles runs the same kernels as before any were set.
+        - steps with obstacles run the staged kernels (see `fused_step`), without temporal blocking, on the whole grid
+          (see `active_tiles`), and the multigrid pressure solver runs conjugate gradients instead.
+        - cells made solid lose their density and velocity; sources added to solid cells are lost.
+        :param mask: an (nx + 2, ny + 2) array indexed as [x, y], non-zero (or True) at each solid cell. Border cells,
+            which are walls already, are ignored; an all-zero mask removes every obstacle.
+        """
+        mask = np.asarray(mask)
+        if mask.shape != self.shape:
+            raise ValueError(f"expected a mask of shape {self.shape}, got {mask.shape}")
+        fg_set_obstacles(grid_of(self), np.ascontiguousarray(mask != 0).view(np.uint8))
 
+    def update_obstacles(self, xs, ys, solid=True):
+        """
+        Turns some cells solid, or back into (empty) fluid, leaving the other obstacles alone: moving an obstacle only
+        costs the cells it covers and uncovers (see `set_obstacles`).
+        :param xs: an integer array of x-coordinates of interior cells
+        :param ys: an integer array of y-coordinates, the same shape as `xs`
+        :param solid: True to make the cells solid, False to make them fluid
+        """
+        fg_update_obstacles(grid_of(self), xs, ys, solid)
 
-cdef fg_add_velocity(FluidGrid* fg, int x, int y, float amount_x, float amount_y):
-    """
-    Increment the velocity of all fluid-mass in a cell
-    :param fg: the container fluid-square to update
-    :param x: the X-coordinate at which to add velocity
-    :param y: the Y-coordinate at which to add velocity
-    :param amount_x: the amount of velocity to add along the X-axis
-    :param amount_y: the amount of velocity to add along the Y-axis
-    :return: 
-    """
+    def clear_obstacles(self):
+        fg_clear_obstacles(grid_of(self))
 
-    n = fg.n
-    index = ix(fg, x, y)
-    fg.vx[index] += amount_x
-    fg.vy[index] += amount_y
+    def obstacle_mask(self):
+        """
+        :return: an (nx + 2, ny + 2) boolean array indexed as [x, y], True at each solid cell (a copy).
+        """
+        cdef FluidGrid* fg = grid_of(self)
+        if fg.obstacle_flags == NULL:
+            return np.zeros(self.shape, dtype=bool)
+        flags = np.asarray(<unsigned char[:fg.cell_count]>fg.obstacle_flags).reshape(self.shape)
+        return (flags & OBSTACLE_SOLID) != 0
 
+    @property
+    def obstacle_slip(self):
+        code = grid_of(self).obstacle_slip
+        return next(name for name, name_code in obstacle_slip_codes.items() if name_code == code)
 
-cdef advance_fg_state_by_one_tick(FluidGrid* fg):
-    """
-    Advances the FluidGrid state by one tick, accounting for all fluid flow within.
-    :param fg: the FluidGrid instance within which fluid sloshes about.
-    """
+    @obstacle_slip.setter
+    def obstacle_slip(self, new_slip):
+        """
+        selects the wall condition at obstacles (see `set_obstacles`)
+        :param new_slip: `OBSTACLE_SLIP_NO_SLIP` (the default) or `OBSTACLE_SLIP_FREE_SLIP`
+        """
+        try:
+            grid_of(self).obstacle_slip = obstacle_slip_codes[new_slip]
+        except KeyError:
+            raise ValueError(f"unknown obstacle slip condition: {new_slip!r}") from None
 
-    velocity_step(fg, fg.vx, fg.vy, fg.vx_prev, fg.vy_prev, fg.viscosity, fg.dt)
-    density_step(fg, fg.density, fg.density_prev, fg.vx, fg.vy, fg.diffusion, fg.dt)
+    @property
+    def advection_scheme(self):
+        code = grid_of(self).advection_scheme
+        return next(name for name, name_code in advection_scheme_codes.items() if name_code == code)
 
+    @advection_scheme.setter
+    def advection_scheme(self, new_scheme):
+        """
+        selects the scheme `advect` moves density and velocity with
+        :param new_scheme: `ADVECTION_SEMI_LAGRANGIAN` (the default), `ADVECTION_MACCORMACK` or `ADVECTION_BFECC`; the
+            corrected schemes keep finer detail for 3-4x the advection cost, and one more field of scratch memory.
+            Ticks restricted to active tiles fall back to full sweeps under them.
+        """
+        try:
+            code = advection_scheme_codes[new_scheme]
+        except KeyError:
+            raise ValueError(f"unknown advection scheme: {new_scheme!r}") from None
 
-cdef velocity_step(FluidGrid* fg, float* u, float* v, float* u0, float* v0, float visc, float dt):
-    add_source(fg, u, u0, dt)
-    add_source(fg, v, v0, dt)
-    # print("VS: Add Source OK")
+        fg = grid_of(self)
+        if code != ADVECTION_SCHEME_CODE_SEMI_LAGRANGIAN:
+            fg_ensure_advection_scratch(fg)
+        fg.advection_scheme = code
 
-    swap(&u0, &u)
-    diffuse(fg, 1, u, u0, visc, dt)
-    # print("VS: Diffuse 1 OK")
+    @property
+    def last_step_stats(self):
+        """
+        Reports how hard each linear solve in the last `step` worked.
+        :return: a dict mapping each solve (in pipeline order) to its iteration count and final relative residual,
+            plus the number of steps taken so far under 'step_index', and the fraction of tiles the step processed
+            under 'active_tile_fraction' (1 unless it was restricted by `active_tiles`).
+        """
+        cdef dict stats = grid_of(self).step_stats
+        report = {'step_index': stats['step_index'], 'active_tile_fraction': stats['active_tile_fraction']}
+        for stage_name in STEP_STAGE_NAMES:
+            report[stage_name] = stats[stage_name]
+        return report
 
-    swap(&v0, &v)
-    diffuse(fg, 2, v, v0, visc, dt)
-    # print("VS: Diffuse 2 OK")
+    @property
+    def stage_timing(self):
+        return grid_of(self).stage_timing_enabled
 
-    project(fg, u, v, u0, v0)
-    # print("VS: Project 1 OK")
+    @stage_timing.setter
+    def stage_timing(self, enabled):
+        """
+        enables or disables the monotonic timers around each pipeline stage (off by default)
+        """
+        grid_of(self).stage_timing_enabled = enabled
 
-    swap(&u0, &u)
-    swap(&v0, &v)
+    @property
+    def stage_times(self):
+        """
+        :return: a dict mapping each of `TIMED_STAGE_NAMES` to the total seconds spent in it while `stage_timing` was
+            enabled.
+        """
+        cdef FluidGrid* fg = grid_of(self)
+        return {stage_name: fg.stage_times.ns[k] / 1e9 for k, stage_name in enumerate(TIMED_STAGE_NAMES)}
 
-    advect(fg, 1, u, u0, u0, v0, dt)
-    # print("VS: Advect 1 OK")
-    advect(fg, 2, v, v0, u0, v0, dt)
-    # print("VS: Advect 2 OK")
+    def reset_stage_times(self):
+        memset(&grid_of(self).stage_times, 0, sizeof(StageTimes))
 
-    project(fg, u, v, u0, v0)
-    # print("VS: Project 2 OK")
+    @property
+    def profiling(self):
+        return grid_of(self).profile != NULL
 
+    @profiling.setter
+    def profiling(self, enabled):
+        """
+        enables or disables the step profiler (off by default), which keeps the time each step spent in each of
+        `TIMED_STAGE_NAMES` over the last `profile_window` steps (see `profile_samples` and `profile_histograms`).
+        Disabled, it holds no memory, and its timers reduce to a test each.
+        """
+        fg = grid_of(self)
+        if enabled and fg.profile == NULL:
+            fg_enable_profile(fg)
+        elif not enabled:
+            del_stage_profile(fg.profile)
+            fg.profile = NULL
 
-cdef density_step(FluidGrid* fg, float* x, float* x0, float* u, float* v, float diff, float dt):
-    add_source(fg, x, x0, dt)
-    # print("DS: Add Source OK")
+    @property
+    def profile_window(self):
+        return grid_of(self).profile_window
 
-    swap(&x0, &x)
-    diffuse(fg, 0, x, x0, diff, dt)
-    # print("DS: Diffuse 1 OK")
+    @profile_window.setter
+    def profile_window(self, new_window):
+        """
+        sets the number of most recent steps the profiler keeps (`DEFAULT_PROFILE_WINDOW` by default); changing it
+        clears the profile.
+        """
+        if new_window < 1:
+            raise ValueError(f"profile_window must be positive, got {new_window}")
+        fg = grid_of(self)
+        fg.profile_window = new_window
+        if fg.profile != NULL:
+            fg_enable_profile(fg)
+
+    def reset_profile(self):
+        fg = grid_of(self)
+        if fg.profile != NULL:
+            fg_enable_profile(fg)
+
+    def profile_samples(self):
+        """
+        :return: a (step count, len(TIMED_STAGE_NAMES)) float64 array of the seconds each profiled step spent in each
+            stage, oldest step first, or `None` while `profiling` is off.
+        """
+        cdef StageProfile* profile = grid_of(self).profile
+        if profile == NULL:
+            return None
+
+        samples_ns = np.array(<long long[:profile.window * TIMED_STAGE_COUNT]>profile.samples_ns)
+        samples_ns = samples_ns.reshape(profile.window, TIMED_STAGE_COUNT)
+        if profile.sample_count == profile.window:
+            samples_ns = np.roll(samples_ns, -profile.next_sample, axis=0)
+        else:
+            samples_ns = samples_ns[:profile.sample_count]
+        return samples_ns / 1e9
+
+    def profile_histograms(self):
+        """
+        :return: a dict mapping each of `TIMED_STAGE_NAMES` to an int array of `PROFILE_BIN_COUNT` counts: how many of
+            the profiled steps spent a duration in each bin of `PROFILE_BIN_EDGES_SEC` in that stage; or `None` while
+            `profiling` is off.
+        """
+        cdef StageProfile* profile = grid_of(self).profile
+        if profile == NULL:
+            return None
 
-    swap(&x0, &x)
-    advect(fg, 0, x, x0, u, v, dt)
-    # print("DS: Diffuse 2 OK")
+        bin_counts = np.array(<int[:TIMED_STAGE_COUNT * PROFILE_BIN_COUNT]>profile.bin_counts)
+        bin_counts = bin_counts.reshape(TIMED_STAGE_COUNT, PROFILE_BIN_COUNT)
+        return {stage_name: bin_counts[k] for k, stage_name in enumerate(TIMED_STAGE_NAMES)}
 
+    def profile_summary(self):
+        """
+        :return: a dict mapping each of `TIMED_STAGE_NAMES` to the mean, median, 95th percentile and maximum of its
+            profiled durations, in milliseconds (keys 'mean_ms', 'p50_ms', 'p95_ms' and 'max_ms'); or `None` while
+            `profiling` is off or before the first profiled step.
+        """
+        samples = self.profile_samples()
+        if samples is None or len(samples) == 0:
+            return None
+
+        samples_ms = 1e3 * samples
+        p50, p95 = np.percentile(samples_ms, [50, 95], axis=0)
+        return {
+            stage_name: {
+                'mean_ms': float(samples_ms[:, k].mean()),
+                'p50_ms': float(p50[k]),
+                'p95_ms': float(p95[k]),
+                'max_ms': float(samples_ms[:, k].max()),
+            }
+            for k, stage_name in enumerate(TIMED_STAGE_NAMES)
+        }
+
+    def add_density(self, pos_xy: Tuple[int, int], amount: float):
+        x, y = pos_xy
+        fg_add_density(grid_of(self), x, y, amount)
+
+    def add_velocity(self, pos_xy: Tuple[int, int], amount_xy: Tuple[float, float]):
+        x, y = pos_xy
+        amount_x, amount_y = amount_xy
+        fg_add_velocity(grid_of(self), x, y, amount_x, amount_y)
+
+    def add_density_at(self, xs, ys, amounts, immediate=False):
+        """
+        Adds density at many cells in one call.
+        By default the amounts are per-step sources: they are written into the source buffers, applied (scaled by
+        `dt`) by the next `step`, then cleared. Re-add them every frame for a continuous emitter.
+        :param xs: an integer array of x-coordinates
+        :param ys: an integer array of y-coordinates, the same shape as `xs`
+        :param amounts: a scalar, or an array the same shape as `xs`; duplicate cells accumulate.
+        :param immediate: if True, adds straight into the density field instead, like `add_density`.
+        """
+        fg = grid_of(self)
+        fg_scatter_add(fg, fg.density if immediate else fg.density_prev, xs, ys, amounts)
 
-cdef inline add_source(FluidGrid* fg, float* x, float* s, float dt):
-    for i in range(fg.cell_count):
-        x[i] += dt * s[i]
+    def add_velocity_at(self, xs, ys, amounts_x, amounts_y, immediate=False):
+        """
+        Adds velocity at many cells in one call (see `add_density_at`).
+        """
+        fg = grid_of(self)
+        fg_scatter_add(fg, fg.vx if immediate else fg.vx_prev, xs, ys, amounts_x)
+        fg_scatter_add(fg, fg.vy if immediate else fg.vy_prev, xs, ys, amounts_y)
 
+    def add_density_where(self, mask, amount, immediate=False):
+        """
+        Adds density at every cell selected by a mask (see `add_density_at`).
+        :param mask: an (nx + 2, ny + 2) boolean array indexed as [x, y]
+        :param amount: a scalar, or an (nx + 2, ny + 2) array of which only the masked cells are used
+        """
+        density = self.density_view() if immediate else self.source_views()[0]
+        masked_add(density, mask, amount)
 
-cdef inline swap(float** xp, float** yp):
-    # ptrs = <int>xp[0], <int>yp[0]
-    # print(f"Swap Start: {ptrs}")
+    def add_velocity_where(self, mask, amount_x, amount_y, immediate=False):
+        """
+        Adds velocity at every cell selected by a mask (see `add_density_where`).
+        """
+        if immediate:
+            vx, vy = self.vx_view(), self.vy_view()
+        else:
+            _, vx, vy = self.source_views()
+        masked_add(vx, mask, amount_x)
+        masked_add(vy, mask, amount_y)
+
+    def add_density_field(self, field, immediate=False):
+        """
+        Adds a whole (nx + 2, ny + 2) density field, indexed as [x, y] (see `add_density_at`).
+        """
+        density = self.density_view() if immediate else self.source_views()[0]
+        density += check_field_shape(density, field)
 
-    tmp = <float*>(xp[0])
-    xp[0] = <float*>(yp[0])
-    yp[0] = <float*>tmp
+    def add_velocity_field(self, field_x, field_y, immediate=False):
+        """
+        Adds whole (nx + 2, ny + 2) X- and Y-velocity fields, indexed as [x, y] (see `add_density_at`).
+        """
+        if immediate:
+            vx, vy = self.vx_view(), self.vy_view()
+        else:
+            _, vx, vy = self.source_views()
+        vx += check_field_shape(vx, field_x)
+        vy += check_field_shape(vy, field_y)
+
+    def source_views(self):
+        """
+        Returns zero-copy views of the per-step source buffers, which the next `step` consumes and then clears.
+        :return: (density, vx, vy) sources, each an (nx + 2, ny + 2) array indexed as [x, y], typed like `density_view`.
+        """
+        fg = grid_of(self)
+        return (
+            new_field_view(self.grid, fg.density_prev, fg.size_x, fg.size_y, fg_value_size(fg)),
+            new_field_view(self.grid, fg.vx_prev, fg.size_x, fg.size_y, fg_value_size(fg)),
+            new_field_view(self.grid, fg.vy_prev, fg.size_x, fg.size_y, fg_value_size(fg)),
+        )
 
-    # ptrs = <int>xp[0], <int>yp[0]
-    # print(f"Swap End: {ptrs}")
+    def clear_density_and_velocity(self):
+        fg_soft_reset(grid_of(self))
 
+    def snapshot(self):
+        """
+        Copies the grid's state: its header (nx, ny, time rate, dt, diffusion, viscosity, step index) and all six
+        attribute arrays. Solver settings and telemetry are not part of the state, and snapshots hold float32 values:
+        those of a double-precision grid are rounded.
+        :return: a `GridSnapshot`, which `restore` can load into this or any other simulator of the same `shape`.
+        """
+        cdef FluidGrid* fg = grid_of(self)
+        cdef GridSnapshot snapshot = GridSnapshot(fg.nx, fg.ny)
+        snapshot.time_rate = self.internal_time_rate
+        snapshot.dt = fg.dt
+        snapshot.diffusion = fg.diffusion
+        snapshot.viscosity = fg.viscosity
+        snapshot.step_index = fg.step_stats.step_index
+        copy_fg_fields(fg, snapshot.data, True)
+        return snapshot
+
+    def restore(self, GridSnapshot snapshot):
+        """
+        Overwrites the grid's state with a snapshot's (see `snapshot`). The snapshot's `time_rate` is restored as is,
+        and `dt` follows from it and this simulator's `max_display_updates_per_sec`; snapshot files of format version
+        < 3 hold no time rate, so `time_rate` then follows the restored `dt` instead.
+        :param snapshot: a snapshot of a grid with the same `shape`
+        """
+        cdef FluidGrid* fg = grid_of(self)
+        if snapshot.nx != fg.nx or snapshot.ny != fg.ny:
+            raise ValueError(
+                f"cannot restore a snapshot of a {snapshot.nx}x{snapshot.ny} grid into a {fg.nx}x{fg.ny} grid"
+            )
 
-cdef inline set_boundary_cells(FluidGrid* fg, int n, int b, float* x):
-    for i in range(1, 1+n):
-        x[ix(fg, 0, i)] = (-x[ix(fg, 1, i)]) if b == 1 else (x[ix(fg, 1, i)])
-        x[ix(fg, n+1, i)] = (-x[ix(fg, n, i)]) if b == 1 else (x[ix(fg, n, i)])
-        x[ix(fg, i, 0)] = (-x[ix(fg, i, 1)]) if b == 2 else (x[ix(fg, i, 1)])
-        x[ix(fg, i, n+1)] = (-x[ix(fg, i, n)]) if b == 2 else (x[ix(fg, i, n)])
+        copy_fg_fields(fg, snapshot.data, False)
+        fg.diffusion = snapshot.diffusion
+        fg.viscosity = snapshot.viscosity
+        fg.step_stats.step_index = snapshot.step_index
+        if snapshot.time_rate is None:
+            self.internal_time_rate = snapshot.dt * self.max_display_updates_per_sec
+        else:
+            self.internal_time_rate = snapshot.time_rate
+        fg.dt = self.dt
+
+    def save_snapshot(self, path):
+        """
+        Saves the grid's state to a file (see `snapshot`), writing the attribute arrays straight from the grid.
+        The file is written under a temporary name, then renamed over `path`, so a crash never leaves it half-written.
+        """
+        cdef FluidGrid* fg = grid_of(self)
+        cdef void* fields[6]
+        fg_field_pointers(fg, fields)
+
+        header = pack_snapshot_header(
+            fg.nx, fg.ny, fg.dt, fg.diffusion, fg.viscosity, fg.step_stats.step_index, self.internal_time_rate
+        )
+        field_views = [
+            # a no-op but for double-precision grids, which are rounded to float32 (see `snapshot`):
+            np.asarray(
+                new_field_view(self.grid, fields[k], fg.size_x, fg.size_y, fg_value_size(fg)), dtype=np.float32
+            )
+            for k in range(len(SNAPSHOT_FIELD_NAMES))
+        ]
+        write_snapshot_file(path, header, field_views)
 
-    x[ix(fg, 0, 0)] = 0.5 * (x[ix(fg, 1, 0)] + x[ix(fg, 0, 1)])
-    x[ix(fg, 0, n+1)] = 0.5 * (x[ix(fg, 1, n + 1)] + x[ix(fg, 0, n)])
-    x[ix(fg, n+1, 0)] = 0.5 * (x[ix(fg, n, 0)] + x[ix(fg, n + 1, 1)])
-    x[ix(fg, n+1, n+1)] = 0.5 * (x[ix(fg, n, n + 1)] + x[ix(fg, n + 1, n)])
+    def load_snapshot(self, path):
+        """
+        Restores the grid's state from a file written by `save_snapshot` or `GridSnapshot.save`.
+        The whole file is read and checked before the grid is touched.
+        """
+        self.restore(load_grid_snapshot(path))
 
 
-cdef diffuse(FluidGrid* fg, int b, float* x, float* x0, float diff, float dt):
+class BatchSimulator(object):
     """
-    implements the `diffuse` operator, used by `advance_fg_state_by_one_tick`
-    propagates velocities, simulating 'diffusion'.
-     - this is an implementation of Gauss-Seidel relaxation (cf MATH 151AB)
-     - note this is done in a non-energy-conserving way, so we must 'reproject' to rescale vectors
+    Steps `batch_size` independent grids of the same `n` together, for workloads made of many small grids.
+    - each attribute (density, vx, vy and their sources) is stored for all members in one (batch_size, size, size)
+      float32 block, and one `step` advances every member in a single loop, parallel over members.
+    - `diffusion`, `viscosity` and `time_rate` are per member: each reads as, and accepts, a (batch_size,) array, or
+      accepts a scalar for all members.
+    - `member(b)` returns a `Simulator` sharing member b's grid, for per-member injection, readout and settings.
     """
 
-    solver_iter_count = 20
+    def __init__(self, batch_size: int, n: int, init_diffusion, init_viscosity, max_display_updates_per_sec=60.0,
+                 time_rate=1.0, thread_count=1, relaxation=RELAXATION_GAUSS_SEIDEL,
+                 pressure_solver=PRESSURE_SOLVER_RELAXATION):
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
 
-    n = fg.n
-    a = dt * diff * n * n
+        self.max_display_updates_per_sec = max_display_updates_per_sec
+        self.batch_grid = BatchGridOwner(batch_size, n)
+        self.diffusion = init_diffusion
+        self.viscosity = init_viscosity
+        self.time_rate = time_rate
+        self.thread_count = thread_count
+        self.configure(relaxation=relaxation, pressure_solver=pressure_solver)
 
-    for k in range(0, solver_iter_count):
-        for i in range(1, 1+fg.n):
-            for j in range(1, 1+fg.n):
-                x[ix(fg, i, j)] = (1 / (1 + 4*a)) * (
-                    x0[ix(fg, i, j)] + a * (
-                        + x[ix(fg, i - 1, j)]
-                        + x[ix(fg, i + 1, j)]
-                        + x[ix(fg, i, j - 1)]
-                        + x[ix(fg, i, j + 1)]
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
+
+    def __len__(self):
+        return self.batch_size
+
+    def step(self):
+        cdef BatchGridOwner batch = batch_of(self)
+        with nogil:
+            advance_batch_by_one_tick(batch.grids, batch.batch_size, batch.thread_count)
+
+    def dispose(self):
+        """
+        Releases the batch's grids, once no member simulator or view aliases them any more (see `Simulator.dispose`).
+        """
+        self.batch_grid = None
+
+    @property
+    def batch_size(self):
+        return batch_of(self).batch_size
+
+    @property
+    def size(self):
+        return batch_of(self).grids[0].size_x
+
+    @property
+    def cell_count(self):
+        return batch_of(self).grids[0].cell_count
+
+    def member(self, b):
+        """
+        :param b: the member's index, in [0, batch_size)
+        :return: a `Simulator` whose grid is member `b`: its views alias the batch's blocks, and its setters
+            (`add_*`, `diffusion`, `pressure_solver`, `restore`, ...) affect that member only.
+        """
+        cdef BatchGridOwner batch = batch_of(self)
+        if not 0 <= b < batch.batch_size:
+            raise IndexError(f"member {b} out of range for a batch of {batch.batch_size}")
+
+        cdef BatchMemberHandle handle = BatchMemberHandle.__new__(BatchMemberHandle)
+        handle.fg = batch.grids[b]
+        handle.batch = batch
+
+        member_sim = Simulator.__new__(Simulator)
+        member_sim.max_display_updates_per_sec = self.max_display_updates_per_sec
+        member_sim.internal_time_rate = handle.fg.dt * self.max_display_updates_per_sec
+        member_sim.grid = handle
+        return member_sim
+
+    def configure(self, **settings):
+        """
+        Applies `Simulator` settings to every member, e.g. `configure(pressure_solver='multigrid')`.
+        Members always step on one thread each; use `thread_count` to parallelize over members instead.
+        """
+        if 'thread_count' in settings:
+            raise ValueError("members step on one thread each: set BatchSimulator.thread_count instead")
+        for b in range(self.batch_size):
+            member_sim = self.member(b)
+            for name, value in settings.items():
+                setattr(member_sim, name, value)
+
+    @property
+    def thread_count(self):
+        return batch_of(self).thread_count
+
+    @thread_count.setter
+    def thread_count(self, new_thread_count):
+        """
+        sets the number of OpenMP threads the batch's members are spread over
+        :param new_thread_count: a positive thread count, or `None` to use every available CPU.
+        """
+        if new_thread_count is None:
+            new_thread_count = os.cpu_count() or 1
+        if new_thread_count < 1:
+            raise ValueError(f"thread_count must be positive, got {new_thread_count}")
+        batch_of(self).thread_count = new_thread_count
+
+    @property
+    def diffusion(self):
+        cdef BatchGridOwner batch = batch_of(self)
+        return np.array([batch.grids[b].diffusion for b in range(batch.batch_size)], dtype=np.float32)
+
+    @diffusion.setter
+    def diffusion(self, new_diffusion):
+        cdef BatchGridOwner batch = batch_of(self)
+        cdef const float[::1] values = broadcast_member_values(new_diffusion, batch.batch_size)
+        for b in range(batch.batch_size):
+            batch.grids[b].diffusion = values[b]
+
+    @property
+    def viscosity(self):
+        cdef BatchGridOwner batch = batch_of(self)
+        return np.array([batch.grids[b].viscosity for b in range(batch.batch_size)], dtype=np.float32)
+
+    @viscosity.setter
+    def viscosity(self, new_viscosity):
+        cdef BatchGridOwner batch = batch_of(self)
+        cdef const float[::1] values = broadcast_member_values(new_viscosity, batch.batch_size)
+        for b in range(batch.batch_size):
+            batch.grids[b].viscosity = values[b]
+
+    @property
+    def dt(self):
+        cdef BatchGridOwner batch = batch_of(self)
+        return np.array([batch.grids[b].dt for b in range(batch.batch_size)], dtype=np.float32)
+
+    @property
+    def time_rate(self):
+        return self.dt * self.max_display_updates_per_sec
+
+    @time_rate.setter
+    def time_rate(self, new_time_rate):
+        """
+        updates the members' time rates (1 => real-time); each member's `dt` follows, as in `Simulator.time_rate`.
+        """
+        cdef BatchGridOwner batch = batch_of(self)
+        cdef const float[::1] values = broadcast_member_values(new_time_rate, batch.batch_size)
+        for b in range(batch.batch_size):
+            batch.grids[b].dt = values[b] * (1.0 / self.max_display_updates_per_sec)
+
+    def density_block(self):
+        """
+        Returns a zero-copy view of every member's density field (see `Simulator.density_view`).
+        :return: a (batch_size, size, size) float32 array indexed as [b, x, y].
+        """
+        cdef BatchGridOwner batch = batch_of(self)
+        return new_block_view(batch, batch.blocks[0], batch.batch_size, batch.grids[0].size_x, batch.grids[0].size_y)
+
+    def vx_block(self):
+        """
+        Returns a zero-copy view of every member's X-velocity field (see `density_block`).
+        """
+        cdef BatchGridOwner batch = batch_of(self)
+        return new_block_view(batch, batch.blocks[1], batch.batch_size, batch.grids[0].size_x, batch.grids[0].size_y)
+
+    def vy_block(self):
+        """
+        Returns a zero-copy view of every member's Y-velocity field (see `density_block`).
+        """
+        cdef BatchGridOwner batch = batch_of(self)
+        return new_block_view(batch, batch.blocks[2], batch.batch_size, batch.grids[0].size_x, batch.grids[0].size_y)
+
+    def source_blocks(self):
+        """
+        Returns zero-copy views of every member's per-step source buffers (see `Simulator.source_views`).
+        :return: (density, vx, vy) sources, each a (batch_size, size, size) float32 array indexed as [b, x, y].
+        """
+        cdef BatchGridOwner batch = batch_of(self)
+        return tuple(
+            new_block_view(batch, batch.blocks[k], batch.batch_size, batch.grids[0].size_x, batch.grids[0].size_y)
+            for k in range(3, 6)
+        )
+
+    def clear_density_and_velocity(self):
+        cdef BatchGridOwner batch = batch_of(self)
+        for b in range(batch.batch_size):
+            fg_soft_reset(batch.grids[b])
+
+
+#
+#
+# `FluidGridOwner`: ties the lifetime of a C-space `FluidGrid` to a Python object.
+# - each `Simulator` owns one, so any number of independent grids can live in one process.
+# - the grid is freed in `__dealloc__`, i.e. as soon as the last reference (simulator or field view) is dropped.
+# - a `Simulator` may instead hold a `BatchMemberHandle`, which borrows one member grid of a `BatchSimulator`.
+#
+#
+
+cdef class GridHandle:
+    cdef FluidGrid* fg
+
+
+cdef class FluidGridOwner(GridHandle):
+    def __cinit__(self, int nx, int ny, float init_diffusion, float init_viscosity, float dt, Precision precision):
+        self.fg = new_fg(nx, ny, init_diffusion, init_viscosity, dt, precision)
+
+    def __dealloc__(self):
+        if self.fg != NULL:
+            del_fg(self.fg)
+            self.fg = NULL
+
+
+cdef class BatchMemberHandle(GridHandle):
+    # the batch that owns (and frees) `fg`, kept alive for as long as this handle is:
+    cdef object batch
+
+
+#
+#
+# `BatchGridOwner`: the grids of a `BatchSimulator`.
+# - each attribute is allocated once for the whole batch, as `batch_size` consecutive (size x size) arrays; member b's
+#   `FluidGrid` points at the b-th array of each block and does not own it (see `FluidGrid.owns_fields`).
+# - everything else (settings, telemetry, pressure solver scratch memory) stays per member.
+#
+#
+
+cdef class BatchGridOwner:
+    cdef int batch_size
+    cdef int thread_count
+    cdef FluidGrid** grids
+
+    # the six attribute blocks, in `SNAPSHOT_FIELD_NAMES` order:
+    cdef float* blocks[6]
+
+    def __cinit__(self, int batch_size, int n):
+        cdef float* fields[6]
+        cdef int b, k
+        cdef int cell_count = (n + 2) * (n + 2)
+
+        self.batch_size = batch_size
+        self.thread_count = 1
+        self.grids = <FluidGrid**>calloc(batch_size, sizeof(FluidGrid*))
+        for k in range(6):
+            self.blocks[k] = <float*>calloc(batch_size * cell_count, sizeof(float))
+
+        for b in range(batch_size):
+            fg = new_fg_header(n, n, 0, 0, 0)
+            fg.owns_fields = False
+            fg.density = self.blocks[0] + b * cell_count
+            fg.vx = self.blocks[1] + b * cell_count
+            fg.vy = self.blocks[2] + b * cell_count
+            fg.density_prev = self.blocks[3] + b * cell_count
+            fg.vx_prev = self.blocks[4] + b * cell_count
+            fg.vy_prev = self.blocks[5] + b * cell_count
+            self.grids[b] = fg
+
+    def __dealloc__(self):
+        cdef int b, k
+
+        if self.grids != NULL:
+            for b in range(self.batch_size):
+                if self.grids[b] != NULL:
+                    del_fg(self.grids[b])
+            free(<void*>self.grids)
+            self.grids = NULL
+
+        for k in range(6):
+            free(<void*>self.blocks[k])
+            self.blocks[k] = NULL
+
+
+cdef BatchGridOwner batch_of(object batch_sim):
+    owner = batch_sim.batch_grid
+    if owner is None:
+        raise ValueError("this BatchSimulator has been disposed")
+    return <BatchGridOwner>owner
+
+
+def broadcast_member_values(values, batch_size):
+    return np.ascontiguousarray(np.broadcast_to(np.asarray(values, dtype=np.float32), (batch_size,)))
+
+
+cdef inline FluidGrid* grid_of(object sim) except NULL:
+    """
+    Retrieves the `FluidGrid` owned by a `Simulator`.
+    :param sim: the simulator whose grid to look up.
+    :return: the simulator's grid
+    """
+
+    owner = sim.grid
+    if owner is None:
+        raise ValueError("this Simulator has been disposed")
+    return (<GridHandle>owner).fg
+
+
+#
+#
+# Snapshots: copies of a grid's state, for rewinding, forking runs from a common state, or recovering from a crash.
+# - a `GridSnapshot` holds the six attribute arrays back to back in one block, so taking or restoring one is six
+#   `memcpy`s, and saving or loading one is a single write or read.
+# - snapshot files are a 64-byte little-endian header (see `snapshot_header_format`), then the six arrays as native
+#   float32, in `SNAPSHOT_FIELD_NAMES` order.
+#
+#
+
+SNAPSHOT_FIELD_NAMES = ('density', 'vx', 'vy', 'density_prev', 'vx_prev', 'vy_prev')
+SNAPSHOT_FILE_MAGIC = b"FLUIDSNP"
+SNAPSHOT_FORMAT_VERSION = 3
+
+# magic, format version, nx, ny, dt, diffusion, viscosity, step index, time rate, padding:
+# - version 1 files held square grids, with n and size = n + 2 in place of nx and ny; they still load.
+# - version 1 and 2 files held no time rate (zero padding in its place); they still load, with `time_rate` None.
+snapshot_header_format = struct.Struct("<8sIIIdddqd4x")
+
+
+cdef class GridSnapshot:
+    cdef readonly int nx
+    cdef readonly int ny
+    cdef readonly int size_x
+    cdef readonly int size_y
+    # the simulator's `time_rate`, kept apart from the float32 `dt` so `Simulator.restore` gets it back exactly:
+    cdef readonly object time_rate
+    cdef readonly float dt
+    cdef readonly float diffusion
+    cdef readonly float viscosity
+    cdef readonly long step_index
+
+    # the six attribute arrays, back to back in `SNAPSHOT_FIELD_NAMES` order:
+    cdef float* data
+
+    def __cinit__(self, int nx, int ny):
+        self.nx = nx
+        self.ny = ny
+        self.size_x = nx + 2
+        self.size_y = ny + 2
+        self.data = <float*>malloc(len(SNAPSHOT_FIELD_NAMES) * self.size_x * self.size_y * sizeof(float))
+        if self.data == NULL:
+            raise MemoryError()
+
+    def __dealloc__(self):
+        free(<void*>self.data)
+
+    @property
+    def nbytes(self):
+        return len(SNAPSHOT_FIELD_NAMES) * self.size_x * self.size_y * sizeof(float)
+
+    def field_view(self, field_name):
+        """
+        :param field_name: one of `SNAPSHOT_FIELD_NAMES`
+        :return: a zero-copy (nx + 2, ny + 2) float32 view of one of the snapshot's arrays, indexed as [x, y].
+        """
+        cdef Py_ssize_t k = SNAPSHOT_FIELD_NAMES.index(field_name)
+        return new_field_view(self, self.data + k * self.size_x * self.size_y, self.size_x, self.size_y)
+
+    def save(self, path):
+        """
+        Saves this snapshot to a file (see `Simulator.save_snapshot`).
+        """
+        header = pack_snapshot_header(
+            self.nx, self.ny, self.dt, self.diffusion, self.viscosity, self.step_index, self.time_rate
+        )
+        write_snapshot_file(path, header, [self.block_view()])
+
+    cdef block_view(self):
+        # all six arrays as one flat view, for single-call file I/O; the view does not keep the snapshot alive.
+        cdef float[::1] block = <float[:len(SNAPSHOT_FIELD_NAMES) * self.size_x * self.size_y]>self.data
+        return block
+
+
+def load_grid_snapshot(path):
+    """
+    Reads a snapshot file written by `Simulator.save_snapshot` or `GridSnapshot.save`.
+    :return: the `GridSnapshot`
+    """
+
+    cdef GridSnapshot snapshot
+
+    with open(path, "rb") as snapshot_file:
+        header = snapshot_file.read(snapshot_header_format.size)
+        if len(header) != snapshot_header_format.size:
+            raise ValueError(f"{path!r} is too short to be a snapshot")
+        magic, version, nx, ny, dt, diffusion, viscosity, step_index, time_rate = snapshot_header_format.unpack(header)
+        if magic != SNAPSHOT_FILE_MAGIC:
+            raise ValueError(f"{path!r} is not a snapshot")
+        if version == 1:
+            # the header's (n, size) pair of a square grid:
+            ny = nx
+        elif version != SNAPSHOT_FORMAT_VERSION and version != 2:
+            raise ValueError(f"{path!r} has unsupported snapshot format version {version}")
+
+        snapshot = GridSnapshot(nx, ny)
+        # a zero time rate stands for none (see `pack_snapshot_header`): `restore` then derives it from `dt`, which
+        # is zero too for a simulator paused at time rate 0.
+        snapshot.time_rate = time_rate or None
+        snapshot.dt = dt
+        snapshot.diffusion = diffusion
+        snapshot.viscosity = viscosity
+        snapshot.step_index = step_index
+        if snapshot_file.readinto(snapshot.block_view()) != snapshot.nbytes or snapshot_file.read(1):
+            raise ValueError(f"{path!r} does not hold the {snapshot.nbytes} bytes of data expected for {nx}x{ny} cells")
+
+    return snapshot
+
+
+def pack_snapshot_header(nx, ny, dt, diffusion, viscosity, step_index, time_rate):
+    # snapshots loaded from files of format version < 3 have no time rate: 0 stands for none, as in those files'
+    # padding.
+    return snapshot_header_format.pack(
+        SNAPSHOT_FILE_MAGIC, SNAPSHOT_FORMAT_VERSION, nx, ny, dt, diffusion, viscosity, step_index,
+        0.0 if time_rate is None else time_rate
+    )
+
+
+def write_snapshot_file(path, header, buffers):
+    temp_path = f"{os.fspath(path)}.tmp"
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(header)
+        for buffer in buffers:
+            snapshot_file.write(buffer)
+    os.replace(temp_path, path)
+
+
+cdef void fg_field_pointers(FluidGrid* fg, void** fields) noexcept nogil:
+    # the grid's attribute arrays, in `SNAPSHOT_FIELD_NAMES` order:
+    fields[0] = fg.density
+    fields[1] = fg.vx
+    fields[2] = fg.vy
+    fields[3] = fg.density_prev
+    fields[4] = fg.vx_prev
+    fields[5] = fg.vy_prev
+
+
+cdef void copy_fg_fields(FluidGrid* fg, float* block, bint to_block) noexcept nogil:
+    """
+    Copies all six attribute arrays between a grid and a snapshot block, converting a double-precision grid's values.
+    :param to_block: if True, copies from the grid into `block`, else from `block` into the grid.
+    """
+
+    cdef void* fields[6]
+    cdef double* field
+    cdef int k, i
+    fg_field_pointers(fg, fields)
+    for k in range(6):
+        if fg.precision == PRECISION_CODE_DOUBLE:
+            field = <double*>fields[k]
+            for i in range(fg.cell_count):
+                if to_block:
+                    block[k * fg.cell_count + i] = <float>field[i]
+                else:
+                    field[i] = block[k * fg.cell_count + i]
+        elif to_block:
+            memcpy(block + k * fg.cell_count, fields[k], fg.cell_count * sizeof(float))
+        else:
+            memcpy(fields[k], block + k * fg.cell_count, fg.cell_count * sizeof(float))
+
+
+#
+#
+# Zero-copy field access:
+# - `FieldBuffer` exposes a C attribute array through the buffer protocol, so NumPy can alias it without copying.
+# - data is column-major (see `ix`), so a C-contiguous (size_x, size_y) array indexed [x, y] matches `ix(fg, x, y)`.
+#
+#
+
+cdef class FieldBuffer:
+    cdef void* data
+    cdef Py_ssize_t itemsize
+    cdef int ndim
+    cdef Py_ssize_t shape[3]
+    cdef Py_ssize_t strides[3]
+
+    # keeps the owning simulator alive for as long as any view exists:
+    cdef object owner
+
+    def __getbuffer__(self, Py_buffer* buffer, int flags):
+        buffer.buf = <void*>self.data
+        buffer.obj = self
+        buffer.len = self.shape[0] * self.shape[1] * self.itemsize
+        if self.ndim == 3:
+            buffer.len *= self.shape[2]
+        buffer.readonly = 0
+        buffer.itemsize = self.itemsize
+        buffer.format = 'd' if self.itemsize == sizeof(double) else 'f'
+        buffer.ndim = self.ndim
+        buffer.shape = self.shape
+        buffer.strides = self.strides
+        buffer.suboffsets = NULL
+        buffer.internal = NULL
+
+    def __releasebuffer__(self, Py_buffer* buffer):
+        pass
+
+
+cdef new_field_view(object owner, void* data, int size_x, int size_y, size_t itemsize=sizeof(float)):
+    """
+    Wraps a (size_x x size_y) attribute array in a NumPy array without copying it.
+    :param owner: the object that owns `data`; kept alive by the view.
+    :param data: the attribute array to alias.
+    :param size_x: the number of cells along x, including borders.
+    :param size_y: the number of cells along y, including borders.
+    :param itemsize: the size of `data`'s values: `sizeof(float)` or `sizeof(double)`.
+    :return: a writable (size_x, size_y) float32 (or float64) `np.ndarray`.
+    """
+
+    cdef FieldBuffer field_buffer = FieldBuffer.__new__(FieldBuffer)
+    field_buffer.data = data
+    field_buffer.itemsize = itemsize
+    field_buffer.ndim = 2
+    field_buffer.shape[0] = size_x
+    field_buffer.shape[1] = size_y
+    field_buffer.strides[0] = size_y * itemsize
+    field_buffer.strides[1] = itemsize
+    field_buffer.owner = owner
+    return np.asarray(field_buffer)
+
+
+cdef new_block_view(object owner, float* data, int batch_size, int size_x, int size_y):
+    """
+    Wraps a block of `batch_size` consecutive (size_x x size_y) attribute arrays in a NumPy array without copying it.
+    :return: a writable (batch_size, size_x, size_y) float32 `np.ndarray` (see `new_field_view`).
+    """
+
+    cdef FieldBuffer field_buffer = FieldBuffer.__new__(FieldBuffer)
+    field_buffer.data = data
+    field_buffer.itemsize = sizeof(float)
+    field_buffer.ndim = 3
+    field_buffer.shape[0] = batch_size
+    field_buffer.shape[1] = size_x
+    field_buffer.shape[2] = size_y
+    field_buffer.strides[0] = size_x * size_y * sizeof(float)
+    field_buffer.strides[1] = size_y * sizeof(float)
+    field_buffer.strides[2] = sizeof(float)
+    field_buffer.owner = owner
+    return np.asarray(field_buffer)
+
+
+cdef fg_scatter_add(FluidGrid* fg, void* data, xs, ys, amounts):
+    # `scatter_add` on one of a grid's attribute arrays, typed by its precision:
+    if fg.precision == PRECISION_CODE_DOUBLE:
+        scatter_add(<double*>data, fg.size_x, fg.size_y, xs, ys, amounts)
+    else:
+        scatter_add(<float*>data, fg.size_x, fg.size_y, xs, ys, amounts)
+
+
+cdef scatter_add(real* data, int size_x, int size_y, xs, ys, amounts):
+    """
+    Adds `amounts` to the cells (xs, ys) of a (size_x x size_y) attribute array in one typed loop.
+    - all coordinates are checked before anything is written, so a bad index leaves the array untouched.
+    """
+
+    cdef Py_ssize_t[::1] flat_xs = np.ascontiguousarray(np.ravel(xs), dtype=np.intp)
+    cdef Py_ssize_t[::1] flat_ys = np.ascontiguousarray(np.ravel(ys), dtype=np.intp)
+    cdef const real[:] flat_amounts
+    cdef Py_ssize_t k, x, y
+
+    if flat_xs.shape[0] != flat_ys.shape[0]:
+        raise ValueError(f"got {flat_xs.shape[0]} x-coordinates but {flat_ys.shape[0]} y-coordinates")
+    amounts_dtype = np.float64 if real is double else np.float32
+    flat_amounts = np.ravel(np.broadcast_to(np.asarray(amounts, dtype=amounts_dtype), np.shape(xs)))
+
+    for k in range(flat_xs.shape[0]):
+        if not (0 <= flat_xs[k] < size_x and 0 <= flat_ys[k] < size_y):
+            raise IndexError(f"cell ({flat_xs[k]}, {flat_ys[k]}) lies outside a grid of shape ({size_x}, {size_y})")
+
+    for k in range(flat_xs.shape[0]):
+        x = flat_xs[k]
+        y = flat_ys[k]
+        data[x * size_y + y] += flat_amounts[k]
+
+
+def check_field_shape(view, field):
+    field = np.asarray(field)
+    if field.shape != view.shape:
+        raise ValueError(f"expected a field of shape {view.shape}, got {field.shape}")
+    return field
+
+
+def masked_add(view, mask, amount):
+    mask = check_field_shape(view, mask).astype(bool, copy=False)
+    amount = np.asarray(amount, dtype=view.dtype)
+    view[mask] += amount if amount.ndim == 0 else check_field_shape(view, amount)[mask]
+
+
+cdef copy_field_into(FluidGrid* fg, void* data, out):
+    # `copy_cells_into` from one of a grid's attribute arrays, typed by its precision:
+    if fg.precision == PRECISION_CODE_DOUBLE:
+        return copy_cells_into[double](<double*>data, fg.size_x, fg.size_y, out)
+    else:
+        return copy_cells_into[float](<float*>data, fg.size_x, fg.size_y, out)
+
+
+cdef copy_cells_into(real* data, int size_x, int size_y, real[:, ::1] out):
+    """
+    Copies a (size_x x size_y) attribute array into a preallocated buffer with a single `memcpy`.
+    :param data: the attribute array to copy.
+    :param size_x: the number of cells along x, including borders.
+    :param size_y: the number of cells along y, including borders.
+    :param out: the destination buffer; must be C-contiguous, of shape (size_x, size_y) and of `data`'s type.
+    :return: the base object of `out`
+    """
+
+    if out.shape[0] != size_x or out.shape[1] != size_y:
+        raise ValueError(f"expected a ({size_x}, {size_y}) output buffer, got ({out.shape[0]}, {out.shape[1]})")
+
+    memcpy(&out[0, 0], data, size_x * size_y * sizeof(real))
+    return out.base
+
+
+#
+#
+# `FluidGrid`: data for pressure & velocity of fluid
+# in a dense-enough rectangular grid of square cells.
+# - exists in C-space only, designed to be maximally efficient
+# - todo: consider if n = size (Ash) or n = size-2 (Stam) (using Stam)
+#
+#
+
+cdef struct SolveStats:
+    # the number of sweeps/V-cycles/iterations run, and the relative residual |rhs - A x| / |rhs| they left behind.
+    int iterations;
+    float residual;
+
+
+cdef struct StageTimes:
+    # cumulative wall-clock nanoseconds spent in each `TimedStage`, across all ticks:
+    long long ns[TIMED_STAGE_COUNT];
+
+
+cdef struct StageProfile:
+    # the time spent in each `TimedStage` over the last `window` ticks, kept as a ring of samples, and binned into one
+    # histogram per stage that is updated as samples enter and leave the ring:
+    int window;
+    int sample_count;
+    int next_sample;
+    long long* samples_ns;
+    int bin_counts[TIMED_STAGE_COUNT * PROFILE_BIN_COUNT];
+
+    # the running tick's times, pushed into the ring when it ends:
+    long long tick_ns[TIMED_STAGE_COUNT];
+
+
+cdef struct StepStats:
+    long step_index;
+    # the fraction of tiles the last tick processed (1 unless it was restricted to active tiles; see `ActiveTiles`):
+    float active_tile_fraction;
+    SolveStats diffuse_vx;
+    SolveStats diffuse_vy;
+    SolveStats project_diffused;
+    SolveStats project_advected;
+    SolveStats diffuse_density;
+
+
+cdef struct CellSpans:
+    # a set of interior cells, as runs along y: row x holds the cells (x, y) for y in [starts[s], stops[s]), for each s in
+    # [band_offsets[b], band_offsets[b+1]), where b = (x - 1) // rows_per_band.
+    int rows_per_band;
+    int* band_offsets;
+    int* starts;
+    int* stops;
+
+
+cdef struct ActiveTiles:
+    # the grid's interior, cut into (tiles_x x tiles_y) tiles of (tile_size x tile_size) cells; `tile_states` and
+    # `processed_tiles` are indexed [tx * tiles_y + ty], like cells.
+    int tile_size;
+    int tiles_x;
+    int tiles_y;
+
+    # TILE_ZERO, TILE_QUIESCENT or TILE_ACTIVE, as found by the last scan (see `scan_tiles`):
+    unsigned char* tile_states;
+
+    # the active tiles and their halo, i.e. the tiles the last restricted tick processed, and the same as `spans`:
+    unsigned char* processed_tiles;
+    int processed_tile_count;
+    CellSpans spans;
+
+
+cdef enum TileState:
+    TILE_ZERO
+    TILE_QUIESCENT
+    TILE_ACTIVE
+
+
+cdef struct FluidGrid:
+    # Voxel header data: (nx x ny) interior cells, within a border one cell wide, i.e. (size_x x size_y) cells.
+    int nx;
+    int ny;
+    int size_x;
+    int size_y;
+    int cell_count;
+
+    # the number of cells per unit length, i.e. 1 / the cell width: max(nx, ny), so the longer edge has length 1 and
+    # square grids are Stam's unit square. Diffusion, advection and projection all scale by it, on either axis.
+    int scale;
+
+    float dt;
+    float diffusion;
+    float viscosity;
+
+    # Per-voxel attribute arrays, of float or double values according to `precision`:
+    void* density;
+    void* vx;
+    void* vy;
+
+    # stores attributes of the last frame
+    void* density_prev;
+    void* vx_prev;
+    void* vy_prev;
+
+    Precision precision;
+
+    # the mixed precision's double-precision pressure and divergence arrays (NULL in the other precisions):
+    double* pressure_p;
+    double* pressure_div;
+
+    # False for the members of a batch, whose attribute arrays are slices of the batch's blocks:
+    bint owns_fields;
+
+    # Solver settings:
+    int thread_count;
+    RelaxationOrder relaxation_order;
+    PressureSolverCode pressure_solver;
+    int pressure_max_iterations;
+    float pressure_tolerance;
+
+    int diffusion_max_iterations;
+    float diffusion_tolerance;
+
+    # the number of relaxation sweeps run per pass over the grid (1 => one pass per sweep; see `linear_solve_blocked`):
+    int relaxation_block_depth;
+
+    # whether ticks run the fused kernels (see `velocity_step_fused`) instead of the staged ones:
+    bint fused_step_enabled;
+
+    # the cells the span-aware kernels visit: `all_cells`, except during a tick restricted to active tiles:
+    CellSpans* spans;
+    CellSpans all_cells;
+
+    # active-tile tracking settings, and its bitmaps (NULL while disabled; see `ActiveTiles`):
+    int active_tile_size;
+    int active_tile_halo;
+    float active_tile_threshold;
+    float active_tile_max_fraction;
+    ActiveTiles* active_tiles;
+
+    # obstacles: each cell's `ObstacleFlag` bits (NULL while the grid has no solid cells; see `mark_obstacle_cell`), the
+    # number of solid cells, and the wall condition at their walls:
+    unsigned char* obstacle_flags;
+    int solid_cell_count;
+    ObstacleSlipCode obstacle_slip;
+
+    # scratch memory for the multigrid and CG pressure solvers, allocated on first use:
+    PressureWorkspace* pressure_workspace;
+
+    # the advection scheme, and the field of scratch memory the corrected schemes need, allocated on first use:
+    AdvectionSchemeCode advection_scheme;
+    void* advection_scratch;
+
+    # solver telemetry, overwritten by every tick:
+    StepStats step_stats;
+
+    # per-stage timers, accumulated by every tick while enabled:
+    bint stage_timing_enabled;
+    StageTimes stage_times;
+
+    # the profiler, fed by the same timers (NULL while disabled; see `StageProfile`):
+    int profile_window;
+    StageProfile* profile;
+
+
+cdef enum Precision:
+    PRECISION_CODE_SINGLE
+    PRECISION_CODE_DOUBLE
+    PRECISION_CODE_MIXED
+
+
+cdef enum RelaxationOrder:
+    RELAXATION_ORDER_LEXICOGRAPHIC
+    RELAXATION_ORDER_RED_BLACK
+
+
+cdef enum PressureSolverCode:
+    PRESSURE_SOLVER_CODE_RELAXATION
+    PRESSURE_SOLVER_CODE_MULTIGRID
+    PRESSURE_SOLVER_CODE_CONJUGATE_GRADIENT
+
+
+cdef enum AdvectionSchemeCode:
+    ADVECTION_SCHEME_CODE_SEMI_LAGRANGIAN
+    ADVECTION_SCHEME_CODE_MACCORMACK
+    ADVECTION_SCHEME_CODE_BFECC
+
+
+cdef enum ObstacleSlipCode:
+    OBSTACLE_SLIP_CODE_NO_SLIP
+    OBSTACLE_SLIP_CODE_FREE_SLIP
+
+
+cdef enum ObstacleFlag:
+    # the bits of a cell's `FluidGrid.obstacle_flags`: whether the cell itself is solid, and which of its neighbors are.
+    OBSTACLE_SOLID_LEFT = 1     # (x - 1, y)
+    OBSTACLE_SOLID_RIGHT = 2    # (x + 1, y)
+    OBSTACLE_SOLID_DOWN = 4     # (x, y - 1)
+    OBSTACLE_SOLID_UP = 8       # (x, y + 1)
+    OBSTACLE_SOLID = 16
+
+
+cdef struct GridLevel:
+    # one level of the multigrid hierarchy: level 0 is the full grid, each further level halves `nx` and `ny`.
+    int nx;
+    int ny;
+    int size_x;
+    int size_y;
+    void* x;
+    void* rhs;
+    void* residual;
+
+
+cdef struct PressureWorkspace:
+    # every array below holds values of the grid's pressure precision, float or double (see `fg_pressure_value_size`);
+    # the solvers cast them to the type of the `p` they were given.
+    int level_count;
+    GridLevel* levels;
+
+    # conjugate-gradient vectors: residual, preconditioned residual, search direction, and A * search direction
+    void* cg_r;
+    void* cg_z;
+    void* cg_d;
+    void* cg_q;
+
+
+cdef inline int ix(FluidGrid* fg, int x, int y) noexcept nogil:
+    """
+    Translates (x, y) tuple into a flat (index) that can be used to look up
+    voxel attributes in an attribute list.
+    Note that data is stored in COLUMN major order.
+    :param fg: the grid whose encapsulated voxel attributes to look up. 
+    :param x: the x-index of the voxel to query.
+    :param y: the y-index of the voxel to query.
+    :return: a unique integer index used to access the properties of the voxel at (x,y) in fg. 
+    """
+
+    return (
+        (x * fg.size_y) +
+        (y * 1)
+    )
+
+
+cdef (FluidGrid*) new_fg(int nx, int ny, float diffusion, float viscosity, float dt, Precision precision):
+    """
+    Creates a new fluid rectangle. The method implemented is crucially stable over
+    large time-steps, making it suitable for slow dt.
+    :param nx: number of non-border cells along x
+    :param ny: number of non-border cells along y
+    :param diffusion: the simulation's diffusion constant
+    :param viscosity: the fluid's viscosity constant
+    :param dt: delta-time, a time-step used to simulate fluid movement.
+    :param precision: the type of the grid's values (see `Simulator.precision`)
+    :return: the new FluidGrid instance
+    """
+
+    fg = new_fg_header(nx, ny, diffusion, viscosity, dt)
+    fg.owns_fields = True
+    fg.precision = precision
+
+    voxel_count = fg.cell_count
+    value_size = fg_value_size(fg)
+
+    fg.density = calloc(voxel_count, value_size)
+    fg.vx = calloc(voxel_count, value_size)
+    fg.vy = calloc(voxel_count, value_size)
+
+    fg.density_prev = calloc(voxel_count, value_size)
+    fg.vx_prev = calloc(voxel_count, value_size)
+    fg.vy_prev = calloc(voxel_count, value_size)
+
+    if precision == PRECISION_CODE_MIXED:
+        fg.pressure_p = <double*>calloc(voxel_count, sizeof(double))
+        fg.pressure_div = <double*>calloc(voxel_count, sizeof(double))
+
+    return fg
+
+
+cdef (FluidGrid*) new_fg_header(int nx, int ny, float diffusion, float viscosity, float dt):
+    """
+    Allocates a grid and initializes everything but its attribute arrays, which the caller must set.
+    """
+
+    fg = <FluidGrid*>malloc(sizeof(FluidGrid))
+    fg.nx = nx
+    fg.ny = ny
+    fg.size_x = nx+2
+    fg.size_y = ny+2
+    fg.cell_count = fg.size_x * fg.size_y
+    fg.scale = max(nx, ny)
+    fg.dt = dt
+    fg.diffusion = diffusion
+    fg.viscosity = viscosity
+    fg.thread_count = 1
+    fg.relaxation_order = RELAXATION_ORDER_LEXICOGRAPHIC
+    fg.pressure_solver = PRESSURE_SOLVER_CODE_RELAXATION
+    fg.pressure_max_iterations = 20
+    fg.pressure_tolerance = 1e-4
+    fg.diffusion_max_iterations = 20
+    fg.diffusion_tolerance = 0
+    fg.relaxation_block_depth = 1
+    fg.fused_step_enabled = False
+    fg.all_cells.rows_per_band = nx
+    fg.all_cells.band_offsets = <int*>malloc(2 * sizeof(int))
+    fg.all_cells.starts = <int*>malloc(sizeof(int))
+    fg.all_cells.stops = <int*>malloc(sizeof(int))
+    fg.all_cells.band_offsets[0] = 0
+    fg.all_cells.band_offsets[1] = 1
+    fg.all_cells.starts[0] = 1
+    fg.all_cells.stops[0] = ny + 1
+    fg.spans = &fg.all_cells
+    fg.active_tile_size = 16
+    fg.active_tile_halo = 2
+    fg.active_tile_threshold = 1e-3
+    fg.active_tile_max_fraction = 0.5
+    fg.active_tiles = NULL
+    fg.obstacle_flags = NULL
+    fg.solid_cell_count = 0
+    fg.obstacle_slip = OBSTACLE_SLIP_CODE_NO_SLIP
+    fg.precision = PRECISION_CODE_SINGLE
+    fg.pressure_p = NULL
+    fg.pressure_div = NULL
+    fg.pressure_workspace = NULL
+    fg.advection_scheme = ADVECTION_SCHEME_CODE_SEMI_LAGRANGIAN
+    fg.advection_scratch = NULL
+    memset(&fg.step_stats, 0, sizeof(StepStats))
+    fg.step_stats.active_tile_fraction = 1
+    fg.stage_timing_enabled = False
+    memset(&fg.stage_times, 0, sizeof(StageTimes))
+    fg.profile_window = DEFAULT_PROFILE_WINDOW
+    fg.profile = NULL
+
+    return fg
+
+
+cdef inline size_t fg_value_size(FluidGrid* fg) noexcept nogil:
+    # the size of one value of the grid's fields:
+    return sizeof(double) if fg.precision == PRECISION_CODE_DOUBLE else sizeof(float)
+
+
+cdef inline size_t fg_pressure_value_size(FluidGrid* fg) noexcept nogil:
+    # the size of one value of the pressure solve's arrays:
+    return sizeof(float) if fg.precision == PRECISION_CODE_SINGLE else sizeof(double)
+
+
+cdef fg_soft_reset(FluidGrid* fg):
+    voxel_count = fg.cell_count
+    value_size = fg_value_size(fg)
+
+    memset(fg.density, 0, voxel_count * value_size)
+    memset(fg.vx, 0, voxel_count * value_size)
+    memset(fg.vy, 0, voxel_count * value_size)
+
+    memset(fg.density_prev, 0, voxel_count * value_size)
+    memset(fg.vx_prev, 0, voxel_count * value_size)
+    memset(fg.vy_prev, 0, voxel_count * value_size)
+
+
+cdef del_fg(FluidGrid* fg):
+    """
+    Deletes the argument fluid square, relinquishing all memory resources
+    used for it.
+    :param fg: the fluid-square to de-initialize.
+    """
+
+    if fg.owns_fields:
+        free(<void*>fg.density)
+        free(<void*>fg.vx)
+        free(<void*>fg.vy)
+
+        free(<void*>fg.density_prev)
+        free(<void*>fg.vx_prev)
+        free(<void*>fg.vy_prev)
+
+    free(<void*>fg.pressure_p)
+    free(<void*>fg.pressure_div)
+    del_pressure_workspace(fg.pressure_workspace)
+    free(fg.advection_scratch)
+    del_cell_spans(&fg.all_cells)
+    del_active_tiles(fg.active_tiles)
+    free(<void*>fg.obstacle_flags)
+    del_stage_profile(fg.profile)
+
+    free(<void*>fg)
+
+
+cdef fg_ensure_advection_scratch(FluidGrid* fg):
+    """
+    Allocates the field of scratch memory used by the corrected advection schemes, unless already allocated.
+    """
+
+    if fg.advection_scratch == NULL:
+        fg.advection_scratch = calloc(fg.cell_count, fg_value_size(fg))
+        if fg.advection_scratch == NULL:
+            raise MemoryError("cannot allocate the advection scheme's scratch field")
+
+
+cdef fg_ensure_pressure_workspace(FluidGrid* fg):
+    """
+    Allocates the multigrid hierarchy and CG vectors used by the iterative pressure solvers, unless already allocated.
+    - levels are halved while `nx` and `ny` stay even and at least `min_coarse_n`, so power-of-two grids coarsen best.
+    :param fg: the grid whose pressure solve needs scratch memory.
+    """
+
+    cdef int min_coarse_n = 4
+    cdef size_t value_size = fg_pressure_value_size(fg)
+    cdef int level_count, level_nx, level_ny, l
+    cdef GridLevel* level
+    cdef PressureWorkspace* ws
+
+    if fg.pressure_workspace != NULL:
+        return
+
+    level_count = 1
+    level_nx = fg.nx
+    level_ny = fg.ny
+    while (
+        level_nx % 2 == 0 and level_ny % 2 == 0 and
+        level_nx // 2 >= min_coarse_n and level_ny // 2 >= min_coarse_n
+    ):
+        level_nx //= 2
+        level_ny //= 2
+        level_count += 1
+
+    ws = <PressureWorkspace*>calloc(1, sizeof(PressureWorkspace))
+    ws.level_count = level_count
+    ws.levels = <GridLevel*>calloc(level_count, sizeof(GridLevel))
+
+    level_nx = fg.nx
+    level_ny = fg.ny
+    for l in range(level_count):
+        level = &ws.levels[l]
+        level.nx = level_nx
+        level.ny = level_ny
+        level.size_x = level_nx + 2
+        level.size_y = level_ny + 2
+        level.residual = calloc(level.size_x * level.size_y, value_size)
+
+        # level 0 solves in-place on `project`'s own `p` and `div` buffers:
+        if l > 0:
+            level.x = calloc(level.size_x * level.size_y, value_size)
+            level.rhs = calloc(level.size_x * level.size_y, value_size)
+
+        level_nx //= 2
+        level_ny //= 2
+
+    ws.cg_r = calloc(fg.cell_count, value_size)
+    ws.cg_z = calloc(fg.cell_count, value_size)
+    ws.cg_d = calloc(fg.cell_count, value_size)
+    ws.cg_q = calloc(fg.cell_count, value_size)
+
+    fg.pressure_workspace = ws
+
+
+cdef del_pressure_workspace(PressureWorkspace* ws):
+    cdef int l
+
+    if ws == NULL:
+        return
+
+    for l in range(ws.level_count):
+        free(ws.levels[l].residual)
+        if l > 0:
+            free(ws.levels[l].x)
+            free(ws.levels[l].rhs)
+    free(<void*>ws.levels)
+
+    free(ws.cg_r)
+    free(ws.cg_z)
+    free(ws.cg_d)
+    free(ws.cg_q)
+
+    free(<void*>ws)
+
+
+cdef fg_enable_profile(FluidGrid* fg):
+    """
+    (Re)allocates an empty profile of the grid's current `profile_window` ticks.
+    """
+
+    cdef StageProfile* profile
+
+    del_stage_profile(fg.profile)
+
+    profile = <StageProfile*>calloc(1, sizeof(StageProfile))
+    profile.window = fg.profile_window
+    profile.samples_ns = <long long*>calloc(profile.window * TIMED_STAGE_COUNT, sizeof(long long))
+
+    fg.profile = profile
+
+
+cdef del_stage_profile(StageProfile* profile):
+    if profile == NULL:
+        return
+
+    free(<void*>profile.samples_ns)
+    free(<void*>profile)
+
+
+cdef fg_enable_active_tiles(FluidGrid* fg):
+    """
+    (Re)allocates the active-tile bitmaps for the grid's current `active_tile_size`.
+    """
+
+    cdef ActiveTiles* tiles
+    cdef int tile_count
+
+    del_active_tiles(fg.active_tiles)
+
+    tiles = <ActiveTiles*>calloc(1, sizeof(ActiveTiles))
+    tiles.tile_size = fg.active_tile_size
+    tiles.tiles_x = (fg.nx + tiles.tile_size - 1) // tiles.tile_size
+    tiles.tiles_y = (fg.ny + tiles.tile_size - 1) // tiles.tile_size
+    tile_count = tiles.tiles_x * tiles.tiles_y
+    tiles.tile_states = <unsigned char*>calloc(tile_count, sizeof(unsigned char))
+    tiles.processed_tiles = <unsigned char*>calloc(tile_count, sizeof(unsigned char))
+
+    # each band of tiles holds at most one run per processed tile:
+    tiles.spans.rows_per_band = tiles.tile_size
+    tiles.spans.band_offsets = <int*>calloc(tiles.tiles_x + 1, sizeof(int))
+    tiles.spans.starts = <int*>calloc(tile_count, sizeof(int))
+    tiles.spans.stops = <int*>calloc(tile_count, sizeof(int))
+    mark_all_tiles_processed(tiles)
+
+    fg.active_tiles = tiles
+
+
+cdef del_active_tiles(ActiveTiles* tiles):
+    if tiles == NULL:
+        return
+
+    free(<void*>tiles.tile_states)
+    free(<void*>tiles.processed_tiles)
+    del_cell_spans(&tiles.spans)
+    free(<void*>tiles)
+
+
+cdef del_cell_spans(CellSpans* spans):
+    free(<void*>spans.band_offsets)
+    free(<void*>spans.starts)
+    free(<void*>spans.stops)
+
+
+cdef check_cell_in_bounds(FluidGrid* fg, int x, int y):
+    if not (0 <= x < fg.size_x and 0 <= y < fg.size_y):
+        raise IndexError(f"cell ({x}, {y}) lies outside a grid of shape ({fg.size_x}, {fg.size_y})")
+
+
+cdef fg_add_density(FluidGrid* fg, int x, int y, float amount):
+    """
+    Add fluid density (as though from a source) at the specified cell. 
+    :param fg: the container fluid-square to update
+    :param x: the x-coordinate at which to add density
+    :param y: the y-coordinate at which to add density
+    :param amount: the amount of fluid to add per-cell
+    """
+
+    check_cell_in_bounds(fg, x, y)
+    add_to_cell(fg, fg.density, ix(fg, x, y), amount)
+
+
+cdef fg_add_velocity(FluidGrid* fg, int x, int y, float amount_x, float amount_y):
+    """
+    Increment the velocity of all fluid-mass in a cell
+    :param fg: the container fluid-square to update
+    :param x: the X-coordinate at which to add velocity
+    :param y: the Y-coordinate at which to add velocity
+    :param amount_x: the amount of velocity to add along the X-axis
+    :param amount_y: the amount of velocity to add along the Y-axis
+    :return: 
+    """
+
+    check_cell_in_bounds(fg, x, y)
+    cdef int index = ix(fg, x, y)
+    add_to_cell(fg, fg.vx, index, amount_x)
+    add_to_cell(fg, fg.vy, index, amount_y)
+
+
+cdef inline void add_to_cell(FluidGrid* fg, void* field, int index, float amount) noexcept nogil:
+    if fg.precision == PRECISION_CODE_DOUBLE:
+        (<double*>field)[index] += amount
+    else:
+        (<float*>field)[index] += amount
+
+
+cdef fg_set_obstacles(FluidGrid* fg, const unsigned char[:, ::1] mask):
+    """
+    Replaces the grid's obstacles: interior cell (x, y) becomes solid if `mask[x, y]` is non-zero; border cells are
+    ignored, as they are walls already.
+    :param mask: a (size_x x size_y) array, indexed as [x, y]
+    """
+
+    cdef int i, j
+
+    fg_clear_obstacles(fg)
+    fg.obstacle_flags = <unsigned char*>calloc(fg.cell_count, sizeof(unsigned char))
+    for i in range(1, fg.nx+1):
+        for j in range(1, fg.ny+1):
+            if mask[i, j]:
+                mark_obstacle_cell(fg, i, j, True)
+
+    if fg.solid_cell_count == 0:
+        fg_clear_obstacles(fg)
+
+
+cdef fg_update_obstacles(FluidGrid* fg, xs, ys, bint solid):
+    """
+    Turns the interior cells (xs, ys) solid, or back into fluid, leaving the grid's other cells alone.
+    - all coordinates are checked before anything is written, so a bad index leaves the obstacles untouched.
+    """
+
+    cdef Py_ssize_t[::1] flat_xs = np.ascontiguousarray(np.ravel(xs), dtype=np.intp)
+    cdef Py_ssize_t[::1] flat_ys = np.ascontiguousarray(np.ravel(ys), dtype=np.intp)
+    cdef Py_ssize_t k
+
+    if flat_xs.shape[0] != flat_ys.shape[0]:
+        raise ValueError(f"got {flat_xs.shape[0]} x-coordinates but {flat_ys.shape[0]} y-coordinates")
+    for k in range(flat_xs.shape[0]):
+        if not (1 <= flat_xs[k] <= fg.nx and 1 <= flat_ys[k] <= fg.ny):
+            raise IndexError(
+                f"cell ({flat_xs[k]}, {flat_ys[k]}) is not an interior cell of a grid of shape ({fg.size_x}, "
+                f"{fg.size_y})"
+            )
+
+    if fg.obstacle_flags == NULL:
+        if not solid:
+            return
+        fg.obstacle_flags = <unsigned char*>calloc(fg.cell_count, sizeof(unsigned char))
+    for k in range(flat_xs.shape[0]):
+        mark_obstacle_cell(fg, <int>flat_xs[k], <int>flat_ys[k], solid)
+
+    if fg.solid_cell_count == 0:
+        fg_clear_obstacles(fg)
+
+
+cdef fg_clear_obstacles(FluidGrid* fg):
+    free(<void*>fg.obstacle_flags)
+    fg.obstacle_flags = NULL
+    fg.solid_cell_count = 0
+
+
+cdef void mark_obstacle_cell(FluidGrid* fg, int x, int y, bint solid) noexcept nogil:
+    """
+    makes interior cell (x, y) solid or fluid, and flags it as such to its 4 neighbors, so that the kernels find
+    everything they need about obstacles in the flags of the cell they update.
+    - a cell made solid loses its density, velocity and sources: obstacles hold no fluid.
+    """
+
+    cdef unsigned char* flags = fg.obstacle_flags
+    cdef int k = ix(fg, x, y)
+    cdef size_t value_size = fg_value_size(fg)
+    cdef void* fields[6]
+    cdef int f
+
+    if ((flags[k] & OBSTACLE_SOLID) != 0) == solid:
+        return
+
+    if solid:
+        flags[k] |= OBSTACLE_SOLID
+        flags[ix(fg, x + 1, y)] |= OBSTACLE_SOLID_LEFT
+        flags[ix(fg, x - 1, y)] |= OBSTACLE_SOLID_RIGHT
+        flags[ix(fg, x, y + 1)] |= OBSTACLE_SOLID_DOWN
+        flags[ix(fg, x, y - 1)] |= OBSTACLE_SOLID_UP
+        fg.solid_cell_count += 1
+
+        fg_field_pointers(fg, fields)
+        for f in range(6):
+            memset(<char*>fields[f] + k * value_size, 0, value_size)
+    else:
+        flags[k] &= ~OBSTACLE_SOLID
+        flags[ix(fg, x + 1, y)] &= ~OBSTACLE_SOLID_LEFT
+        flags[ix(fg, x - 1, y)] &= ~OBSTACLE_SOLID_RIGHT
+        flags[ix(fg, x, y + 1)] &= ~OBSTACLE_SOLID_DOWN
+        flags[ix(fg, x, y - 1)] &= ~OBSTACLE_SOLID_UP
+        fg.solid_cell_count -= 1
+
+
+#
+#
+# Solver kernels:
+# - everything below is typed C, runs without the GIL, and is compiled without bounds/wraparound checks (see the
+#   directives atop this file).
+#
+#
+
+cdef void advance_fg_state_by_one_tick(FluidGrid* fg) noexcept nogil:
+    """
+    Advances the FluidGrid state by one tick, accounting for all fluid flow within.
+    :param fg: the FluidGrid instance within which fluid sloshes about.
+    """
+
+    cdef long long t = stage_timer_start(fg)
+
+    if fg.precision == PRECISION_CODE_DOUBLE:
+        advance_fields(
+            fg, <double*>fg.density, <double*>fg.vx, <double*>fg.vy,
+            <double*>fg.density_prev, <double*>fg.vx_prev, <double*>fg.vy_prev, <double*>NULL, <double*>NULL
+        )
+    elif fg.precision == PRECISION_CODE_MIXED:
+        advance_fields(
+            fg, <float*>fg.density, <float*>fg.vx, <float*>fg.vy,
+            <float*>fg.density_prev, <float*>fg.vx_prev, <float*>fg.vy_prev, fg.pressure_p, fg.pressure_div
+        )
+    else:
+        advance_fields(
+            fg, <float*>fg.density, <float*>fg.vx, <float*>fg.vy,
+            <float*>fg.density_prev, <float*>fg.vx_prev, <float*>fg.vy_prev, <float*>NULL, <float*>NULL
+        )
+    fg.step_stats.step_index += 1
+
+    # the `_prev` buffers doubled as solver scratch space, and become the (empty) sources of the next tick:
+    clear_sources(fg)
+    fg.spans = &fg.all_cells
+
+    stage_timer_lap(fg, TIMED_STAGE_STEP, t)
+    if fg.profile != NULL:
+        end_profile_tick(fg.profile)
+
+
+cdef void advance_density_by_one_tick(FluidGrid* fg) noexcept nogil:
+    """
+    Advances the FluidGrid's density by one tick through its velocity, which is left unchanged (see
+    `Simulator.step_density`).
+    """
+
+    cdef long long t = stage_timer_start(fg)
+
+    if fg.precision == PRECISION_CODE_DOUBLE:
+        density_step(
+            fg, <double*>fg.density, <double*>fg.density_prev, <double*>fg.vx, <double*>fg.vy, fg.diffusion, fg.dt
+        )
+    else:
+        density_step(fg, <float*>fg.density, <float*>fg.density_prev, <float*>fg.vx, <float*>fg.vy, fg.diffusion, fg.dt)
+    fg.step_stats.step_index += 1
+
+    # `density_prev` doubled as solver scratch space; the velocity sources are still pending:
+    memset(fg.density_prev, 0, fg.cell_count * fg_value_size(fg))
+
+    stage_timer_lap(fg, TIMED_STAGE_STEP, t)
+    if fg.profile != NULL:
+        end_profile_tick(fg.profile)
+
+
+cdef void advance_batch_by_one_tick(FluidGrid** grids, int batch_size, int thread_count) noexcept nogil:
+    # members run their own kernels single-threaded: the parallelism is over members.
+    cdef int b
+    for b in prange(batch_size, num_threads=thread_count, schedule='dynamic'):
+        advance_fg_state_by_one_tick(grids[b])
+
+
+cdef void advance_fields(
+        FluidGrid* fg, real* density, real* vx, real* vy, real* density_prev, real* vx_prev, real* vy_prev,
+        pressure_real* p, pressure_real* div
+) noexcept nogil:
+    """
+    runs one tick's steps on the grid's fields, typed by its precision (see `velocity_step` for `p` and `div`).
+    """
+
+    fg.step_stats.active_tile_fraction = 1
+    if fg.active_tiles != NULL:
+        restrict_to_active_tiles(fg, density, vx, vy, density_prev, vx_prev, vy_prev)
+        if fg.spans != &fg.all_cells and fg.pressure_p != NULL:
+            # the pressure solve only clears `p` over the active tiles, and relies on it being 0 elsewhere:
+            memset(fg.pressure_p, 0, fg.cell_count * sizeof(double))
+
+    if fg.fused_step_enabled and fg.obstacle_flags == NULL:
+        velocity_step_fused(fg, vx, vy, vx_prev, vy_prev, p, div, fg.viscosity, fg.dt)
+        density_step_fused(fg, density, density_prev, vx, vy, fg.diffusion, fg.dt)
+    else:
+        velocity_step(fg, vx, vy, vx_prev, vy_prev, p, div, fg.viscosity, fg.dt)
+        density_step(fg, density, density_prev, vx, vy, fg.diffusion, fg.dt)
+
+
+cdef void velocity_step(
+        FluidGrid* fg, real* u, real* v, real* u0, real* v0, pressure_real* p, pressure_real* div, float visc, float dt
+) noexcept nogil:
+    """
+    :param p: the pressure solve's scratch arrays, `p` and `div`, or NULL to solve in `u0` and `v0`, which are free
+        while `project` runs. The mixed precision solves pressure in double, so it cannot reuse float fields.
+    """
+
+    cdef long long t = stage_timer_start(fg)
+    add_source(fg, u, u0, dt)
+    add_source(fg, v, v0, dt)
+    t = stage_timer_lap(fg, TIMED_STAGE_ADD_SOURCE, t)
+
+    swap(&u0, &u)
+    fg.step_stats.diffuse_vx = diffuse(fg, 1, u, u0, visc, dt)
+
+    swap(&v0, &v)
+    fg.step_stats.diffuse_vy = diffuse(fg, 2, v, v0, visc, dt)
+    t = stage_timer_lap(fg, TIMED_STAGE_DIFFUSE, t)
+
+    if p == NULL:
+        fg.step_stats.project_diffused = project(fg, u, v, u0, v0)
+    else:
+        fg.step_stats.project_diffused = project(fg, u, v, p, div)
+    t = stage_timer_lap(fg, TIMED_STAGE_PROJECT, t)
+
+    swap(&u0, &u)
+    swap(&v0, &v)
+
+    advect(fg, 1, u, u0, u0, v0, dt)
+    advect(fg, 2, v, v0, u0, v0, dt)
+    t = stage_timer_lap(fg, TIMED_STAGE_ADVECT, t)
+
+    if p == NULL:
+        fg.step_stats.project_advected = project(fg, u, v, u0, v0)
+    else:
+        fg.step_stats.project_advected = project(fg, u, v, p, div)
+    stage_timer_lap(fg, TIMED_STAGE_PROJECT, t)
+
+
+cdef void density_step(FluidGrid* fg, real* x, real* x0, real* u, real* v, float diff, float dt) noexcept nogil:
+    cdef long long t = stage_timer_start(fg)
+    add_source(fg, x, x0, dt)
+    t = stage_timer_lap(fg, TIMED_STAGE_ADD_SOURCE, t)
+
+    swap(&x0, &x)
+    fg.step_stats.diffuse_density = diffuse(fg, 0, x, x0, diff, dt)
+    t = stage_timer_lap(fg, TIMED_STAGE_DIFFUSE, t)
+
+    swap(&x0, &x)
+    advect(fg, 0, x, x0, u, v, dt)
+    stage_timer_lap(fg, TIMED_STAGE_ADVECT, t)
+
+
+cdef void velocity_step_fused(
+        FluidGrid* fg, real* u, real* v, real* u0, real* v0, pressure_real* p, pressure_real* div, float visc, float dt
+) noexcept nogil:
+    """
+    `velocity_step` with fewer passes over the grid, and identical results:
+    - the sources are added inside the first diffusion sweep, cell by cell, rather than in 2 passes of their own;
+    - both components diffuse in the same sweeps (see `linear_solve_pair`);
+    - `project` and `advect` set border cells inline (see `project_fused`), and both components advect in one pass,
+      under the semi-Lagrangian scheme (the corrected schemes run `advect`).
+    """
+
+    cdef long long t = stage_timer_start(fg)
+    cdef real a = dt * visc * fg.scale * fg.scale
+
+    # after the swaps, `u`/`v` hold the sources (and serve as initial guesses), `u0`/`v0` the velocities to add them to:
+    swap(&u0, &u)
+    swap(&v0, &v)
+    linear_solve_pair(
+        fg, 1, u, u0, 2, v, v0, a, 1.0 / (1.0 + 4.0*a),
+        fg.diffusion_max_iterations, fg.diffusion_tolerance, dt,
+        &fg.step_stats.diffuse_vx, &fg.step_stats.diffuse_vy
+    )
+    t = stage_timer_lap(fg, TIMED_STAGE_DIFFUSE, t)
+
+    if p == NULL:
+        fg.step_stats.project_diffused = project_fused(fg, u, v, u0, v0)
+    else:
+        fg.step_stats.project_diffused = project_fused(fg, u, v, p, div)
+    t = stage_timer_lap(fg, TIMED_STAGE_PROJECT, t)
+
+    swap(&u0, &u)
+    swap(&v0, &v)
+
+    if fg.advection_scheme == ADVECTION_SCHEME_CODE_SEMI_LAGRANGIAN:
+        advect_velocity(fg, u, v, u0, v0, dt)
+    else:
+        advect(fg, 1, u, u0, u0, v0, dt)
+        advect(fg, 2, v, v0, u0, v0, dt)
+    t = stage_timer_lap(fg, TIMED_STAGE_ADVECT, t)
+
+    if p == NULL:
+        fg.step_stats.project_advected = project_fused(fg, u, v, u0, v0)
+    else:
+        fg.step_stats.project_advected = project_fused(fg, u, v, p, div)
+    stage_timer_lap(fg, TIMED_STAGE_PROJECT, t)
+
+
+cdef void density_step_fused(
+        FluidGrid* fg, real* x, real* x0, real* u, real* v, float diff, float dt
+) noexcept nogil:
+    """
+    `density_step` with the source added inside the first diffusion sweep (see `velocity_step_fused`).
+    """
+
+    cdef long long t = stage_timer_start(fg)
+
+    swap(&x0, &x)
+    fg.step_stats.diffuse_density = diffuse(fg, 0, x, x0, diff, dt, True)
+    t = stage_timer_lap(fg, TIMED_STAGE_DIFFUSE, t)
+
+    swap(&x0, &x)
+    advect(fg, 0, x, x0, u, v, dt)
+    stage_timer_lap(fg, TIMED_STAGE_ADVECT, t)
+
+
+cdef inline long long monotonic_ns() noexcept nogil:
+    cdef timespec ts
+    clock_gettime(CLOCK_MONOTONIC, &ts)
+    return ts.tv_sec * 1000000000LL + ts.tv_nsec
+
+
+cdef inline long long stage_timer_start(FluidGrid* fg) noexcept nogil:
+    return monotonic_ns() if fg.stage_timing_enabled or fg.profile != NULL else 0
+
+
+cdef inline long long stage_timer_lap(FluidGrid* fg, TimedStage stage, long long start_ns) noexcept nogil:
+    """
+    adds the time elapsed since `start_ns` to `stage`'s total if stage timing is enabled, and to the running tick's
+    profile if profiling is. With both disabled, timers cost this one test.
+    :return: the current time, i.e. the start of the next stage
+    """
+
+    cdef long long now_ns
+
+    if not fg.stage_timing_enabled and fg.profile == NULL:
+        return 0
+    now_ns = monotonic_ns()
+    if fg.stage_timing_enabled:
+        fg.stage_times.ns[<int>stage] += now_ns - start_ns
+    if fg.profile != NULL:
+        fg.profile.tick_ns[<int>stage] += now_ns - start_ns
+    return now_ns
+
+
+cdef void end_profile_tick(StageProfile* profile) noexcept nogil:
+    """
+    pushes the running tick's times into the ring, evicting the oldest tick's if it is full, and starts the next tick.
+    """
+
+    cdef long long* sample = &profile.samples_ns[profile.next_sample * TIMED_STAGE_COUNT]
+    cdef int stage
+
+    for stage in range(TIMED_STAGE_COUNT):
+        if profile.sample_count == profile.window:
+            profile.bin_counts[stage * PROFILE_BIN_COUNT + profile_bin(sample[stage])] -= 1
+        sample[stage] = profile.tick_ns[stage]
+        profile.bin_counts[stage * PROFILE_BIN_COUNT + profile_bin(sample[stage])] += 1
+        profile.tick_ns[stage] = 0
+
+    profile.next_sample = (profile.next_sample + 1) % profile.window
+    if profile.sample_count < profile.window:
+        profile.sample_count += 1
+
+
+cdef inline int profile_bin(long long duration_ns) noexcept nogil:
+    # floor(log2(duration_ns)), clamped to the histogram's bins (see `PROFILE_BIN_COUNT`):
+    cdef int k = 0
+    while duration_ns > 1 and k < PROFILE_BIN_COUNT - 1:
+        duration_ns >>= 1
+        k += 1
+    return k
+
+
+cdef void clear_sources(FluidGrid* fg) noexcept nogil:
+    if fg.spans != &fg.all_cells:
+        # only the spans' cells and the border cells were written to since the last tick (see `ActiveTiles`):
+        clear_span_cells(fg, fg.density_prev)
+        clear_span_cells(fg, fg.vx_prev)
+        clear_span_cells(fg, fg.vy_prev)
+        return
+
+    memset(fg.density_prev, 0, fg.cell_count * fg_value_size(fg))
+    memset(fg.vx_prev, 0, fg.cell_count * fg_value_size(fg))
+    memset(fg.vy_prev, 0, fg.cell_count * fg_value_size(fg))
+
+
+cdef void clear_span_cells(FluidGrid* fg, void* data) noexcept nogil:
+    """
+    zeroes the cells of `fg.spans`, and the border cells, of one attribute array.
+    """
+
+    cdef CellSpans* spans = fg.spans
+    cdef size_t value_size = fg_value_size(fg)
+    cdef char* bytes = <char*>data
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int i, k, band
+
+    for i in range(1, 1+nx):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            memset(bytes + ix(fg, i, spans.starts[k]) * value_size, 0, (spans.stops[k] - spans.starts[k]) * value_size)
+        memset(bytes + ix(fg, i, 0) * value_size, 0, value_size)
+        memset(bytes + ix(fg, i, ny+1) * value_size, 0, value_size)
+
+    memset(bytes, 0, fg.size_y * value_size)
+    memset(bytes + ix(fg, nx+1, 0) * value_size, 0, fg.size_y * value_size)
+
+
+cdef void add_source(FluidGrid* fg, real* x, real* s, float dt) noexcept nogil:
+    """
+    adds `dt * s` into `x` over the interior cells of `fg.spans`. Border cells are left alone: every caller overwrites
+    them before reading them.
+    """
+
+    cdef CellSpans* spans = fg.spans
+    cdef int i, j, k, band
+
+    for i in prange(1, 1+fg.nx, num_threads=fg.thread_count, schedule='static'):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            for j in range(spans.starts[k], spans.stops[k]):
+                x[ix(fg, i, j)] += dt * s[ix(fg, i, j)]
+
+
+cdef inline void swap(real** xp, real** yp) noexcept nogil:
+    cdef real* tmp = xp[0]
+    xp[0] = yp[0]
+    yp[0] = tmp
+
+
+cdef void set_boundary_cells(FluidGrid* fg, int b, real* x) noexcept nogil:
+    cdef long long t = stage_timer_start(fg)
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int i
+    for i in range(1, 1+ny):
+        x[ix(fg, 0, i)] = (-x[ix(fg, 1, i)]) if b == 1 else (x[ix(fg, 1, i)])
+        x[ix(fg, nx+1, i)] = (-x[ix(fg, nx, i)]) if b == 1 else (x[ix(fg, nx, i)])
+    for i in range(1, 1+nx):
+        x[ix(fg, i, 0)] = (-x[ix(fg, i, 1)]) if b == 2 else (x[ix(fg, i, 1)])
+        x[ix(fg, i, ny+1)] = (-x[ix(fg, i, ny)]) if b == 2 else (x[ix(fg, i, ny)])
+
+    set_corner_cells(fg, x)
+    stage_timer_lap(fg, TIMED_STAGE_BOUNDARY, t)
+
+
+cdef inline void set_corner_cells(FluidGrid* fg, real* x) noexcept nogil:
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    x[ix(fg, 0, 0)] = 0.5 * (x[ix(fg, 1, 0)] + x[ix(fg, 0, 1)])
+    x[ix(fg, 0, ny+1)] = 0.5 * (x[ix(fg, 1, ny + 1)] + x[ix(fg, 0, ny)])
+    x[ix(fg, nx+1, 0)] = 0.5 * (x[ix(fg, nx, 0)] + x[ix(fg, nx + 1, 1)])
+    x[ix(fg, nx+1, ny+1)] = 0.5 * (x[ix(fg, nx, ny + 1)] + x[ix(fg, nx + 1, ny)])
+
+
+cdef inline void set_row_boundary_cells(FluidGrid* fg, int b, real* x, int i) noexcept nogil:
+    """
+    the part of `set_boundary_cells` that depends on row `i`: its own 2 border cells, and the whole border row next to
+    it if `i` is the first or last interior row. Corners are left to `set_corner_cells`.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int j
+    x[ix(fg, i, 0)] = (-x[ix(fg, i, 1)]) if b == 2 else (x[ix(fg, i, 1)])
+    x[ix(fg, i, ny+1)] = (-x[ix(fg, i, ny)]) if b == 2 else (x[ix(fg, i, ny)])
+    if i == 1:
+        for j in range(1, 1+ny):
+            x[ix(fg, 0, j)] = (-x[ix(fg, 1, j)]) if b == 1 else (x[ix(fg, 1, j)])
+    if i == nx:
+        for j in range(1, 1+ny):
+            x[ix(fg, nx+1, j)] = (-x[ix(fg, nx, j)]) if b == 1 else (x[ix(fg, nx, j)])
+
+
+cdef SolveStats linear_solve(
+        FluidGrid* fg, int b, real* x, real* x0, real a, real c, int max_iter_count, float tolerance,
+        float source_dt
+) noexcept nogil:
+    """
+    relaxes `x` towards the solution of `x = c * (x0 + a * (sum of x's 4 neighbors))`, as in Stam's `lin_solve`
+    - shared by `diffuse` and `project`
+    - sweeps in the order selected by `fg.relaxation_order`, around the grid's obstacles if it has any (see
+      `relax_around_obstacles`)
+    - stops early once the relative residual drops to `tolerance`. A sweep moves each cell by `c` times its residual,
+      so the residual is estimated from the size of the last sweep's updates, at no extra pass over the grid.
+    - if `source_dt` is non-zero, `x` starts out holding a source and `x0` the field it is added to: the first sweep
+      adds `source_dt * x` into `x0` cell by cell, just before relaxing the cell, which is what `add_source` followed
+      by `swap` would have left there (see `velocity_step_fused`).
+    """
+
+    cdef SolveStats stats
+    cdef double update_norm2, rhs_norm2
+    cdef int k
+
+    if fg.relaxation_block_depth > 1 and fg.obstacle_flags == NULL:
+        return linear_solve_blocked(fg, b, x, x0, a, c, max_iter_count, tolerance, source_dt)
+
+    stats.iterations = 0
+    stats.residual = 0
+
+    for k in range(max_iter_count):
+        if fg.obstacle_flags != NULL:
+            if fg.relaxation_order == RELAXATION_ORDER_RED_BLACK:
+                update_norm2 = relax_around_obstacles(fg, b, x, x0, a, c, 0, source_dt if k == 0 else 0, &rhs_norm2)
+                update_norm2 += relax_around_obstacles(fg, b, x, x0, a, c, 1, source_dt if k == 0 else 0, &rhs_norm2)
+            else:
+                update_norm2 = relax_around_obstacles(fg, b, x, x0, a, c, -1, source_dt if k == 0 else 0, &rhs_norm2)
+        elif fg.relaxation_order == RELAXATION_ORDER_RED_BLACK:
+            update_norm2 = relax_red_black(fg, x, x0, a, c, 0, source_dt if k == 0 else 0, &rhs_norm2)
+            update_norm2 += relax_red_black(fg, x, x0, a, c, 1, source_dt if k == 0 else 0, &rhs_norm2)
+        else:
+            update_norm2 = relax_lexicographic(fg, x, x0, a, c, source_dt if k == 0 else 0, &rhs_norm2)
+        set_boundary_cells(fg, b, x)
+
+        stats.iterations = k + 1
+        stats.residual = relative_norm(sqrt(update_norm2) / c, sqrt(rhs_norm2))
+        if sqrt(update_norm2) <= tolerance * c * sqrt(rhs_norm2):
+            break
+
+    return stats
+
+
+cdef SolveStats linear_solve_blocked(
+        FluidGrid* fg, int b, real* x, real* x0, real a, real c, int max_iter_count, float tolerance,
+        float source_dt
+) noexcept nogil:
+    """
+    `linear_solve` with temporal blocking: each pass over the grid runs up to `fg.relaxation_block_depth` sweeps.
+    - the sweeps form a wavefront over rows: pass step `s` relaxes row `s - 2h` at sweep level `h`. Row `i` at level
+      `h` then sees row `i - 1` at level `h` and row `i + 1` at level `h - 1`, exactly as sweeping the whole grid
+      `h + 1` times would, while only the ~2 * depth rows behind the front need to stay in cache.
+    - red-black sweeps become two levels each, one per color, with the same dependencies between levels.
+    - border cells are set row by row as the front passes each sweep's last level (see `set_row_boundary_cells`);
+      corners, which no stencil reads, are set once at the end.
+    - the tolerance is checked against the last sweep of each pass.
+    """
+
+    cdef SolveStats stats
+    cdef int nx = fg.nx
+    cdef int color_count = 2 if fg.relaxation_order == RELAXATION_ORDER_RED_BLACK else 1
+    cdef double level_update_norm2[2 * MAX_RELAXATION_BLOCK_DEPTH]
+    cdef double update_norm2
+    cdef double rhs_norm2 = 0.0
+    cdef int sweep_count, level_count, step, h, i, color
+    cdef int k = 0
+
+    stats.iterations = 0
+    stats.residual = 0
+
+    while k < max_iter_count:
+        sweep_count = min(fg.relaxation_block_depth, max_iter_count - k)
+        level_count = sweep_count * color_count
+        for h in range(level_count):
+            level_update_norm2[h] = 0.0
+
+        for step in range(1, nx + 2 * (level_count - 1) + 1):
+            for h in range(level_count):
+                i = step - 2 * h
+                if i < 1:
+                    break
+                if i > nx:
+                    continue
+                color = -1 if color_count == 1 else h % 2
+                level_update_norm2[h] += relax_row(
+                    fg, x, x0, a, c, i, color,
+                    source_dt if k == 0 and h < color_count else 0,
+                    &rhs_norm2 if k == 0 and h == color_count - 1 else NULL
+                )
+                # as in `linear_solve`, borders are mirrored once per sweep: a red level must not refresh the borders
+                # its black level reads.
+                if color_count == 1 or h % 2 == 1:
+                    set_row_boundary_cells(fg, b, x, i)
+
+        k += sweep_count
+        update_norm2 = level_update_norm2[level_count - 1]
+        if color_count == 2:
+            update_norm2 += level_update_norm2[level_count - 2]
+        stats.iterations = k
+        stats.residual = relative_norm(sqrt(update_norm2) / c, sqrt(rhs_norm2))
+        if sqrt(update_norm2) <= tolerance * c * sqrt(rhs_norm2):
+            break
+
+    set_corner_cells(fg, x)
+    return stats
+
+
+cdef inline double relax_row(
+        FluidGrid* fg, real* x, real* x0, real a, real c, int i, int color, float source_dt, double* x0_norm2
+) noexcept nogil:
+    """
+    relaxes the interior cells of row `i` in place, in increasing `j` order
+    :param color: -1 to update every cell, or 0/1 to update only the red/black cells (see `relax_red_black`)
+    :param source_dt: if non-zero, `source_dt * x` is first added into `x0` at each updated cell (see `linear_solve`)
+    :param x0_norm2: if not NULL, the squared 2-norm of the row's `x0` over every interior cell is added to it.
+    :return: the squared 2-norm of the updates
+    """
+
+    cdef int ny = fg.ny
+    cdef double update_norm2 = 0.0
+    cdef real next_x, update
+    cdef int j
+    cdef int j_start = 1 if color < 0 else 1 + (i + 1 + color) % 2
+    cdef int j_step = 1 if color < 0 else 2
+
+    j = j_start
+    while j <= ny:
+        if source_dt != 0:
+            x0[ix(fg, i, j)] += source_dt * x[ix(fg, i, j)]
+        next_x = c * (
+            x0[ix(fg, i, j)] + a * (
+                + x[ix(fg, i - 1, j)]
+                + x[ix(fg, i + 1, j)]
+                + x[ix(fg, i, j - 1)]
+                + x[ix(fg, i, j + 1)]
+            )
+        )
+        update = next_x - x[ix(fg, i, j)]
+        x[ix(fg, i, j)] = next_x
+        update_norm2 += <double>update * update
+        j += j_step
+
+    if x0_norm2 != NULL:
+        for j in range(1, 1+ny):
+            x0_norm2[0] += <double>x0[ix(fg, i, j)] * x0[ix(fg, i, j)]
+
+    return update_norm2
+
+
+cdef void linear_solve_pair(
+        FluidGrid* fg, int bx, real* x, real* x0, int by, real* y, real* y0, real a, real c,
+        int max_iter_count, float tolerance, float source_dt, SolveStats* x_stats, SolveStats* y_stats
+) noexcept nogil:
+    """
+    `linear_solve` on two independent systems sharing `a` and `c` (the two velocity components' diffusion), sweeping
+    both in the same pass over the grid.
+    - each system stops exactly where `linear_solve` would stop it: once one has converged, the other goes on alone.
+    - blocked sweeps (see `linear_solve_blocked`) solve the systems one after the other instead.
+    """
+
+    cdef double norms2[4]
+    cdef bint x_converged = False
+    cdef bint y_converged = False
+    cdef SolveStats rest_stats
+    cdef int k = 0
+
+    if fg.relaxation_block_depth > 1:
+        x_stats[0] = linear_solve(fg, bx, x, x0, a, c, max_iter_count, tolerance, source_dt)
+        y_stats[0] = linear_solve(fg, by, y, y0, a, c, max_iter_count, tolerance, source_dt)
+        return
+
+    x_stats.iterations = 0
+    x_stats.residual = 0
+    y_stats[0] = x_stats[0]
+
+    while k < max_iter_count and not x_converged and not y_converged:
+        if fg.relaxation_order == RELAXATION_ORDER_RED_BLACK:
+            relax_red_black_pair(fg, x, x0, y, y0, a, c, 0, source_dt if k == 0 else 0, norms2)
+            relax_red_black_pair(fg, x, x0, y, y0, a, c, 1, source_dt if k == 0 else 0, norms2)
+        else:
+            relax_lexicographic_pair(fg, x, x0, y, y0, a, c, source_dt if k == 0 else 0, norms2)
+        set_boundary_cells(fg, bx, x)
+        set_boundary_cells(fg, by, y)
+        k += 1
+
+        x_stats.iterations = k
+        x_stats.residual = relative_norm(sqrt(norms2[0]) / c, sqrt(norms2[2]))
+        x_converged = sqrt(norms2[0]) <= tolerance * c * sqrt(norms2[2])
+        y_stats.iterations = k
+        y_stats.residual = relative_norm(sqrt(norms2[1]) / c, sqrt(norms2[3]))
+        y_converged = sqrt(norms2[1]) <= tolerance * c * sqrt(norms2[3])
+
+    # finishing whichever system has not converged yet on its own:
+    if k < max_iter_count and x_converged != y_converged:
+        if x_converged:
+            rest_stats = linear_solve(fg, by, y, y0, a, c, max_iter_count - k, tolerance, 0)
+            y_stats.iterations += rest_stats.iterations
+            y_stats.residual = rest_stats.residual
+        else:
+            rest_stats = linear_solve(fg, bx, x, x0, a, c, max_iter_count - k, tolerance, 0)
+            x_stats.iterations += rest_stats.iterations
+            x_stats.residual = rest_stats.residual
+
+
+cdef inline float relative_norm(double norm, double reference_norm) noexcept nogil:
+    if reference_norm == 0:
+        return 0 if norm == 0 else INFINITY
+    return <float>(norm / reference_norm)
+
+
+cdef double relax_lexicographic(
+        FluidGrid* fg, real* x, real* x0, real a, real c, float source_dt, double* rhs_norm2
+) noexcept nogil:
+    """
+    one in-place Gauss-Seidel sweep (cf MATH 151AB): each cell reads the values its predecessors just wrote, so this
+    loop cannot be parallelized.
+    :param source_dt: if non-zero, `source_dt * x` is first added into `x0` at each cell (see `linear_solve`)
+    :return: the squared 2-norm of the updates; the squared 2-norm of `x0` is written to `rhs_norm2`.
+    """
+
+    cdef CellSpans* spans = fg.spans
+    cdef int nx = fg.nx
+    cdef double update_norm2 = 0.0
+    cdef double x0_norm2 = 0.0
+    cdef real next_x, update
+    cdef int i, j, k, band
+
+    for i in range(1, 1+nx):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            for j in range(spans.starts[k], spans.stops[k]):
+                if source_dt != 0:
+                    x0[ix(fg, i, j)] += source_dt * x[ix(fg, i, j)]
+                next_x = c * (
+                    x0[ix(fg, i, j)] + a * (
+                        + x[ix(fg, i - 1, j)]
+                        + x[ix(fg, i + 1, j)]
+                        + x[ix(fg, i, j - 1)]
+                        + x[ix(fg, i, j + 1)]
+                    )
+                )
+                update = next_x - x[ix(fg, i, j)]
+                x[ix(fg, i, j)] = next_x
+                update_norm2 += <double>update * update
+                x0_norm2 += <double>x0[ix(fg, i, j)] * x0[ix(fg, i, j)]
+
+    rhs_norm2[0] = x0_norm2
+    return update_norm2
+
+
+cdef double relax_red_black(
+        FluidGrid* fg, real* x, real* x0, real a, real c, int color, float source_dt, double* rhs_norm2
+) noexcept nogil:
+    """
+    one half of a red-black Gauss-Seidel sweep: updates only the cells where (i + j) % 2 == color.
+    - a cell's 4 neighbors all have the other color, so every update in this pass is independent.
+    - `source_dt` is as in `relax_lexicographic`, and only touches the cells of this color.
+    :return: the squared 2-norm of the updates; the squared 2-norm of `x0` over all cells is written to `rhs_norm2`
+        by the red (color 0) half and accumulated into it by the black half.
+    """
+
+    cdef CellSpans* spans = fg.spans
+    cdef int nx = fg.nx
+    cdef double update_norm2 = 0.0
+    cdef double x0_norm2 = 0.0
+    cdef real next_x, update
+    cdef int i, j, k, band
+
+    for i in prange(1, 1+nx, num_threads=fg.thread_count, schedule='static'):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            # the span's first cell of this color:
+            for j in range(spans.starts[k] + (i + spans.starts[k] + color) % 2, spans.stops[k], 2):
+                if source_dt != 0:
+                    x0[ix(fg, i, j)] += source_dt * x[ix(fg, i, j)]
+                next_x = c * (
+                    x0[ix(fg, i, j)] + a * (
+                        + x[ix(fg, i - 1, j)]
+                        + x[ix(fg, i + 1, j)]
+                        + x[ix(fg, i, j - 1)]
+                        + x[ix(fg, i, j + 1)]
                     )
                 )
-        set_boundary_cells(fg, n, b, x)
+                update = next_x - x[ix(fg, i, j)]
+                x[ix(fg, i, j)] = next_x
+                update_norm2 += <double>update * update
+                x0_norm2 += <double>x0[ix(fg, i, j)] * x0[ix(fg, i, j)]
+
+    if color == 0:
+        rhs_norm2[0] = x0_norm2
+    else:
+        rhs_norm2[0] += x0_norm2
+    return update_norm2
+
+
+cdef void relax_lexicographic_pair(
+        FluidGrid* fg, real* x, real* x0, real* y, real* y0, real a, real c, float source_dt, double* norms2
+) noexcept nogil:
+    """
+    `relax_lexicographic` on two independent systems at once: their two chains of dependent updates interleave, so
+    the sweep is no longer bound by the latency of a single chain.
+    :param norms2: receives the squared 2-norms of the updates to `x` and `y`, then of `x0` and `y0`.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef double x_update_norm2 = 0.0
+    cdef double y_update_norm2 = 0.0
+    cdef double x0_norm2 = 0.0
+    cdef double y0_norm2 = 0.0
+    cdef real next_x, next_y, update
+    cdef int i, j, k
+
+    for i in range(1, 1+nx):
+        for j in range(1, 1+ny):
+            k = ix(fg, i, j)
+            if source_dt != 0:
+                x0[k] += source_dt * x[k]
+                y0[k] += source_dt * y[k]
+            next_x = c * (
+                x0[k] + a * (
+                    + x[ix(fg, i - 1, j)]
+                    + x[ix(fg, i + 1, j)]
+                    + x[ix(fg, i, j - 1)]
+                    + x[ix(fg, i, j + 1)]
+                )
+            )
+            next_y = c * (
+                y0[k] + a * (
+                    + y[ix(fg, i - 1, j)]
+                    + y[ix(fg, i + 1, j)]
+                    + y[ix(fg, i, j - 1)]
+                    + y[ix(fg, i, j + 1)]
+                )
+            )
+            update = next_x - x[k]
+            x[k] = next_x
+            x_update_norm2 += <double>update * update
+            update = next_y - y[k]
+            y[k] = next_y
+            y_update_norm2 += <double>update * update
+            x0_norm2 += <double>x0[k] * x0[k]
+            y0_norm2 += <double>y0[k] * y0[k]
+
+    norms2[0] = x_update_norm2
+    norms2[1] = y_update_norm2
+    norms2[2] = x0_norm2
+    norms2[3] = y0_norm2
+
+
+cdef void relax_red_black_pair(
+        FluidGrid* fg, real* x, real* x0, real* y, real* y0, real a, real c, int color, float source_dt,
+        double* norms2
+) noexcept nogil:
+    """
+    `relax_red_black` on two independent systems at once (see `relax_lexicographic_pair`).
+    :param norms2: as in `relax_lexicographic_pair`; written by the red (color 0) half, accumulated into by the black.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef double x_update_norm2 = 0.0
+    cdef double y_update_norm2 = 0.0
+    cdef double x0_norm2 = 0.0
+    cdef double y0_norm2 = 0.0
+    cdef real next_x, next_y, update
+    cdef int i, j, k
+
+    for i in prange(1, 1+nx, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1 + (i + 1 + color) % 2, 1+ny, 2):
+            k = ix(fg, i, j)
+            if source_dt != 0:
+                x0[k] += source_dt * x[k]
+                y0[k] += source_dt * y[k]
+            next_x = c * (
+                x0[k] + a * (
+                    + x[ix(fg, i - 1, j)]
+                    + x[ix(fg, i + 1, j)]
+                    + x[ix(fg, i, j - 1)]
+                    + x[ix(fg, i, j + 1)]
+                )
+            )
+            next_y = c * (
+                y0[k] + a * (
+                    + y[ix(fg, i - 1, j)]
+                    + y[ix(fg, i + 1, j)]
+                    + y[ix(fg, i, j - 1)]
+                    + y[ix(fg, i, j + 1)]
+                )
+            )
+            update = next_x - x[k]
+            x[k] = next_x
+            x_update_norm2 += <double>update * update
+            update = next_y - y[k]
+            y[k] = next_y
+            y_update_norm2 += <double>update * update
+            x0_norm2 += <double>x0[k] * x0[k]
+            y0_norm2 += <double>y0[k] * y0[k]
+
+    if color == 0:
+        norms2[0] = x_update_norm2
+        norms2[1] = y_update_norm2
+        norms2[2] = x0_norm2
+        norms2[3] = y0_norm2
+    else:
+        norms2[0] += x_update_norm2
+        norms2[1] += y_update_norm2
+        norms2[2] += x0_norm2
+        norms2[3] += y0_norm2
+
+
+cdef double relax_around_obstacles(
+        FluidGrid* fg, int b, real* x, real* x0, real a, real c, int color, float source_dt, double* rhs_norm2
+) noexcept nogil:
+    """
+    one Gauss-Seidel sweep (`color` < 0; see `relax_lexicographic`) or half red-black sweep (`color` 0 or 1; see
+    `relax_red_black`) over a grid with obstacles, whose walls are handled inside the stencil: a solid neighbor reads
+    as the cell's own value, mirrored as `set_boundary_cells` mirrors values into the border (see `mirror_sign`), so
+    obstacles need no boundary pass of their own. Solid cells are held at 0.
+    - cells away from obstacles are updated exactly as by the sweeps above.
+    - always visits the whole grid: ticks with obstacles are never restricted to active tiles.
+    :param b: the field's kind, as in `set_boundary_cells`
+    :return: as `relax_lexicographic` and `relax_red_black`; solid cells count towards neither norm.
+    """
+
+    cdef unsigned char* flags = fg.obstacle_flags
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef real sign_x = mirror_sign(fg, b, 1)
+    cdef real sign_y = mirror_sign(fg, b, 2)
+    # a single thread runs the rows in order, as a Gauss-Seidel sweep needs:
+    cdef int thread_count = 1 if color < 0 else fg.thread_count
+    cdef int j_step = 1 if color < 0 else 2
+    cdef double update_norm2 = 0.0
+    cdef double x0_norm2 = 0.0
+    cdef real next_x, update
+    cdef int i, j, k
+
+    for i in prange(1, 1+nx, num_threads=thread_count, schedule='static'):
+        j = 1 if color < 0 else 1 + (i + 1 + color) % 2
+        while j <= ny:
+            k = ix(fg, i, j)
+            if flags[k] & OBSTACLE_SOLID:
+                x[k] = 0
+            else:
+                if source_dt != 0:
+                    x0[k] += source_dt * x[k]
+                if flags[k] == 0:
+                    next_x = c * (
+                        x0[k] + a * (
+                            + x[ix(fg, i - 1, j)]
+                            + x[ix(fg, i + 1, j)]
+                            + x[ix(fg, i, j - 1)]
+                            + x[ix(fg, i, j + 1)]
+                        )
+                    )
+                else:
+                    next_x = c * (x0[k] + a * mirrored_neighbor_sum(fg, x, i, j, flags[k], sign_x, sign_y))
+                update = next_x - x[k]
+                x[k] = next_x
+                update_norm2 += <double>update * update
+                x0_norm2 += <double>x0[k] * x0[k]
+            j = j + j_step
+
+    if color == 1:
+        rhs_norm2[0] += x0_norm2
+    else:
+        rhs_norm2[0] = x0_norm2
+    return update_norm2
+
+
+cdef inline int mirror_sign(FluidGrid* fg, int b, int axis) noexcept nogil:
+    """
+    the factor a field's value takes when mirrored across an obstacle's wall normal to `axis` (1 for x, 2 for y):
+    - scalars (b == 0) are mirrored as they are, and the velocity component normal to the wall (b == axis) is negated,
+      just as `set_boundary_cells` mirrors them into the border;
+    - the component along the wall is negated too under no-slip, so that it vanishes at the wall, and kept under
+      free-slip, so that it slides along it.
+    """
+
+    if b == 0:
+        return 1
+    if b == axis or fg.obstacle_slip == OBSTACLE_SLIP_CODE_NO_SLIP:
+        return -1
+    return 1
+
+
+cdef inline real mirrored_neighbor_sum(
+        FluidGrid* fg, real* x, int i, int j, unsigned char flags, real sign_x, real sign_y
+) noexcept nogil:
+    """
+    the sum of interior cell (i, j)'s 4 neighbors, of which the solid ones (see `flags`, the cell's `ObstacleFlag`
+    bits) read as the cell's own value times `sign_x` (left and right) or `sign_y` (down and up).
+    """
+
+    cdef real center = x[ix(fg, i, j)]
+    return (
+        + (sign_x * center if flags & OBSTACLE_SOLID_LEFT else x[ix(fg, i - 1, j)])
+        + (sign_x * center if flags & OBSTACLE_SOLID_RIGHT else x[ix(fg, i + 1, j)])
+        + (sign_y * center if flags & OBSTACLE_SOLID_DOWN else x[ix(fg, i, j - 1)])
+        + (sign_y * center if flags & OBSTACLE_SOLID_UP else x[ix(fg, i, j + 1)])
+    )
 
 
-cdef advect(FluidGrid* fg, int b, float* d, float* d0, float* u, float* v, float dt):
+cdef SolveStats diffuse(
+        FluidGrid* fg, int b, real* x, real* x0, float diff, float dt, bint add_source=False
+) noexcept nogil:
     """
     implements the `diffuse` operator, used by `advance_fg_state_by_one_tick`
+    propagates velocities, simulating 'diffusion'.
+     - this is an implementation of Gauss-Seidel relaxation (cf MATH 151AB)
+     - note this is done in a non-energy-conserving way, so we must 'reproject' to rescale vectors
+     - with `add_source`, `x` holds the source still to be added into `x0` (see `linear_solve`)
+    """
+
+    cdef real a = dt * diff * fg.scale * fg.scale
+
+    return linear_solve(
+        fg, b, x, x0, a, 1.0 / (1.0 + 4.0*a),
+        fg.diffusion_max_iterations, fg.diffusion_tolerance, dt if add_source else 0
+    )
+
+
+cdef void advect(FluidGrid* fg, int b, real* d, real* d0, real* u, real* v, float dt) noexcept nogil:
+    """
+    implements the `advect` operator, used by `advance_fg_state_by_one_tick`
     - uses `method of characteristics` to work out the starting position of a bulk cell given velocity, which is then
       written into the matrix
     - borne from Stam97, "where [authors] moved density fields through kinetic turbulent wind fields"
+    - the semi-Lagrangian pass (see `semi_lagrangian_pass`) is corrected as `fg.advection_scheme` selects; `d0`, `u`
+      and `v` are left as they are, so `d0` may be one of the velocities.
+    """
+
+    cdef real* scratch = <real*>fg.advection_scratch
+
+    semi_lagrangian_pass(fg, d, d0, u, v, dt)
+    if fg.advection_scheme == ADVECTION_SCHEME_CODE_MACCORMACK:
+        # advecting the result back: the difference to `d0` estimates twice the forward pass's error.
+        set_boundary_cells(fg, b, d)
+        semi_lagrangian_pass(fg, scratch, d, u, v, -dt)
+        limit_advected(fg, d, d0, scratch, u, v, dt)
+    elif fg.advection_scheme == ADVECTION_SCHEME_CODE_BFECC:
+        # advecting the result back, then correcting `d0` by half of the round trip's error, and advecting that instead:
+        set_boundary_cells(fg, b, d)
+        semi_lagrangian_pass(fg, scratch, d, u, v, -dt)
+        compensate_round_trip(fg, scratch, d0)
+        set_boundary_cells(fg, b, scratch)
+        semi_lagrangian_pass(fg, d, scratch, u, v, dt)
+        limit_advected(fg, d, d0, NULL, u, v, dt)
+
+    set_boundary_cells(fg, b, d)
+
+
+cdef void semi_lagrangian_pass(FluidGrid* fg, real* d, real* d0, real* u, real* v, float dt) noexcept nogil:
+    """
+    sets each cell of `d` to `d0` interpolated where the velocity traced it back from over `dt` (forward for a negative
+    `dt`), leaving border cells to the caller
+    - around obstacles, solid cells are zeroed, and fluid cells interpolate over fluid cells only (see
+      `interpolate_around_obstacles`)
+    """
+
+    cdef CellSpans* spans = fg.spans
+    cdef unsigned char* flags = fg.obstacle_flags
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef float dt0 = dt * fg.scale
+    cdef int i, j, i0, i1, j0, j1, k, band
+    cdef real x, y, s0, s1, t0, t1
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            for j in range(spans.starts[k], spans.stops[k]):
+                x = i - dt0*u[ix(fg, i, j)]
+                y = j - dt0*v[ix(fg, i, j)]
+
+                if x < 0.5:
+                    x = 0.5
+                if x > nx + 0.5:
+                    x = nx + 0.5
+                i0 = <int>x
+                i1 = 1 + i0
+
+                if y < 0.5:
+                    y = 0.5
+                if y > ny + 0.5:
+                    y = ny + 0.5
+                j0 = <int>y
+                j1 = 1 + j0
+
+                s1 = x - i0
+                s0 = 1 - s1
+                t1 = y - j0
+                t0 = 1 - t1
+
+                if flags == NULL:
+                    d[ix(fg, i, j)] = (
+                        s0 * (t0 * d0[ix(fg, i0, j0)] + t1*d0[ix(fg, i0, j1)]) +
+                        s1 * (t0 * d0[ix(fg, i1, j0)] + t1*d0[ix(fg, i1, j1)])
+                    )
+                elif flags[ix(fg, i, j)] & OBSTACLE_SOLID:
+                    d[ix(fg, i, j)] = 0
+                else:
+                    d[ix(fg, i, j)] = interpolate_around_obstacles(fg, d0, i0, j0, s0, s1, t0, t1, d0[ix(fg, i, j)])
+
+
+cdef void compensate_round_trip(FluidGrid* fg, real* back, real* d0) noexcept nogil:
+    """
+    turns `back`, `d0` advected forth and back, into BFECC's corrected field: `d0 + (d0 - back) / 2`.
+    """
+
+    cdef CellSpans* spans = fg.spans
+    cdef int i, j, k, band
+
+    for i in prange(1, fg.nx+1, num_threads=fg.thread_count, schedule='static'):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            for j in range(spans.starts[k], spans.stops[k]):
+                back[ix(fg, i, j)] = d0[ix(fg, i, j)] + 0.5 * (d0[ix(fg, i, j)] - back[ix(fg, i, j)])
+
+
+cdef void limit_advected(FluidGrid* fg, real* d, real* d0, real* back, real* u, real* v, float dt) noexcept nogil:
+    """
+    the corrected schemes' last pass: adds MacCormack's correction `(d0 - back) / 2` to each cell of `d` unless `back`
+    is NULL, then clamps it between the extrema of the (fluid) cells of `d0` its back-trace interpolated between, so
+    the correction cannot overshoot into new extrema.
+    """
+
+    cdef CellSpans* spans = fg.spans
+    cdef unsigned char* flags = fg.obstacle_flags
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef float dt0 = dt * fg.scale
+    cdef int i, j, k, band, i0, j0, di, dj
+    cdef real x, y, value, low, high, neighbor
+    cdef bint found
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            for j in range(spans.starts[k], spans.stops[k]):
+                if flags != NULL and flags[ix(fg, i, j)] & OBSTACLE_SOLID:
+                    continue
+
+                x = i - dt0*u[ix(fg, i, j)]
+                y = j - dt0*v[ix(fg, i, j)]
+                if x < 0.5:
+                    x = 0.5
+                if x > nx + 0.5:
+                    x = nx + 0.5
+                if y < 0.5:
+                    y = 0.5
+                if y > ny + 0.5:
+                    y = ny + 0.5
+                i0 = <int>x
+                j0 = <int>y
+
+                value = d[ix(fg, i, j)]
+                if back != NULL:
+                    value = value + 0.5 * (d0[ix(fg, i, j)] - back[ix(fg, i, j)])
+
+                low = 0
+                high = 0
+                found = False
+                for di in range(2):
+                    for dj in range(2):
+                        if flags != NULL and flags[ix(fg, i0 + di, j0 + dj)] & OBSTACLE_SOLID:
+                            continue
+                        neighbor = d0[ix(fg, i0 + di, j0 + dj)]
+                        if not found or neighbor < low:
+                            low = neighbor
+                        if not found or neighbor > high:
+                            high = neighbor
+                        found = True
+
+                if found:
+                    if value < low:
+                        value = low
+                    if value > high:
+                        value = high
+                d[ix(fg, i, j)] = value
+
+
+cdef inline real interpolate_around_obstacles(
+        FluidGrid* fg, real* d0, int i0, int j0, real s0, real s1, real t0, real t1, real fallback
+) noexcept nogil:
+    """
+    `advect`'s bilinear interpolation of `d0` between cells (i0, j0) and (i0 + 1, j0 + 1), over the fluid ones only:
+    the weights of solid cells, which hold no fluid, are spread over the others rather than diluting them with 0.
+    :return: the interpolated value, or `fallback` if all 4 cells are solid
+    """
+
+    cdef unsigned char* flags = fg.obstacle_flags
+    cdef real w00 = 0 if flags[ix(fg, i0, j0)] & OBSTACLE_SOLID else s0 * t0
+    cdef real w01 = 0 if flags[ix(fg, i0, j0 + 1)] & OBSTACLE_SOLID else s0 * t1
+    cdef real w10 = 0 if flags[ix(fg, i0 + 1, j0)] & OBSTACLE_SOLID else s1 * t0
+    cdef real w11 = 0 if flags[ix(fg, i0 + 1, j0 + 1)] & OBSTACLE_SOLID else s1 * t1
+    cdef real total = w00 + w01 + w10 + w11
+
+    if total <= 0:
+        return fallback
+    return (
+        w00 * d0[ix(fg, i0, j0)] + w01 * d0[ix(fg, i0, j0 + 1)] +
+        w10 * d0[ix(fg, i0 + 1, j0)] + w11 * d0[ix(fg, i0 + 1, j0 + 1)]
+    ) / total
+
+
+cdef SolveStats project(FluidGrid* fg, real* u, real* v, pressure_real* p, pressure_real* div) noexcept nogil:
+    """
+    implements the `project` operator, using the pressure solver selected by `fg.pressure_solver`
+    - resizes vectors to preserve velocity components  
+    - `p` and `div` may be wider than the velocities (see `Simulator.precision`)
+    - only the cells of `fg.spans` are visited, so `p` must be 0 elsewhere
+    - around obstacles, solid cells hold no divergence, pressure or velocity, and the walls are read inside the
+      stencils, as in `relax_around_obstacles`: fluid crosses no wall, and pressure is mirrored across them.
+    """
+
+    cdef CellSpans* spans = fg.spans
+    cdef unsigned char* flags = fg.obstacle_flags
+    cdef int nx = fg.nx
+    cdef real h = 1.0 / fg.scale
+    cdef SolveStats stats
+    cdef int i, j, k, band
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            for j in range(spans.starts[k], spans.stops[k]):
+                if flags == NULL:
+                    div[ix(fg, i, j)] = (-0.5 * h) * (
+                        + u[ix(fg, i+1, j)] - u[ix(fg, i-1, j)]
+                        + v[ix(fg, i, j+1)] - v[ix(fg, i, j-1)]
+                    )
+                else:
+                    div[ix(fg, i, j)] = divergence_around_obstacles(fg, u, v, i, j, h)
+                p[ix(fg, i, j)] = 0
+
+    set_boundary_cells(fg, 0, div)
+    set_boundary_cells(fg, 0, p)
+
+    stats = solve_pressure(fg, p, div)
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        band = (i - 1) // spans.rows_per_band
+        for k in range(spans.band_offsets[band], spans.band_offsets[band + 1]):
+            for j in range(spans.starts[k], spans.stops[k]):
+                if flags == NULL:
+                    u[ix(fg, i, j)] -= (0.5/h) * (p[ix(fg, i+1, j)] - p[ix(fg, i-1, j)])
+                    v[ix(fg, i, j)] -= (0.5/h) * (p[ix(fg, i, j+1)] - p[ix(fg, i, j-1)])
+                else:
+                    subtract_gradient_around_obstacles(fg, u, v, p, i, j, h)
+
+    set_boundary_cells(fg, 1, u)
+    set_boundary_cells(fg, 2, v)
+
+    return stats
+
+
+cdef inline real divergence_around_obstacles(FluidGrid* fg, real* u, real* v, int i, int j, real h) noexcept nogil:
+    """
+    `project`'s divergence at interior cell (i, j) of a grid with obstacles: 0 in solid cells, and, across a wall, the
+    velocity component normal to it mirrored with its sign flipped, so that no fluid flows through the wall.
     """
 
-    n = fg.n
+    cdef unsigned char flags = fg.obstacle_flags[ix(fg, i, j)]
+    if flags & OBSTACLE_SOLID:
+        return 0
+    return (-0.5 * h) * (
+        + (-u[ix(fg, i, j)] if flags & OBSTACLE_SOLID_RIGHT else u[ix(fg, i+1, j)])
+        - (-u[ix(fg, i, j)] if flags & OBSTACLE_SOLID_LEFT else u[ix(fg, i-1, j)])
+        + (-v[ix(fg, i, j)] if flags & OBSTACLE_SOLID_UP else v[ix(fg, i, j+1)])
+        - (-v[ix(fg, i, j)] if flags & OBSTACLE_SOLID_DOWN else v[ix(fg, i, j-1)])
+    )
+
+
+cdef inline void subtract_gradient_around_obstacles(
+        FluidGrid* fg, real* u, real* v, pressure_real* p, int i, int j, real h
+) noexcept nogil:
+    """
+    `project`'s gradient subtraction at interior cell (i, j) of a grid with obstacles: solid cells are held at rest,
+    and pressure is mirrored across walls as it is across the border.
+    """
+
+    cdef int k = ix(fg, i, j)
+    cdef unsigned char flags = fg.obstacle_flags[k]
+
+    if flags & OBSTACLE_SOLID:
+        u[k] = 0
+        v[k] = 0
+        return
+    u[k] -= (0.5/h) * (
+        (p[k] if flags & OBSTACLE_SOLID_RIGHT else p[ix(fg, i+1, j)]) -
+        (p[k] if flags & OBSTACLE_SOLID_LEFT else p[ix(fg, i-1, j)])
+    )
+    v[k] -= (0.5/h) * (
+        (p[k] if flags & OBSTACLE_SOLID_UP else p[ix(fg, i, j+1)]) -
+        (p[k] if flags & OBSTACLE_SOLID_DOWN else p[ix(fg, i, j-1)])
+    )
+
+
+cdef SolveStats project_fused(
+        FluidGrid* fg, real* u, real* v, pressure_real* p, pressure_real* div
+) noexcept nogil:
+    """
+    `project` with its border cells set row by row inside the divergence and gradient passes, instead of in 4 separate
+    passes (see `set_row_boundary_cells`); the results are identical.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef real h = 1.0 / fg.scale
+    cdef SolveStats stats
+    cdef int i, j
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            div[ix(fg, i, j)] = (-0.5 * h) * (
+                + u[ix(fg, i+1, j)] - u[ix(fg, i-1, j)]
+                + v[ix(fg, i, j+1)] - v[ix(fg, i, j-1)]
+            )
+            p[ix(fg, i, j)] = 0
+        set_row_boundary_cells(fg, 0, div, i)
+        set_row_boundary_cells(fg, 0, p, i)
+    set_corner_cells(fg, div)
+    set_corner_cells(fg, p)
+
+    stats = solve_pressure(fg, p, div)
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            u[ix(fg, i, j)] -= (0.5/h) * (p[ix(fg, i+1, j)] - p[ix(fg, i-1, j)])
+            v[ix(fg, i, j)] -= (0.5/h) * (p[ix(fg, i, j+1)] - p[ix(fg, i, j-1)])
+        set_row_boundary_cells(fg, 1, u, i)
+        set_row_boundary_cells(fg, 2, v, i)
+    set_corner_cells(fg, u)
+    set_corner_cells(fg, v)
+
+    return stats
+
+
+cdef void advect_velocity(FluidGrid* fg, real* u, real* v, real* u0, real* v0, float dt) noexcept nogil:
+    """
+    advects both velocity components through themselves in one pass: `advect(fg, 1, u, u0, u0, v0, dt)` then
+    `advect(fg, 2, v, v0, u0, v0, dt)`, sharing each cell's back-trace, with border cells set row by row.
+    """
 
-    dt0 = dt*n
-    for i in range(1, n+1):
-        for j in range(1, n+1):
-            x = i - dt0*u[ix(fg, i, j)]
-            y = j - dt0*v[ix(fg, i, j)]
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef float dt0 = dt * fg.scale
+    cdef int i, j, i0, i1, j0, j1
+    cdef real x, y, s0, s1, t0, t1
 
-            # print(f"({i}, {j}) = {x, y}")
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            x = i - dt0*u0[ix(fg, i, j)]
+            y = j - dt0*v0[ix(fg, i, j)]
 
             if x < 0.5:
                 x = 0.5
-            if x > n + 0.5:
-                x = n + 0.5
+            if x > nx + 0.5:
+                x = nx + 0.5
             i0 = <int>x
             i1 = 1 + i0
 
             if y < 0.5:
                 y = 0.5
-            if y > n + 0.5:
-                y = n + 0.5
+            if y > ny + 0.5:
+                y = ny + 0.5
             j0 = <int>y
             j1 = 1 + j0
 
@@ -409,48 +3470,537 @@ cdef advect(FluidGrid* fg, int b, float* d, float* d0, float* u, float* v, float
             t1 = y - j0
             t0 = 1 - t1
 
-            d[ix(fg, i, j)] = (
-                s0 * (t0 * d0[ix(fg, i0, j0)] + t1*d0[ix(fg, i0, j1)]) +
-                s1 * (t0 * d0[ix(fg, i1, j0)] + t1*d0[ix(fg, i1, j1)])
+            u[ix(fg, i, j)] = (
+                s0 * (t0 * u0[ix(fg, i0, j0)] + t1*u0[ix(fg, i0, j1)]) +
+                s1 * (t0 * u0[ix(fg, i1, j0)] + t1*u0[ix(fg, i1, j1)])
+            )
+            v[ix(fg, i, j)] = (
+                s0 * (t0 * v0[ix(fg, i0, j0)] + t1*v0[ix(fg, i0, j1)]) +
+                s1 * (t0 * v0[ix(fg, i1, j0)] + t1*v0[ix(fg, i1, j1)])
             )
+        set_row_boundary_cells(fg, 1, u, i)
+        set_row_boundary_cells(fg, 2, v, i)
+    set_corner_cells(fg, u)
+    set_corner_cells(fg, v)
+
+
+#
+#
+# Active tiles: skipping the quiescent parts of the grid.
+# - the interior is cut into square tiles (see `ActiveTiles`). Each tick first scans all six attribute arrays: a tile is
+#   active if any of its values exceeds `fg.active_tile_threshold` in magnitude, which includes any source just added.
+# - the tick then runs on the active tiles plus a halo of `fg.active_tile_halo` tiles around them, through
+#   `fg.spans`; every other tile is zeroed, so the kernels may treat cells outside the spans as 0. The halo must cover
+#   how far diffusion and advection carry anything within one tick.
+# - the pressure solve is then restricted too, with p = 0 outside the spans, which approximates the global solve.
+# - everything falls back to full sweeps whenever the halo covers more than `fg.active_tile_max_fraction` of the
+#   tiles, and for the settings whose kernels do not follow `fg.spans`: the fused step, temporal blocking, the
+#   multigrid and conjugate-gradient pressure solvers, obstacles, and the corrected advection schemes, whose back-traces
+#   read the forward pass's results beyond the spans.
+#
+#
 
-    set_boundary_cells(fg, n, b, d)
+cdef void restrict_to_active_tiles(
+        FluidGrid* fg, real* density, real* vx, real* vy, real* density_prev, real* vx_prev, real* vy_prev
+) noexcept nogil:
+    """
+    updates `fg.active_tiles`, and points `fg.spans` at the tiles to process if this tick can be restricted to them.
+    """
 
+    cdef ActiveTiles* tiles = fg.active_tiles
+    cdef int tile_count = tiles.tiles_x * tiles.tiles_y
+
+    if (
+        fg.fused_step_enabled or fg.relaxation_block_depth > 1 or
+        fg.pressure_solver != PRESSURE_SOLVER_CODE_RELAXATION or fg.obstacle_flags != NULL or
+        fg.advection_scheme != ADVECTION_SCHEME_CODE_SEMI_LAGRANGIAN
+    ):
+        mark_all_tiles_processed(tiles)
+        return
+
+    memset(tiles.tile_states, TILE_ZERO, tile_count * sizeof(unsigned char))
+    scan_field_tiles(fg, tiles, density)
+    scan_field_tiles(fg, tiles, vx)
+    scan_field_tiles(fg, tiles, vy)
+    scan_field_tiles(fg, tiles, density_prev)
+    scan_field_tiles(fg, tiles, vx_prev)
+    scan_field_tiles(fg, tiles, vy_prev)
+
+    mark_processed_tiles(tiles, fg.active_tile_halo)
+    if tiles.processed_tile_count > fg.active_tile_max_fraction * tile_count:
+        mark_all_tiles_processed(tiles)
+        return
+
+    zero_unprocessed_tiles(fg, tiles, density)
+    zero_unprocessed_tiles(fg, tiles, vx)
+    zero_unprocessed_tiles(fg, tiles, vy)
+    zero_unprocessed_tiles(fg, tiles, density_prev)
+    zero_unprocessed_tiles(fg, tiles, vx_prev)
+    zero_unprocessed_tiles(fg, tiles, vy_prev)
+
+    build_tile_spans(tiles, fg.ny)
+    fg.spans = &tiles.spans
+    fg.step_stats.active_tile_fraction = <float>tiles.processed_tile_count / tile_count
+
+
+cdef void scan_field_tiles(FluidGrid* fg, ActiveTiles* tiles, real* x) noexcept nogil:
+    """
+    raises each tile's state to what the values of `x` over it call for; tiles already active are skipped.
+    """
 
-cdef project(FluidGrid* fg, float* u, float* v, float* p, float* div):
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int tile_size = tiles.tile_size
+    cdef int tiles_y = tiles.tiles_y
+    cdef real threshold = fg.active_tile_threshold
+    cdef real peak, value
+    cdef int tx, ty, i, j, t
+
+    for tx in prange(tiles.tiles_x, num_threads=fg.thread_count, schedule='static'):
+        for ty in range(tiles_y):
+            t = tx * tiles_y + ty
+            if tiles.tile_states[t] == TILE_ACTIVE:
+                continue
+
+            peak = 0
+            for i in range(1 + tx * tile_size, 1 + min(nx, (tx + 1) * tile_size)):
+                for j in range(1 + ty * tile_size, 1 + min(ny, (ty + 1) * tile_size)):
+                    value = x[ix(fg, i, j)]
+                    if value < 0:
+                        value = -value
+                    if value > peak:
+                        peak = value
+
+            if peak > threshold:
+                tiles.tile_states[t] = TILE_ACTIVE
+            elif peak > 0:
+                tiles.tile_states[t] = TILE_QUIESCENT
+
+
+cdef void mark_processed_tiles(ActiveTiles* tiles, int halo) noexcept nogil:
     """
-    implements the `project` operator, using Gauss-Seidel relaxation
-    - resizes vectors to preserve velocity components  
+    marks the active tiles, and the tiles within `halo` tiles of them, as processed.
     """
 
-    n = fg.n
-    h = 1.0 / n
+    cdef int tiles_x = tiles.tiles_x
+    cdef int tiles_y = tiles.tiles_y
+    cdef int tx, ty, hx, hy
 
-    for i in range(1, n+1):
-        for j in range(1, n+1):
-            div[ix(fg, i, j)] = (-0.5 * h) * (
-                + u[ix(fg, i+1, j)] - u[ix(fg, i-1, j)]
-                + v[ix(fg, i, j+1)] - v[ix(fg, i, j-1)]
+    memset(tiles.processed_tiles, 0, tiles_x * tiles_y * sizeof(unsigned char))
+    for tx in range(tiles_x):
+        for ty in range(tiles_y):
+            if tiles.tile_states[tx * tiles_y + ty] != TILE_ACTIVE:
+                continue
+            for hx in range(max(0, tx - halo), min(tiles_x, tx + halo + 1)):
+                for hy in range(max(0, ty - halo), min(tiles_y, ty + halo + 1)):
+                    tiles.processed_tiles[hx * tiles_y + hy] = 1
+
+    tiles.processed_tile_count = 0
+    for tx in range(tiles_x * tiles_y):
+        tiles.processed_tile_count += tiles.processed_tiles[tx]
+
+
+cdef void mark_all_tiles_processed(ActiveTiles* tiles) noexcept nogil:
+    cdef int tile_count = tiles.tiles_x * tiles.tiles_y
+    memset(tiles.processed_tiles, 1, tile_count * sizeof(unsigned char))
+    tiles.processed_tile_count = tile_count
+
+
+cdef void zero_unprocessed_tiles(FluidGrid* fg, ActiveTiles* tiles, real* x) noexcept nogil:
+    """
+    zeroes `x` over every tile left out of the processed ones that is not already all zeros.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int tile_size = tiles.tile_size
+    cdef int tiles_y = tiles.tiles_y
+    cdef int tx, ty, i, j_start, j_stop, t
+
+    for tx in prange(tiles.tiles_x, num_threads=fg.thread_count, schedule='static'):
+        for ty in range(tiles_y):
+            t = tx * tiles_y + ty
+            if tiles.processed_tiles[t] or tiles.tile_states[t] == TILE_ZERO:
+                continue
+
+            j_start = 1 + ty * tile_size
+            j_stop = 1 + min(ny, (ty + 1) * tile_size)
+            for i in range(1 + tx * tile_size, 1 + min(nx, (tx + 1) * tile_size)):
+                memset(&x[ix(fg, i, j_start)], 0, (j_stop - j_start) * sizeof(real))
+
+
+cdef void build_tile_spans(ActiveTiles* tiles, int ny) noexcept nogil:
+    """
+    lists the processed tiles as `tiles.spans`: one band per row of tiles, one span per run of processed tiles.
+    """
+
+    cdef int tiles_x = tiles.tiles_x
+    cdef int tiles_y = tiles.tiles_y
+    cdef int tile_size = tiles.tile_size
+    cdef int span_count = 0
+    cdef int tx, ty, run_start
+
+    for tx in range(tiles_x):
+        tiles.spans.band_offsets[tx] = span_count
+        ty = 0
+        while ty < tiles_y:
+            if not tiles.processed_tiles[tx * tiles_y + ty]:
+                ty += 1
+                continue
+
+            run_start = ty
+            while ty < tiles_y and tiles.processed_tiles[tx * tiles_y + ty]:
+                ty += 1
+            tiles.spans.starts[span_count] = 1 + run_start * tile_size
+            tiles.spans.stops[span_count] = 1 + min(ny, ty * tile_size)
+            span_count += 1
+
+    tiles.spans.band_offsets[tiles_x] = span_count
+
+
+#
+#
+# Pressure solvers:
+# - all solve the discrete Poisson equation `4 p - (sum of p's 4 neighbors) = div` over interior cells, with mirrored
+#   (Neumann) border cells, i.e. the system `linear_solve(fg, 0, p, div, 1, 1/4, ...)` relaxes.
+# - the operator is singular (constant `p` is in its null-space), so `div` is first shifted to mean zero, which keeps
+#   the system consistent under float round-off.
+# - around obstacles, solid cells are left out of the system (held at p = 0), and mirror their fluid neighbors as the
+#   border does (see `relax_around_obstacles`). Multigrid's coarse levels know nothing of obstacles, so grids with
+#   obstacles solve with conjugate gradients instead.
+#
+#
+
+cdef SolveStats solve_pressure(FluidGrid* fg, real* p, real* div) noexcept nogil:
+    if fg.pressure_solver == PRESSURE_SOLVER_CODE_MULTIGRID and fg.obstacle_flags == NULL:
+        return multigrid_solve(fg, p, div)
+    elif fg.pressure_solver != PRESSURE_SOLVER_CODE_RELAXATION:
+        return conjugate_gradient_solve(fg, p, div)
+    else:
+        return linear_solve(fg, 0, p, div, 1.0, 0.25, fg.pressure_max_iterations, fg.pressure_tolerance, 0)
+
+
+cdef inline int ix_sized(int size_y, int x, int y) noexcept nogil:
+    """
+    `ix` for grids other than `fg` itself, e.g. coarse multigrid levels, with `size_y` cells per column.
+    """
+
+    return x * size_y + y
+
+
+cdef void set_neumann_boundary_cells(GridLevel* level, real* x) noexcept nogil:
+    """
+    `set_boundary_cells(fg, 0, x)` for one multigrid level.
+    :param x: one of `level`'s arrays, typed (see `PressureWorkspace`)
+    """
+
+    cdef int nx = level.nx
+    cdef int ny = level.ny
+    cdef int size_y = level.size_y
+    cdef int i
+    for i in range(1, 1+ny):
+        x[ix_sized(size_y, 0, i)] = x[ix_sized(size_y, 1, i)]
+        x[ix_sized(size_y, nx+1, i)] = x[ix_sized(size_y, nx, i)]
+    for i in range(1, 1+nx):
+        x[ix_sized(size_y, i, 0)] = x[ix_sized(size_y, i, 1)]
+        x[ix_sized(size_y, i, ny+1)] = x[ix_sized(size_y, i, ny)]
+
+    x[ix_sized(size_y, 0, 0)] = 0.5 * (x[ix_sized(size_y, 1, 0)] + x[ix_sized(size_y, 0, 1)])
+    x[ix_sized(size_y, 0, ny+1)] = 0.5 * (x[ix_sized(size_y, 1, ny+1)] + x[ix_sized(size_y, 0, ny)])
+    x[ix_sized(size_y, nx+1, 0)] = 0.5 * (x[ix_sized(size_y, nx, 0)] + x[ix_sized(size_y, nx+1, 1)])
+    x[ix_sized(size_y, nx+1, ny+1)] = 0.5 * (x[ix_sized(size_y, nx, ny+1)] + x[ix_sized(size_y, nx+1, ny)])
+
+
+cdef double dot_interior(FluidGrid* fg, real* x, real* y) noexcept nogil:
+    cdef double total = 0.0
+    cdef int i, j
+
+    for i in prange(1, fg.nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, fg.ny+1):
+            total += <double>x[ix(fg, i, j)] * y[ix(fg, i, j)]
+
+    return total
+
+
+cdef void remove_mean(FluidGrid* fg, real* x) noexcept nogil:
+    # over the fluid cells: solid cells stay at 0.
+    cdef unsigned char* flags = fg.obstacle_flags
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef double total = 0.0
+    cdef real mean
+    cdef int i, j
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            total += x[ix(fg, i, j)]
+
+    mean = <real>(total / (<double>nx * ny - fg.solid_cell_count))
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            if flags == NULL or not flags[ix(fg, i, j)] & OBSTACLE_SOLID:
+                x[ix(fg, i, j)] -= mean
+
+
+cdef double compute_residual(FluidGrid* fg, GridLevel* level, real* x) noexcept nogil:
+    """
+    writes `rhs - A x` into `level.residual`, reading `x`'s border cells.
+    :param x: `level.x`, typed (see `PressureWorkspace`)
+    :return: the squared 2-norm of the residual
+    """
+
+    cdef int nx = level.nx
+    cdef int ny = level.ny
+    cdef int size = level.size_y
+    cdef real* rhs = <real*>level.rhs
+    cdef real* residual = <real*>level.residual
+    cdef double total = 0.0
+    cdef real r
+    cdef int i, j
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            r = rhs[ix_sized(size, i, j)] - (
+                4 * x[ix_sized(size, i, j)]
+                - x[ix_sized(size, i-1, j)] - x[ix_sized(size, i+1, j)]
+                - x[ix_sized(size, i, j-1)] - x[ix_sized(size, i, j+1)]
             )
-            p[ix(fg, i, j)] = 0
+            residual[ix_sized(size, i, j)] = r
+            total += <double>r * r
+
+    return total
+
+
+cdef void smooth_level(FluidGrid* fg, GridLevel* level, real* x, int sweep_count) noexcept nogil:
+    """
+    runs red-black Gauss-Seidel sweeps of `x = (rhs + sum of x's 4 neighbors) / 4` on one multigrid level.
+    :param x: `level.x`, typed (see `PressureWorkspace`)
+    """
+
+    cdef int nx = level.nx
+    cdef int ny = level.ny
+    cdef int size = level.size_y
+    cdef real* rhs = <real*>level.rhs
+    cdef int k, color, i, j
+
+    for k in range(sweep_count):
+        for color in range(2):
+            for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+                for j in range(1 + (i + 1 + color) % 2, ny+1, 2):
+                    x[ix_sized(size, i, j)] = 0.25 * (
+                        rhs[ix_sized(size, i, j)]
+                        + x[ix_sized(size, i-1, j)] + x[ix_sized(size, i+1, j)]
+                        + x[ix_sized(size, i, j-1)] + x[ix_sized(size, i, j+1)]
+                    )
+        set_neumann_boundary_cells(level, x)
+
+
+cdef void restrict_residual(FluidGrid* fg, GridLevel* fine, GridLevel* coarse, real* residual) noexcept nogil:
+    """
+    each coarse cell covers 2x2 fine cells; since `A` scales with the squared cell width, the coarse right-hand side is
+    4x the mean, i.e. the sum, of the fine residuals.
+    :param residual: `fine.residual`, typed (see `PressureWorkspace`)
+    """
+
+    cdef int fs = fine.size_y
+    cdef int cs = coarse.size_y
+    cdef real* coarse_rhs = <real*>coarse.rhs
+    cdef int i, j
+
+    memset(coarse.x, 0, coarse.size_x * coarse.size_y * sizeof(real))
+    for i in prange(1, coarse.nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, coarse.ny+1):
+            coarse_rhs[ix_sized(cs, i, j)] = (
+                residual[ix_sized(fs, 2*i - 1, 2*j - 1)] + residual[ix_sized(fs, 2*i, 2*j - 1)] +
+                residual[ix_sized(fs, 2*i - 1, 2*j)] + residual[ix_sized(fs, 2*i, 2*j)]
+            )
+
+
+cdef void prolong_and_correct(FluidGrid* fg, GridLevel* coarse, GridLevel* fine, real* e) noexcept nogil:
+    """
+    adds the coarse-grid correction to the fine solution, interpolating bilinearly between cell centers.
+    - a fine cell lies a quarter coarse-cell away from its parent's center, so its weights are 9/16, 3/16, 3/16, 1/16.
+    :param e: `coarse.x`, typed (see `PressureWorkspace`)
+    """
+
+    cdef int cs = coarse.size_y
+    cdef int fs = fine.size_y
+    cdef real* fine_x = <real*>fine.x
+    cdef int i, j, ci, cj, ni, nj
+
+    set_neumann_boundary_cells(coarse, e)
+    for i in prange(1, fine.nx+1, num_threads=fg.thread_count, schedule='static'):
+        ci = (i + 1) // 2
+        ni = ci - 1 if i % 2 == 1 else ci + 1
+        for j in range(1, fine.ny+1):
+            cj = (j + 1) // 2
+            nj = cj - 1 if j % 2 == 1 else cj + 1
+            fine_x[ix_sized(fs, i, j)] += (
+                0.5625 * e[ix_sized(cs, ci, cj)] +
+                0.1875 * (e[ix_sized(cs, ni, cj)] + e[ix_sized(cs, ci, nj)]) +
+                0.0625 * e[ix_sized(cs, ni, nj)]
+            )
+    set_neumann_boundary_cells(fine, fine_x)
+
+
+cdef void v_cycle(FluidGrid* fg, PressureWorkspace* ws, int l, real* x) noexcept nogil:
+    """
+    :param x: `ws.levels[l].x`, typed (see `PressureWorkspace`)
+    """
+
+    cdef int smooth_sweep_count = 2
+    cdef int max_coarse_sweep_count = 64
+    cdef GridLevel* level = &ws.levels[l]
+    cdef GridLevel* coarse = &ws.levels[l+1]
+
+    if l == ws.level_count - 1:
+        # the coarsest level is small enough to simply relax until (roughly) converged.
+        # - when `nx` or `ny` is odd, no coarsening is possible and this degrades to plain red-black relaxation.
+        smooth_level(fg, level, x, min(2 * max(level.nx, level.ny) + 10, max_coarse_sweep_count))
+        return
+
+    smooth_level(fg, level, x, smooth_sweep_count)
+    compute_residual(fg, level, x)
+    restrict_residual(fg, level, coarse, <real*>level.residual)
+    v_cycle(fg, ws, l+1, <real*>coarse.x)
+    prolong_and_correct(fg, coarse, level, <real*>coarse.x)
+    smooth_level(fg, level, x, smooth_sweep_count)
+
+
+cdef SolveStats multigrid_solve(FluidGrid* fg, real* p, real* div) noexcept nogil:
+    """
+    solves for pressure with geometric multigrid V-cycles.
+    :return: the number of V-cycles run, and the final relative residual
+    """
+
+    cdef PressureWorkspace* ws = fg.pressure_workspace
+    cdef GridLevel* top = &ws.levels[0]
+    cdef SolveStats stats
+    cdef double rhs_norm, residual_norm
+    cdef int k
+
+    top.x = p
+    top.rhs = div
+    stats.iterations = 0
+    stats.residual = 0
+
+    remove_mean(fg, div)
+    rhs_norm = sqrt(dot_interior(fg, div, div))
+    if rhs_norm == 0:
+        return stats
+
+    for k in range(fg.pressure_max_iterations):
+        v_cycle(fg, ws, 0, p)
+        residual_norm = sqrt(compute_residual(fg, top, p))
+        stats.iterations = k + 1
+        stats.residual = <float>(residual_norm / rhs_norm)
+        if residual_norm <= fg.pressure_tolerance * rhs_norm:
+            break
 
-    set_boundary_cells(fg, n, 0, div)
-    set_boundary_cells(fg, n, 0, p)
+    return stats
 
-    for k in range(20):
-        for i in range(1, n+1):
-            for j in range(1, n+1):
-                p[ix(fg, i, j)] = (1/4) * (
-                    + div[ix(fg, i, j)]
-                    + p[ix(fg, i-1, j)] + p[ix(fg, i+1, j)]
-                    + p[ix(fg, i, j-1)] + p[ix(fg, i, j+1)]
+
+cdef void apply_poisson_operator(FluidGrid* fg, real* x, real* out) noexcept nogil:
+    """
+    writes `A x` into `out`, mirroring `x`'s border cells first, and across obstacles' walls (0 in solid cells).
+    """
+
+    cdef unsigned char* flags = fg.obstacle_flags
+    cdef int i, j
+
+    set_boundary_cells(fg, 0, x)
+    for i in prange(1, fg.nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, fg.ny+1):
+            if flags == NULL:
+                out[ix(fg, i, j)] = (
+                    4 * x[ix(fg, i, j)]
+                    - x[ix(fg, i-1, j)] - x[ix(fg, i+1, j)]
+                    - x[ix(fg, i, j-1)] - x[ix(fg, i, j+1)]
                 )
-        set_boundary_cells(fg, n, 0, p)
+            elif flags[ix(fg, i, j)] & OBSTACLE_SOLID:
+                out[ix(fg, i, j)] = 0
+            else:
+                out[ix(fg, i, j)] = 4 * x[ix(fg, i, j)] - mirrored_neighbor_sum(fg, x, i, j, flags[ix(fg, i, j)], 1, 1)
+
+
+cdef inline float poisson_diagonal(FluidGrid* fg, int i, int j) noexcept nogil:
+    """
+    the diagonal of `A`: 4, less one for each mirrored neighbor, be it a border or a solid cell. Solid cells, and fluid
+    cells walled in on all sides, whose rows of `A` are empty, get 1 so that they can be divided by.
+    """
+
+    cdef unsigned char flags = 0 if fg.obstacle_flags == NULL else fg.obstacle_flags[ix(fg, i, j)]
+    cdef int diagonal = 4 - (i == 1) - (i == fg.nx) - (j == 1) - (j == fg.ny)
+
+    if flags:
+        diagonal -= (
+            ((flags & OBSTACLE_SOLID_LEFT) != 0) + ((flags & OBSTACLE_SOLID_RIGHT) != 0) +
+            ((flags & OBSTACLE_SOLID_DOWN) != 0) + ((flags & OBSTACLE_SOLID_UP) != 0)
+        )
+    return diagonal if diagonal > 0 and not flags & OBSTACLE_SOLID else 1
 
-    for i in range(1, n+1):
-        for j in range(1, n+1):
-            u[ix(fg, i, j)] -= (0.5/h) * (p[ix(fg, i+1, j)] - p[ix(fg, i-1, j)])
-            v[ix(fg, i, j)] -= (0.5/h) * (p[ix(fg, i, j+1)] - p[ix(fg, i, j-1)])
 
-    set_boundary_cells(fg, n, 1, u)
-    set_boundary_cells(fg, n, 2, v)
\ No newline at end of file
+cdef SolveStats conjugate_gradient_solve(FluidGrid* fg, real* p, real* div) noexcept nogil:
+    """
+    solves for pressure with Jacobi-preconditioned conjugate gradients, starting from `p = 0`.
+    :return: the number of iterations run, and the final relative residual
+    """
+
+    cdef PressureWorkspace* ws = fg.pressure_workspace
+    cdef real* r = <real*>ws.cg_r
+    cdef real* z = <real*>ws.cg_z
+    cdef real* d = <real*>ws.cg_d
+    cdef real* q = <real*>ws.cg_q
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef SolveStats stats
+    cdef double rhs_norm, residual_norm, rz, rz_next, alpha, beta, dq
+    cdef int k, i, j
+
+    stats.iterations = 0
+    stats.residual = 0
+
+    remove_mean(fg, div)
+    rhs_norm = sqrt(dot_interior(fg, div, div))
+    if rhs_norm == 0:
+        return stats
+    stats.residual = 1
+
+    memset(d, 0, fg.cell_count * sizeof(real))
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            p[ix(fg, i, j)] = 0
+            r[ix(fg, i, j)] = div[ix(fg, i, j)]
+            z[ix(fg, i, j)] = r[ix(fg, i, j)] / poisson_diagonal(fg, i, j)
+            d[ix(fg, i, j)] = z[ix(fg, i, j)]
+    rz = dot_interior(fg, r, z)
+
+    for k in range(fg.pressure_max_iterations):
+        apply_poisson_operator(fg, d, q)
+        dq = dot_interior(fg, d, q)
+        if dq <= 0:
+            # the search direction has collapsed to round-off: no further progress is possible.
+            break
+        alpha = rz / dq
+
+        for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+            for j in range(1, ny+1):
+                p[ix(fg, i, j)] += <real>alpha * d[ix(fg, i, j)]
+                r[ix(fg, i, j)] -= <real>alpha * q[ix(fg, i, j)]
+                z[ix(fg, i, j)] = r[ix(fg, i, j)] / poisson_diagonal(fg, i, j)
+
+        residual_norm = sqrt(dot_interior(fg, r, r))
+        stats.iterations = k + 1
+        stats.residual = <float>(residual_norm / rhs_norm)
+        if residual_norm <= fg.pressure_tolerance * rhs_norm:
+            break
+
+        rz_next = dot_interior(fg, r, z)
+        beta = rz_next / rz
+        rz = rz_next
+        for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+            for j in range(1, ny+1):
+                d[ix(fg, i, j)] = z[ix(fg, i, j)] + <real>beta * d[ix(fg, i, j)]
+
+    set_boundary_cells(fg, 0, p)
+    return stats
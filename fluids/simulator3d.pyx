@@ -0,0 +1,941 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True, initializedcheck=False
+
+"""
+A 3D counterpart of `fluids.simulator`: Stam's solver on an (nx x ny x nz) grid of cubic cells, as extended to 3D by
+Mike Ash, behind the same API (see `Simulator3D`).
+https://mikeash.com/pyblog/fluid-simulation-for-dummies.html
+- fields are float32, and a grid holds 7 arrays of them (see `FIELDS_PER_CELL`): density, the 3 velocity components,
+  and the 3 velocity sources, which double as the solver's scratch space. A 128^3 grid takes ~62 MB.
+- density sources are added straight into the density, scaled by `dt` (see `Simulator3D.add_density_at`), which is
+  what the step's `add_source` would do with them, and saves a source array.
+- the kernels are typed C, as in `fluids.simulator`, with `prange` loops over x-planes. Pressure is solved by
+  relaxation only.
+"""
+
+import os
+
+import numpy as np
+
+from cython.parallel cimport prange
+from libc.stdlib cimport malloc, calloc, free
+from libc.string cimport memset
+from libc.math cimport sqrt
+
+from .simulator import RELAXATION_GAUSS_SEIDEL, RELAXATION_RED_BLACK
+
+
+#
+#
+# Python Wrapper:
+#
+#
+
+
+# relaxation orders accepted by `Simulator3D.relaxation`, as in `Simulator.relaxation`:
+relaxation_order_codes = {
+    RELAXATION_GAUSS_SEIDEL: RELAXATION_ORDER_LEXICOGRAPHIC,
+    RELAXATION_RED_BLACK: RELAXATION_ORDER_RED_BLACK,
+}
+
+# the fields `Simulator3D.field_view` and `Simulator3D.extract_slice` accept:
+FIELD_NAMES = ('density', 'vx', 'vy', 'vz')
+
+# the number of float32 arrays a grid allocates, each of one value per cell, borders included:
+FIELDS_PER_CELL = 7
+
+
+class Simulator3D(object):
+    def __init__(self, n: int, init_diffusion, init_viscosity, max_display_updates_per_sec=60.0, time_rate=1.0,
+                 thread_count=1, relaxation=RELAXATION_RED_BLACK, ny=None, nz=None):
+        """
+        :param n: the number of non-border cells per edge, or along x only if `ny` or `nz` is given
+        :param ny: the number of non-border cells along y (default: `n`)
+        :param nz: the number of non-border cells along z (default: `n`)
+        """
+        self.max_display_updates_per_sec = max_display_updates_per_sec
+        self.internal_time_rate = time_rate
+        self.grid = FluidGrid3DOwner(
+            n, n if ny is None else ny, n if nz is None else nz, init_diffusion, init_viscosity, self.dt
+        )
+        self.thread_count = thread_count
+        self.relaxation = relaxation
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
+
+    def ix(self, x, y, z):
+        return ix3(grid3_of(self), x, y, z)
+
+    def step(self):
+        cdef FluidGrid3D* fg = grid3_of(self)
+        with nogil:
+            advance_fg3_state_by_one_tick(fg)
+
+    def dispose(self):
+        """
+        Releases this simulator's grid, as `Simulator.dispose` does.
+        """
+        self.grid = None
+
+    @property
+    def cell_count(self):
+        return grid3_of(self).cell_count
+
+    @property
+    def nbytes(self):
+        """
+        the memory taken by the grid's fields: `FIELDS_PER_CELL` float32 values per cell
+        """
+        return FIELDS_PER_CELL * grid3_of(self).cell_count * sizeof(float)
+
+    @property
+    def nx(self):
+        return grid3_of(self).nx
+
+    @property
+    def ny(self):
+        return grid3_of(self).ny
+
+    @property
+    def nz(self):
+        return grid3_of(self).nz
+
+    @property
+    def shape(self):
+        """
+        the shape of the grid's fields, borders included: (nx + 2, ny + 2, nz + 2), indexed as [x, y, z]
+        - cells are cubic whatever the grid's shape: the longest edge spans a unit length.
+        """
+        fg = grid3_of(self)
+        return fg.size_x, fg.size_y, fg.size_z
+
+    def field_view(self, field_name):
+        """
+        Returns a zero-copy view of one of the grid's fields, which tracks every later `step` and keeps the grid alive.
+        :param field_name: one of `FIELD_NAMES`
+        :return: an (nx + 2, ny + 2, nz + 2) float32 array indexed as [x, y, z]
+        """
+        fg = grid3_of(self)
+        return new_volume_view(self.grid, fg3_field(fg, field_name), fg.size_x, fg.size_y, fg.size_z)
+
+    def density_view(self):
+        return self.field_view('density')
+
+    def vx_view(self):
+        return self.field_view('vx')
+
+    def vy_view(self):
+        return self.field_view('vy')
+
+    def vz_view(self):
+        return self.field_view('vz')
+
+    def extract_slice(self, field_name, axis, index, out=None):
+        """
+        Copies one plane of a field, e.g. for display.
+        - planes across x are contiguous in memory, and come out of a single copy; the others are gathered by a typed
+          loop. For a zero-copy (strided) plane, index `field_view` instead.
+        :param field_name: one of `FIELD_NAMES`
+        :param axis: the axis the plane is normal to: 0 for x, 1 for y, 2 for z
+        :param index: the plane's index along `axis`, borders included
+        :param out: a C-contiguous float32 buffer of the plane's shape (`shape` without `axis`), or `None` to allocate
+            one
+        :return: `out`, or the new array, indexed as `shape` without `axis`, e.g. [y, z] for axis 0
+        """
+        cdef FluidGrid3D* fg = grid3_of(self)
+        shape = self.shape
+        if axis not in (0, 1, 2):
+            raise ValueError(f"axis must be 0, 1 or 2, got {axis!r}")
+        if not 0 <= index < shape[axis]:
+            raise IndexError(f"plane {index} lies outside a grid of shape {shape} along axis {axis}")
+
+        plane_shape = tuple(size for k, size in enumerate(shape) if k != axis)
+        if out is None:
+            out = np.empty(plane_shape, dtype=np.float32)
+        copy_plane_into(fg, <float*>fg3_field(fg, field_name), axis, index, out)
+        return out
+
+    @property
+    def dt(self):
+        # keep simulation in lock-step with maximum display update-rate-- intended for interactive applications.
+        return self.internal_time_rate * (1.0 / self.max_display_updates_per_sec)
+
+    @property
+    def time_rate(self):
+        return self.internal_time_rate
+
+    @time_rate.setter
+    def time_rate(self, value):
+        """
+        updates the time rate
+        :param value: new time rate (1 => real-time)
+        """
+        self.internal_time_rate = value
+        grid3_of(self).dt = self.dt
+
+    @property
+    def diffusion(self):
+        return grid3_of(self).diffusion
+
+    @diffusion.setter
+    def diffusion(self, new_diffusion):
+        grid3_of(self).diffusion = new_diffusion
+
+    @property
+    def viscosity(self):
+        return grid3_of(self).viscosity
+
+    @viscosity.setter
+    def viscosity(self, new_viscosity):
+        grid3_of(self).viscosity = new_viscosity
+
+    @property
+    def thread_count(self):
+        return grid3_of(self).thread_count
+
+    @thread_count.setter
+    def thread_count(self, new_thread_count):
+        """
+        sets the number of OpenMP threads used by the parallel loops
+        :param new_thread_count: a positive thread count, or `None` to use every available CPU.
+        """
+        if new_thread_count is None:
+            new_thread_count = os.cpu_count() or 1
+        if new_thread_count < 1:
+            raise ValueError(f"thread_count must be positive, got {new_thread_count}")
+        grid3_of(self).thread_count = new_thread_count
+
+    @property
+    def relaxation(self):
+        code = grid3_of(self).relaxation_order
+        return next(name for name, name_code in relaxation_order_codes.items() if name_code == code)
+
+    @relaxation.setter
+    def relaxation(self, new_relaxation):
+        """
+        selects the cell ordering used by the `diffuse` and `project` relaxation sweeps (red-black by default, as only
+        red-black sweeps run across `thread_count` threads)
+        :param new_relaxation: `RELAXATION_GAUSS_SEIDEL` or `RELAXATION_RED_BLACK`
+        """
+        try:
+            grid3_of(self).relaxation_order = relaxation_order_codes[new_relaxation]
+        except KeyError:
+            raise ValueError(f"unknown relaxation order: {new_relaxation!r}") from None
+
+    @property
+    def pressure_tolerance(self):
+        return grid3_of(self).pressure_tolerance
+
+    @pressure_tolerance.setter
+    def pressure_tolerance(self, new_tolerance):
+        """
+        sets the relative residual at which the pressure sweeps stop early
+        """
+        if new_tolerance < 0:
+            raise ValueError(f"pressure_tolerance must be non-negative, got {new_tolerance}")
+        grid3_of(self).pressure_tolerance = new_tolerance
+
+    @property
+    def pressure_max_iterations(self):
+        return grid3_of(self).pressure_max_iterations
+
+    @pressure_max_iterations.setter
+    def pressure_max_iterations(self, new_max_iterations):
+        """
+        caps the relaxation sweeps run by each pressure solve
+        """
+        if new_max_iterations < 1:
+            raise ValueError(f"pressure_max_iterations must be positive, got {new_max_iterations}")
+        grid3_of(self).pressure_max_iterations = new_max_iterations
+
+    @property
+    def diffusion_tolerance(self):
+        return grid3_of(self).diffusion_tolerance
+
+    @diffusion_tolerance.setter
+    def diffusion_tolerance(self, new_tolerance):
+        """
+        sets the relative residual at which the `diffuse` sweeps stop early (0 => always run the maximum)
+        """
+        if new_tolerance < 0:
+            raise ValueError(f"diffusion_tolerance must be non-negative, got {new_tolerance}")
+        grid3_of(self).diffusion_tolerance = new_tolerance
+
+    @property
+    def diffusion_max_iterations(self):
+        return grid3_of(self).diffusion_max_iterations
+
+    @diffusion_max_iterations.setter
+    def diffusion_max_iterations(self, new_max_iterations):
+        """
+        caps the relaxation sweeps run by each `diffuse` call
+        """
+        if new_max_iterations < 1:
+            raise ValueError(f"diffusion_max_iterations must be positive, got {new_max_iterations}")
+        grid3_of(self).diffusion_max_iterations = new_max_iterations
+
+    def add_density(self, pos_xyz, amount: float):
+        x, y, z = pos_xyz
+        fg = grid3_of(self)
+        check_cell_in_bounds3(fg, x, y, z)
+        fg.density[ix3(fg, x, y, z)] += amount
+
+    def add_velocity(self, pos_xyz, amount_xyz):
+        x, y, z = pos_xyz
+        amount_x, amount_y, amount_z = amount_xyz
+        fg = grid3_of(self)
+        check_cell_in_bounds3(fg, x, y, z)
+        index = ix3(fg, x, y, z)
+        fg.vx[index] += amount_x
+        fg.vy[index] += amount_y
+        fg.vz[index] += amount_z
+
+    def add_density_at(self, xs, ys, zs, amounts, immediate=False):
+        """
+        Adds density at many cells in one call.
+        By default the amounts are per-step sources, as in `Simulator.add_density_at`: unlike there, they are added
+        straight into the density, scaled by `dt`, which is what the next `step` would do first. Re-add them every
+        frame for a continuous emitter.
+        :param xs: an integer array of x-coordinates
+        :param ys: an integer array of y-coordinates, the same shape as `xs`
+        :param zs: an integer array of z-coordinates, the same shape as `xs`
+        :param amounts: a scalar, or an array the same shape as `xs`; duplicate cells accumulate.
+        :param immediate: if True, adds the amounts unscaled, like `add_density`.
+        """
+        fg = grid3_of(self)
+        scatter_add3(fg, fg.density, xs, ys, zs, amounts, 1.0 if immediate else fg.dt)
+
+    def add_velocity_at(self, xs, ys, zs, amounts_x, amounts_y, amounts_z, immediate=False):
+        """
+        Adds velocity at many cells in one call: by default into the source buffers (see `source_views`), applied
+        (scaled by `dt`) by the next `step`, then cleared; if `immediate`, straight into the velocity fields.
+        """
+        fg = grid3_of(self)
+        scatter_add3(fg, fg.vx if immediate else fg.vx_prev, xs, ys, zs, amounts_x, 1.0)
+        scatter_add3(fg, fg.vy if immediate else fg.vy_prev, xs, ys, zs, amounts_y, 1.0)
+        scatter_add3(fg, fg.vz if immediate else fg.vz_prev, xs, ys, zs, amounts_z, 1.0)
+
+    def source_views(self):
+        """
+        Returns zero-copy views of the per-step velocity source buffers, which the next `step` consumes and then clears
+        (density sources have no buffer; see `add_density_at`).
+        :return: (vx, vy, vz) sources, each an (nx + 2, ny + 2, nz + 2) float32 array indexed as [x, y, z].
+        """
+        fg = grid3_of(self)
+        return (
+            new_volume_view(self.grid, fg.vx_prev, fg.size_x, fg.size_y, fg.size_z),
+            new_volume_view(self.grid, fg.vy_prev, fg.size_x, fg.size_y, fg.size_z),
+            new_volume_view(self.grid, fg.vz_prev, fg.size_x, fg.size_y, fg.size_z),
+        )
+
+    def clear_density_and_velocity(self):
+        fg3_soft_reset(grid3_of(self))
+
+
+#
+#
+# `FluidGrid3DOwner`: ties the lifetime of a C-space `FluidGrid3D` to a Python object, as `FluidGridOwner` does in 2D.
+#
+#
+
+cdef class FluidGrid3DOwner:
+    cdef FluidGrid3D* fg
+
+    def __cinit__(self, int nx, int ny, int nz, float init_diffusion, float init_viscosity, float dt):
+        if nx < 1 or ny < 1 or nz < 1:
+            raise ValueError(f"a grid needs at least one cell per edge, got {nx}x{ny}x{nz}")
+        self.fg = new_fg3(nx, ny, nz, init_diffusion, init_viscosity, dt)
+        if self.fg == NULL:
+            raise MemoryError(f"cannot allocate a {nx}x{ny}x{nz} grid")
+
+    def __dealloc__(self):
+        if self.fg != NULL:
+            del_fg3(self.fg)
+            self.fg = NULL
+
+
+cdef inline FluidGrid3D* grid3_of(object sim) except NULL:
+    """
+    Retrieves the `FluidGrid3D` owned by a `Simulator3D`.
+    :param sim: the simulator whose grid to look up.
+    :return: the simulator's grid
+    """
+
+    owner = sim.grid
+    if owner is None:
+        raise ValueError("this Simulator3D has been disposed")
+    return (<FluidGrid3DOwner>owner).fg
+
+
+cdef float* fg3_field(FluidGrid3D* fg, field_name) except NULL:
+    if field_name == 'density':
+        return fg.density
+    elif field_name == 'vx':
+        return fg.vx
+    elif field_name == 'vy':
+        return fg.vy
+    elif field_name == 'vz':
+        return fg.vz
+    raise ValueError(f"unknown field: {field_name!r}, expected one of {FIELD_NAMES}")
+
+
+#
+#
+# Zero-copy field access:
+# - views alias the grid's buffers, as in `fluids.simulator`, and keep its owner alive.
+#
+#
+
+cdef class VolumeBuffer:
+    cdef float* data
+    cdef Py_ssize_t shape[3]
+    cdef Py_ssize_t strides[3]
+
+    # keeps the owning simulator alive for as long as any view exists:
+    cdef object owner
+
+    def __getbuffer__(self, Py_buffer* buffer, int flags):
+        buffer.buf = <void*>self.data
+        buffer.obj = self
+        buffer.len = self.shape[0] * self.shape[1] * self.shape[2] * sizeof(float)
+        buffer.readonly = 0
+        buffer.itemsize = sizeof(float)
+        buffer.format = 'f'
+        buffer.ndim = 3
+        buffer.shape = self.shape
+        buffer.strides = self.strides
+        buffer.suboffsets = NULL
+        buffer.internal = NULL
+
+    def __releasebuffer__(self, Py_buffer* buffer):
+        pass
+
+
+cdef new_volume_view(object owner, float* data, int size_x, int size_y, int size_z):
+    """
+    Wraps a (size_x x size_y x size_z) attribute array in a NumPy array without copying it.
+    :return: a writable (size_x, size_y, size_z) float32 `np.ndarray`.
+    """
+
+    cdef VolumeBuffer volume_buffer = VolumeBuffer.__new__(VolumeBuffer)
+    volume_buffer.data = data
+    volume_buffer.shape[0] = size_x
+    volume_buffer.shape[1] = size_y
+    volume_buffer.shape[2] = size_z
+    volume_buffer.strides[0] = size_y * size_z * sizeof(float)
+    volume_buffer.strides[1] = size_z * sizeof(float)
+    volume_buffer.strides[2] = sizeof(float)
+    volume_buffer.owner = owner
+    return np.asarray(volume_buffer)
+
+
+cdef copy_plane_into(FluidGrid3D* fg, float* data, int axis, int index, float[:, ::1] out):
+    """
+    Copies the plane `index` across `axis` of an attribute array into a preallocated buffer (see
+    `Simulator3D.extract_slice`).
+    """
+
+    cdef int size_x = fg.size_x
+    cdef int size_y = fg.size_y
+    cdef int size_z = fg.size_z
+    cdef int expected_rows = size_y if axis == 0 else size_x
+    cdef int expected_columns = size_y if axis == 2 else size_z
+    cdef int i, j
+
+    if out.shape[0] != expected_rows or out.shape[1] != expected_columns:
+        raise ValueError(
+            f"expected a ({expected_rows}, {expected_columns}) output buffer, got ({out.shape[0]}, {out.shape[1]})"
+        )
+
+    with nogil:
+        if axis == 0:
+            for i in range(size_y):
+                for j in range(size_z):
+                    out[i, j] = data[ix3(fg, index, i, j)]
+        elif axis == 1:
+            for i in range(size_x):
+                for j in range(size_z):
+                    out[i, j] = data[ix3(fg, i, index, j)]
+        else:
+            for i in range(size_x):
+                for j in range(size_y):
+                    out[i, j] = data[ix3(fg, i, j, index)]
+
+
+cdef scatter_add3(FluidGrid3D* fg, float* data, xs, ys, zs, amounts, float scale):
+    """
+    Adds `scale * amounts` to the cells (xs, ys, zs) of an attribute array in one typed loop.
+    - all coordinates are checked before anything is written, so a bad index leaves the array untouched.
+    """
+
+    cdef Py_ssize_t[::1] flat_xs = np.ascontiguousarray(np.ravel(xs), dtype=np.intp)
+    cdef Py_ssize_t[::1] flat_ys = np.ascontiguousarray(np.ravel(ys), dtype=np.intp)
+    cdef Py_ssize_t[::1] flat_zs = np.ascontiguousarray(np.ravel(zs), dtype=np.intp)
+    cdef const float[:] flat_amounts
+    cdef Py_ssize_t k
+
+    if not flat_xs.shape[0] == flat_ys.shape[0] == flat_zs.shape[0]:
+        raise ValueError(
+            f"got {flat_xs.shape[0]} x-coordinates, {flat_ys.shape[0]} y-coordinates and {flat_zs.shape[0]} "
+            f"z-coordinates"
+        )
+    flat_amounts = np.ravel(np.broadcast_to(np.asarray(amounts, dtype=np.float32), np.shape(xs)))
+
+    for k in range(flat_xs.shape[0]):
+        check_cell_in_bounds3(fg, flat_xs[k], flat_ys[k], flat_zs[k])
+
+    for k in range(flat_xs.shape[0]):
+        data[ix3(fg, <int>flat_xs[k], <int>flat_ys[k], <int>flat_zs[k])] += scale * flat_amounts[k]
+
+
+cdef check_cell_in_bounds3(FluidGrid3D* fg, Py_ssize_t x, Py_ssize_t y, Py_ssize_t z):
+    if not (0 <= x < fg.size_x and 0 <= y < fg.size_y and 0 <= z < fg.size_z):
+        raise IndexError(
+            f"cell ({x}, {y}, {z}) lies outside a grid of shape ({fg.size_x}, {fg.size_y}, {fg.size_z})"
+        )
+
+
+#
+#
+# `FluidGrid3D`: data for pressure & velocity of fluid
+# in a dense box of cubic cells.
+# - exists in C-space only, like `FluidGrid`
+#
+#
+
+cdef struct FluidGrid3D:
+    # Voxel header data: (nx x ny x nz) interior cells, within a border one cell wide.
+    int nx;
+    int ny;
+    int nz;
+    int size_x;
+    int size_y;
+    int size_z;
+    int cell_count;
+
+    # the number of cells per unit length: max(nx, ny, nz), as `FluidGrid.scale`.
+    int scale;
+
+    float dt;
+    float diffusion;
+    float viscosity;
+
+    # Per-voxel attribute arrays:
+    float* density;
+    float* vx;
+    float* vy;
+    float* vz;
+
+    # the velocity sources of the next tick, and the tick's scratch space (see `advance_fg3_state_by_one_tick`):
+    float* vx_prev;
+    float* vy_prev;
+    float* vz_prev;
+
+    # Solver settings:
+    int thread_count;
+    RelaxationOrder relaxation_order;
+    int pressure_max_iterations;
+    float pressure_tolerance;
+    int diffusion_max_iterations;
+    float diffusion_tolerance;
+
+
+cdef enum RelaxationOrder:
+    RELAXATION_ORDER_LEXICOGRAPHIC
+    RELAXATION_ORDER_RED_BLACK
+
+
+cdef inline int ix3(FluidGrid3D* fg, int x, int y, int z) noexcept nogil:
+    """
+    Translates (x, y, z) into a flat index into an attribute array, which is stored in [x, y, z] order: z varies
+    fastest, as y does in 2D.
+    """
+
+    return (x * fg.size_y + y) * fg.size_z + z
+
+
+cdef (FluidGrid3D*) new_fg3(int nx, int ny, int nz, float diffusion, float viscosity, float dt):
+    """
+    Creates a new fluid box, with all of its fields at 0.
+    :return: the new grid, or NULL if its fields could not be allocated
+    """
+
+    cdef FluidGrid3D* fg = <FluidGrid3D*>calloc(1, sizeof(FluidGrid3D))
+    if fg == NULL:
+        return NULL
+
+    fg.nx = nx
+    fg.ny = ny
+    fg.nz = nz
+    fg.size_x = nx + 2
+    fg.size_y = ny + 2
+    fg.size_z = nz + 2
+    fg.cell_count = fg.size_x * fg.size_y * fg.size_z
+    fg.scale = max(nx, ny, nz)
+    fg.dt = dt
+    fg.diffusion = diffusion
+    fg.viscosity = viscosity
+    fg.thread_count = 1
+    fg.relaxation_order = RELAXATION_ORDER_RED_BLACK
+    fg.pressure_max_iterations = 20
+    fg.pressure_tolerance = 1e-4
+    fg.diffusion_max_iterations = 20
+    fg.diffusion_tolerance = 0
+
+    fg.density = <float*>calloc(fg.cell_count, sizeof(float))
+    fg.vx = <float*>calloc(fg.cell_count, sizeof(float))
+    fg.vy = <float*>calloc(fg.cell_count, sizeof(float))
+    fg.vz = <float*>calloc(fg.cell_count, sizeof(float))
+    fg.vx_prev = <float*>calloc(fg.cell_count, sizeof(float))
+    fg.vy_prev = <float*>calloc(fg.cell_count, sizeof(float))
+    fg.vz_prev = <float*>calloc(fg.cell_count, sizeof(float))
+
+    if (
+        fg.density == NULL or fg.vx == NULL or fg.vy == NULL or fg.vz == NULL or
+        fg.vx_prev == NULL or fg.vy_prev == NULL or fg.vz_prev == NULL
+    ):
+        del_fg3(fg)
+        return NULL
+    return fg
+
+
+cdef fg3_soft_reset(FluidGrid3D* fg):
+    cdef size_t field_size = fg.cell_count * sizeof(float)
+
+    memset(fg.density, 0, field_size)
+    memset(fg.vx, 0, field_size)
+    memset(fg.vy, 0, field_size)
+    memset(fg.vz, 0, field_size)
+    memset(fg.vx_prev, 0, field_size)
+    memset(fg.vy_prev, 0, field_size)
+    memset(fg.vz_prev, 0, field_size)
+
+
+cdef del_fg3(FluidGrid3D* fg):
+    free(<void*>fg.density)
+    free(<void*>fg.vx)
+    free(<void*>fg.vy)
+    free(<void*>fg.vz)
+    free(<void*>fg.vx_prev)
+    free(<void*>fg.vy_prev)
+    free(<void*>fg.vz_prev)
+    free(<void*>fg)
+
+
+#
+#
+# Solver kernels:
+# - the steps of `fluids.simulator`'s staged kernels, with a third axis: 6-neighbor stencils, trilinear advection, and
+#   border faces, edges and corners. Everything below is typed C and runs without the GIL.
+#
+#
+
+cdef void advance_fg3_state_by_one_tick(FluidGrid3D* fg) noexcept nogil:
+    """
+    Advances the grid by one tick.
+    - the velocity step consumes the velocity sources in `_prev` and leaves those buffers free, so the density step
+      borrows `vx_prev` as its scratch array, before all three are cleared for the next tick's sources.
+    """
+
+    cdef size_t field_size = fg.cell_count * sizeof(float)
+
+    velocity_step3(fg, fg.vx, fg.vy, fg.vz, fg.vx_prev, fg.vy_prev, fg.vz_prev, fg.viscosity, fg.dt)
+    density_step3(fg, fg.density, fg.vx_prev, fg.vx, fg.vy, fg.vz, fg.diffusion, fg.dt)
+
+    memset(fg.vx_prev, 0, field_size)
+    memset(fg.vy_prev, 0, field_size)
+    memset(fg.vz_prev, 0, field_size)
+
+
+cdef void velocity_step3(
+        FluidGrid3D* fg, float* u, float* v, float* w, float* u0, float* v0, float* w0, float visc, float dt
+) noexcept nogil:
+    add_source3(fg, u, u0, dt)
+    add_source3(fg, v, v0, dt)
+    add_source3(fg, w, w0, dt)
+
+    swap(&u0, &u)
+    diffuse3(fg, 1, u, u0, visc, dt)
+    swap(&v0, &v)
+    diffuse3(fg, 2, v, v0, visc, dt)
+    swap(&w0, &w)
+    diffuse3(fg, 3, w, w0, visc, dt)
+
+    # `u0` and `v0` hold the velocities before diffusion, which are no longer needed: they become `p` and `div`.
+    project3(fg, u, v, w, u0, v0)
+
+    swap(&u0, &u)
+    swap(&v0, &v)
+    swap(&w0, &w)
+
+    advect3(fg, 1, u, u0, u0, v0, w0, dt)
+    advect3(fg, 2, v, v0, u0, v0, w0, dt)
+    advect3(fg, 3, w, w0, u0, v0, w0, dt)
+
+    project3(fg, u, v, w, u0, v0)
+
+
+cdef void density_step3(
+        FluidGrid3D* fg, float* x, float* scratch, float* u, float* v, float* w, float diff, float dt
+) noexcept nogil:
+    """
+    :param x: the density, into which this tick's sources were already added (see `Simulator3D.add_density_at`)
+    :param scratch: a free array, which starts the diffusion sweeps from 0, as `_prev` sources would in 2D
+    """
+
+    memset(scratch, 0, fg.cell_count * sizeof(float))
+    diffuse3(fg, 0, scratch, x, diff, dt)
+    advect3(fg, 0, x, scratch, u, v, w, dt)
+
+
+cdef void add_source3(FluidGrid3D* fg, float* x, float* s, float dt) noexcept nogil:
+    cdef int i, j, k
+
+    for i in prange(1, fg.nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, fg.ny+1):
+            for k in range(1, fg.nz+1):
+                x[ix3(fg, i, j, k)] += dt * s[ix3(fg, i, j, k)]
+
+
+cdef inline void swap(float** xp, float** yp) noexcept nogil:
+    cdef float* tmp = xp[0]
+    xp[0] = yp[0]
+    yp[0] = tmp
+
+
+cdef void set_boundary_cells3(FluidGrid3D* fg, int b, float* x) noexcept nogil:
+    """
+    mirrors the interior into the border, as `set_boundary_cells` does: the velocity component normal to a face (`b` 1,
+    2 or 3 for x, y or z) is negated there, everything else copied. Edge cells get the mean of their 2 face
+    neighbors, and corners of their 3 edge neighbors.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int nz = fg.nz
+    cdef int i, j
+
+    for i in prange(1, ny+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, nz+1):
+            x[ix3(fg, 0, i, j)] = -x[ix3(fg, 1, i, j)] if b == 1 else x[ix3(fg, 1, i, j)]
+            x[ix3(fg, nx+1, i, j)] = -x[ix3(fg, nx, i, j)] if b == 1 else x[ix3(fg, nx, i, j)]
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, nz+1):
+            x[ix3(fg, i, 0, j)] = -x[ix3(fg, i, 1, j)] if b == 2 else x[ix3(fg, i, 1, j)]
+            x[ix3(fg, i, ny+1, j)] = -x[ix3(fg, i, ny, j)] if b == 2 else x[ix3(fg, i, ny, j)]
+        for j in range(1, ny+1):
+            x[ix3(fg, i, j, 0)] = -x[ix3(fg, i, j, 1)] if b == 3 else x[ix3(fg, i, j, 1)]
+            x[ix3(fg, i, j, nz+1)] = -x[ix3(fg, i, j, nz)] if b == 3 else x[ix3(fg, i, j, nz)]
+
+    for i in range(1, nx+1):
+        x[ix3(fg, i, 0, 0)] = 0.5 * (x[ix3(fg, i, 1, 0)] + x[ix3(fg, i, 0, 1)])
+        x[ix3(fg, i, ny+1, 0)] = 0.5 * (x[ix3(fg, i, ny, 0)] + x[ix3(fg, i, ny+1, 1)])
+        x[ix3(fg, i, 0, nz+1)] = 0.5 * (x[ix3(fg, i, 1, nz+1)] + x[ix3(fg, i, 0, nz)])
+        x[ix3(fg, i, ny+1, nz+1)] = 0.5 * (x[ix3(fg, i, ny, nz+1)] + x[ix3(fg, i, ny+1, nz)])
+    for i in range(1, ny+1):
+        x[ix3(fg, 0, i, 0)] = 0.5 * (x[ix3(fg, 1, i, 0)] + x[ix3(fg, 0, i, 1)])
+        x[ix3(fg, nx+1, i, 0)] = 0.5 * (x[ix3(fg, nx, i, 0)] + x[ix3(fg, nx+1, i, 1)])
+        x[ix3(fg, 0, i, nz+1)] = 0.5 * (x[ix3(fg, 1, i, nz+1)] + x[ix3(fg, 0, i, nz)])
+        x[ix3(fg, nx+1, i, nz+1)] = 0.5 * (x[ix3(fg, nx, i, nz+1)] + x[ix3(fg, nx+1, i, nz)])
+    for i in range(1, nz+1):
+        x[ix3(fg, 0, 0, i)] = 0.5 * (x[ix3(fg, 1, 0, i)] + x[ix3(fg, 0, 1, i)])
+        x[ix3(fg, nx+1, 0, i)] = 0.5 * (x[ix3(fg, nx, 0, i)] + x[ix3(fg, nx+1, 1, i)])
+        x[ix3(fg, 0, ny+1, i)] = 0.5 * (x[ix3(fg, 1, ny+1, i)] + x[ix3(fg, 0, ny, i)])
+        x[ix3(fg, nx+1, ny+1, i)] = 0.5 * (x[ix3(fg, nx, ny+1, i)] + x[ix3(fg, nx+1, ny, i)])
+
+    set_corner_cell3(fg, x, 0, 0, 0, 1, 1, 1)
+    set_corner_cell3(fg, x, nx+1, 0, 0, -1, 1, 1)
+    set_corner_cell3(fg, x, 0, ny+1, 0, 1, -1, 1)
+    set_corner_cell3(fg, x, nx+1, ny+1, 0, -1, -1, 1)
+    set_corner_cell3(fg, x, 0, 0, nz+1, 1, 1, -1)
+    set_corner_cell3(fg, x, nx+1, 0, nz+1, -1, 1, -1)
+    set_corner_cell3(fg, x, 0, ny+1, nz+1, 1, -1, -1)
+    set_corner_cell3(fg, x, nx+1, ny+1, nz+1, -1, -1, -1)
+
+
+cdef inline void set_corner_cell3(
+        FluidGrid3D* fg, float* x, int i, int j, int k, int di, int dj, int dk
+) noexcept nogil:
+    # the corner (i, j, k), whose 3 edge neighbors lie one step inwards (di, dj, dk) along each axis:
+    x[ix3(fg, i, j, k)] = (x[ix3(fg, i + di, j, k)] + x[ix3(fg, i, j + dj, k)] + x[ix3(fg, i, j, k + dk)]) / 3.0
+
+
+cdef void linear_solve3(
+        FluidGrid3D* fg, int b, float* x, float* x0, float a, float c, int max_iter_count, float tolerance
+) noexcept nogil:
+    """
+    relaxes `x` towards the solution of `x = c * (x0 + a * (sum of x's 6 neighbors))`, as `linear_solve` does in 2D,
+    with the same early stopping rule.
+    """
+
+    cdef double update_norm2, rhs_norm2
+    cdef int k
+
+    for k in range(max_iter_count):
+        if fg.relaxation_order == RELAXATION_ORDER_RED_BLACK:
+            update_norm2 = relax3(fg, x, x0, a, c, 0, &rhs_norm2)
+            update_norm2 += relax3(fg, x, x0, a, c, 1, &rhs_norm2)
+        else:
+            update_norm2 = relax3(fg, x, x0, a, c, -1, &rhs_norm2)
+        set_boundary_cells3(fg, b, x)
+
+        if sqrt(update_norm2) <= tolerance * c * sqrt(rhs_norm2):
+            break
+
+
+cdef double relax3(FluidGrid3D* fg, float* x, float* x0, float a, float c, int color, double* rhs_norm2) noexcept nogil:
+    """
+    one in-place Gauss-Seidel sweep in lexicographic order (`color` < 0), on a single thread, or one half of a
+    red-black sweep, updating only the cells where (i + j + k) % 2 == color, across `fg.thread_count` threads.
+    :return: the squared 2-norm of the updates; the squared 2-norm of `x0` is written to `rhs_norm2`, or, by the black
+        (color 1) half, accumulated into it.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int nz = fg.nz
+    # a single thread runs the planes in order, as a Gauss-Seidel sweep needs:
+    cdef int thread_count = 1 if color < 0 else fg.thread_count
+    cdef int k_step = 1 if color < 0 else 2
+    cdef double update_norm2 = 0.0
+    cdef double x0_norm2 = 0.0
+    # the offsets to a cell's x- and y-neighbors; its z-neighbors are adjacent:
+    cdef int x_stride = fg.size_y * fg.size_z
+    cdef int y_stride = fg.size_z
+    cdef float next_x, update
+    cdef int i, j, k, cell
+
+    for i in prange(1, nx+1, num_threads=thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            # the row's first cell of this color:
+            k = 1 if color < 0 else 1 + (i + j + 1 + color) % 2
+            cell = ix3(fg, i, j, k)
+            while k <= nz:
+                next_x = c * (
+                    x0[cell] + a * (
+                        x[cell - x_stride] + x[cell + x_stride] +
+                        x[cell - y_stride] + x[cell + y_stride] +
+                        x[cell - 1] + x[cell + 1]
+                    )
+                )
+                update = next_x - x[cell]
+                x[cell] = next_x
+                update_norm2 += <double>update * update
+                x0_norm2 += <double>x0[cell] * x0[cell]
+                k = k + k_step
+                cell = cell + k_step
+
+    if color == 1:
+        rhs_norm2[0] += x0_norm2
+    else:
+        rhs_norm2[0] = x0_norm2
+    return update_norm2
+
+
+cdef void diffuse3(FluidGrid3D* fg, int b, float* x, float* x0, float diff, float dt) noexcept nogil:
+    cdef float a = dt * diff * fg.scale * fg.scale
+    linear_solve3(fg, b, x, x0, a, 1.0 / (1.0 + 6.0*a), fg.diffusion_max_iterations, fg.diffusion_tolerance)
+
+
+cdef void advect3(
+        FluidGrid3D* fg, int b, float* d, float* d0, float* u, float* v, float* w, float dt
+) noexcept nogil:
+    """
+    `advect` in 3D: traces each cell back along the velocity, and interpolates `d0` there trilinearly.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int nz = fg.nz
+    cdef float dt0 = dt * fg.scale
+    cdef int i, j, k, i0, i1, j0, j1, k0, k1
+    cdef float x, y, z, s0, s1, t0, t1, r0, r1
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            for k in range(1, nz+1):
+                x = i - dt0*u[ix3(fg, i, j, k)]
+                y = j - dt0*v[ix3(fg, i, j, k)]
+                z = k - dt0*w[ix3(fg, i, j, k)]
+
+                if x < 0.5:
+                    x = 0.5
+                if x > nx + 0.5:
+                    x = nx + 0.5
+                i0 = <int>x
+                i1 = 1 + i0
+
+                if y < 0.5:
+                    y = 0.5
+                if y > ny + 0.5:
+                    y = ny + 0.5
+                j0 = <int>y
+                j1 = 1 + j0
+
+                if z < 0.5:
+                    z = 0.5
+                if z > nz + 0.5:
+                    z = nz + 0.5
+                k0 = <int>z
+                k1 = 1 + k0
+
+                s1 = x - i0
+                s0 = 1 - s1
+                t1 = y - j0
+                t0 = 1 - t1
+                r1 = z - k0
+                r0 = 1 - r1
+
+                d[ix3(fg, i, j, k)] = (
+                    s0 * (
+                        t0 * (r0 * d0[ix3(fg, i0, j0, k0)] + r1 * d0[ix3(fg, i0, j0, k1)]) +
+                        t1 * (r0 * d0[ix3(fg, i0, j1, k0)] + r1 * d0[ix3(fg, i0, j1, k1)])
+                    ) +
+                    s1 * (
+                        t0 * (r0 * d0[ix3(fg, i1, j0, k0)] + r1 * d0[ix3(fg, i1, j0, k1)]) +
+                        t1 * (r0 * d0[ix3(fg, i1, j1, k0)] + r1 * d0[ix3(fg, i1, j1, k1)])
+                    )
+                )
+
+    set_boundary_cells3(fg, b, d)
+
+
+cdef void project3(FluidGrid3D* fg, float* u, float* v, float* w, float* p, float* div) noexcept nogil:
+    """
+    `project` in 3D, solving for pressure by relaxation.
+    """
+
+    cdef int nx = fg.nx
+    cdef int ny = fg.ny
+    cdef int nz = fg.nz
+    cdef float h = 1.0 / fg.scale
+    cdef int i, j, k
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            for k in range(1, nz+1):
+                div[ix3(fg, i, j, k)] = (-0.5 * h) * (
+                    + u[ix3(fg, i+1, j, k)] - u[ix3(fg, i-1, j, k)]
+                    + v[ix3(fg, i, j+1, k)] - v[ix3(fg, i, j-1, k)]
+                    + w[ix3(fg, i, j, k+1)] - w[ix3(fg, i, j, k-1)]
+                )
+                p[ix3(fg, i, j, k)] = 0
+
+    set_boundary_cells3(fg, 0, div)
+    set_boundary_cells3(fg, 0, p)
+
+    linear_solve3(fg, 0, p, div, 1.0, 1.0 / 6.0, fg.pressure_max_iterations, fg.pressure_tolerance)
+
+    for i in prange(1, nx+1, num_threads=fg.thread_count, schedule='static'):
+        for j in range(1, ny+1):
+            for k in range(1, nz+1):
+                u[ix3(fg, i, j, k)] -= (0.5/h) * (p[ix3(fg, i+1, j, k)] - p[ix3(fg, i-1, j, k)])
+                v[ix3(fg, i, j, k)] -= (0.5/h) * (p[ix3(fg, i, j+1, k)] - p[ix3(fg, i, j-1, k)])
+                w[ix3(fg, i, j, k)] -= (0.5/h) * (p[ix3(fg, i, j, k+1)] - p[ix3(fg, i, j, k-1)])
+
+    set_boundary_cells3(fg, 1, u)
+    set_boundary_cells3(fg, 2, v)
+    set_boundary_cells3(fg, 3, w)
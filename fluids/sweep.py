@@ -0,0 +1,228 @@
+#!/usr/bin/env python3.9
+
+"""
+Runs a simulation for every combination of a grid of parameter values, across a process pool, and tabulates how each
+configuration behaved.
+- each configuration starts from the same initial condition (see `fluids.presets`) and runs for a fixed step count.
+- workers write one row of summary metrics each into a table in shared memory, so no fields are pickled between
+  processes; only configurations go out and row indices come back.
+Run with `python -m fluids.sweep --viscosity 0.1 1 10 --diffusion 0.1 1` once the extension module is built.
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import presets
+from . import simulator
+
+
+# the parameters a sweep may vary, in table column order:
+SWEEP_PARAMETER_NAMES = ('viscosity', 'diffusion', 'time_rate')
+
+# the metrics reported per configuration, in table column order:
+# - mass_drift is (final_mass - initial_mass) / initial_mass: a conservative scheme keeps it near 0.
+# - kinetic_energy and max_divergence are measured over interior cells after the last step.
+SWEEP_METRIC_NAMES = ('initial_mass', 'final_mass', 'mass_drift', 'kinetic_energy', 'max_divergence', 'wall_time_sec')
+
+SWEEP_COLUMN_NAMES = SWEEP_PARAMETER_NAMES + SWEEP_METRIC_NAMES
+
+DEFAULT_PARAMETER_VALUES = {
+    'viscosity': presets.DEFAULT_VISCOSITY_VALUE,
+    'diffusion': presets.DEFAULT_DIFFUSION_VALUE,
+    'time_rate': presets.DEFAULT_TIME_RATE_VALUE,
+}
+
+# the worker's view of the shared results table, attached once per worker process by `attach_results_table`:
+worker_results_memory = None
+worker_results_table = None
+
+
+def expand_parameter_grid(parameter_grid):
+    """
+    Lists every combination of a grid of parameter values.
+    :param parameter_grid: a dict mapping some of `SWEEP_PARAMETER_NAMES` to a value or a sequence of values;
+        parameters left out keep their `DEFAULT_PARAMETER_VALUES`.
+    :return: a list of dicts, one per configuration, each holding every parameter.
+    """
+
+    unknown_names = set(parameter_grid) - set(SWEEP_PARAMETER_NAMES)
+    if unknown_names:
+        raise ValueError(f"cannot sweep over {sorted(unknown_names)}: expected some of {SWEEP_PARAMETER_NAMES}")
+
+    value_lists = []
+    for name in SWEEP_PARAMETER_NAMES:
+        values = parameter_grid.get(name, DEFAULT_PARAMETER_VALUES[name])
+        value_lists.append(list(np.atleast_1d(values)))
+
+    return [dict(zip(SWEEP_PARAMETER_NAMES, values)) for values in itertools.product(*value_lists)]
+
+
+def preset_initial_condition(velocity_field_code=presets.DEFAULT_VELOCITY_FIELD_CODE):
+    """
+    :return: an initial-condition builder placing demo-4's square of fluid with one of its velocity-field presets.
+    """
+    return functools.partial(presets.reset_sim, velocity_field_code=velocity_field_code)
+
+
+def measure_fields(sim):
+    """
+    :return: (mass, kinetic energy, max |divergence|) of `sim`'s current state, over interior cells.
+    """
+
+    interior = slice(1, -1)
+    density = sim.density_view()
+    vx = sim.vx_view()
+    vy = sim.vy_view()
+
+    mass = float(density[interior, interior].sum(dtype=np.float64))
+    kinetic_energy = 0.5 * float(
+        np.square(vx[interior, interior], dtype=np.float64).sum() +
+        np.square(vy[interior, interior], dtype=np.float64).sum()
+    )
+
+    # central differences with cell width h = 1/max(nx, ny), as in `project`:
+    divergence = 0.5 * max(sim.nx, sim.ny) * (
+        (vx[2:, interior] - vx[:-2, interior]) +
+        (vy[interior, 2:] - vy[interior, :-2])
+    )
+    max_divergence = float(np.abs(divergence).max())
+
+    return mass, kinetic_energy, max_divergence
+
+
+def run_configuration(n, step_count, initial_condition, sim_options, parameters):
+    """
+    Runs one configuration from its initial condition.
+    :return: the configuration's row of `SWEEP_COLUMN_NAMES` values.
+    """
+
+    sim_options = dict(sim_options or {})
+    sim = simulator.Simulator(
+        n, init_diffusion=parameters['diffusion'], init_viscosity=parameters['viscosity'],
+        time_rate=parameters['time_rate'], precision=sim_options.pop('precision', simulator.PRECISION_SINGLE)
+    )
+    for name, value in sim_options.items():
+        setattr(sim, name, value)
+    initial_condition(sim)
+    initial_mass = measure_fields(sim)[0]
+
+    start_time = time.perf_counter()
+    for i in range(step_count):
+        sim.step()
+    wall_time = time.perf_counter() - start_time
+
+    final_mass, kinetic_energy, max_divergence = measure_fields(sim)
+    sim.dispose()
+
+    mass_drift = (final_mass - initial_mass) / initial_mass if initial_mass else float('nan')
+    metrics = (initial_mass, final_mass, mass_drift, kinetic_energy, max_divergence, wall_time)
+    return [parameters[name] for name in SWEEP_PARAMETER_NAMES] + list(metrics)
+
+
+def attach_results_table(memory_name, row_count):
+    global worker_results_memory, worker_results_table
+    worker_results_memory = shared_memory.SharedMemory(name=memory_name)
+    worker_results_table = np.ndarray(
+        (row_count, len(SWEEP_COLUMN_NAMES)), dtype=np.float64, buffer=worker_results_memory.buf
+    )
+
+
+def run_configuration_into_table(row_index, n, step_count, initial_condition, sim_options, parameters):
+    worker_results_table[row_index] = run_configuration(n, step_count, initial_condition, sim_options, parameters)
+    return row_index
+
+
+def sweep(parameter_grid, initial_condition=None, n=32, step_count=100, process_count=None, sim_options=None):
+    """
+    Runs every configuration of a parameter grid for `step_count` steps, in parallel.
+    :param parameter_grid: see `expand_parameter_grid`
+    :param initial_condition: a function `f(sim)` that seeds a fresh simulator, or `None` for demo-4's default
+        preset (see `preset_initial_condition`). It must be picklable, e.g. a module-level function or a
+        `functools.partial` of one.
+    :param n: number of non-border cells per edge
+    :param step_count: the number of steps each configuration runs for
+    :param process_count: the number of worker processes, or `None` for one per CPU
+    :param sim_options: a dict of other `Simulator` properties to set, e.g. {'pressure_solver': 'multigrid'}, or its
+        constructor's 'precision'. Each worker steps on a single thread unless this sets `thread_count`.
+    :return: a structured array with one row per configuration and one float64 field per `SWEEP_COLUMN_NAMES`.
+    """
+
+    if initial_condition is None:
+        initial_condition = preset_initial_condition()
+    configurations = expand_parameter_grid(parameter_grid)
+    row_count = len(configurations)
+
+    results_memory = shared_memory.SharedMemory(
+        create=True, size=max(row_count * len(SWEEP_COLUMN_NAMES) * np.dtype(np.float64).itemsize, 1)
+    )
+    try:
+        results_table = np.ndarray((row_count, len(SWEEP_COLUMN_NAMES)), dtype=np.float64, buffer=results_memory.buf)
+        results_table.fill(np.nan)
+
+        tasks = [
+            (row_index, n, step_count, initial_condition, sim_options, parameters)
+            for row_index, parameters in enumerate(configurations)
+        ]
+        with multiprocessing.Pool(
+            process_count, initializer=attach_results_table, initargs=(results_memory.name, row_count)
+        ) as pool:
+            pool.starmap(run_configuration_into_table, tasks, chunksize=1)
+
+        results_dtype = np.dtype([(name, np.float64) for name in SWEEP_COLUMN_NAMES])
+        # copying out of shared memory, which must hold no views once closed:
+        results = results_table.copy().view(results_dtype).reshape(row_count)
+        del results_table
+    finally:
+        results_memory.close()
+        results_memory.unlink()
+
+    return results
+
+
+def print_results_table(results):
+    print("".join(f"{name:>15}" for name in SWEEP_COLUMN_NAMES))
+    for row in results:
+        print("".join(f"{row[name]:>15.6g}" for name in SWEEP_COLUMN_NAMES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweeps simulation parameters across a process pool.")
+    for name in SWEEP_PARAMETER_NAMES:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, nargs="+",
+                            default=[DEFAULT_PARAMETER_VALUES[name]], help=f"values of `{name}` to sweep")
+    parser.add_argument("--velocity-field", default=presets.DEFAULT_VELOCITY_FIELD_CODE,
+                        choices=[presets.VELOCITY_FIELD_CODE_NONE, presets.VELOCITY_FIELD_CODE_OUTFLOW,
+                                 presets.VELOCITY_FIELD_CODE_SPIRAL, presets.VELOCITY_FIELD_CODE_UP,
+                                 presets.VELOCITY_FIELD_CODE_DOWN],
+                        help="the initial velocity-field preset (see `fluids.presets`)")
+    parser.add_argument("--precision", default=simulator.PRECISION_SINGLE, choices=list(simulator.precision_codes),
+                        help="the type of the grid's values (see `Simulator.precision`)")
+    parser.add_argument("--n", type=int, default=32, help="number of non-border cells per edge")
+    parser.add_argument("--steps", type=int, default=100, help="number of steps per configuration")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--json", action="store_true", help="print results as a JSON document instead of a table")
+    args = parser.parse_args()
+
+    parameter_grid = {name: getattr(args, name) for name in SWEEP_PARAMETER_NAMES}
+    results = sweep(
+        parameter_grid, preset_initial_condition(args.velocity_field), args.n, args.steps, args.processes,
+        {'precision': args.precision}
+    )
+
+    if args.json:
+        json.dump([{name: float(row[name]) for name in SWEEP_COLUMN_NAMES} for row in results], sys.stdout, indent=2)
+        print()
+    else:
+        print_results_table(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Draws simulation fields onto PyGame surfaces.
+Every cell is colored through a precomputed lookup table with NumPy, and the whole grid reaches the screen in one
+`pygame.surfarray` blit, so drawing costs a handful of vectorized operations regardless of grid size.
+"""
+
+import numpy as np
+import pygame
+
+
+def build_colormap_lut(color_stops, lut_size=256):
+    """
+    Precomputes a colormap by interpolating linearly between evenly spaced color stops.
+    :param color_stops: a sequence of at least 2 (r, g, b) colors; the first maps to 0, the last to 1.
+    :param lut_size: the number of entries in the table
+    :return: a (lut_size, 3) uint8 array
+    """
+
+    stops = np.asarray(color_stops, dtype=np.float64)
+    stop_positions = np.linspace(0.0, 1.0, len(stops))
+    lut_positions = np.linspace(0.0, 1.0, lut_size)
+    lut = np.stack(
+        [np.interp(lut_positions, stop_positions, stops[:, channel]) for channel in range(3)],
+        axis=-1
+    )
+    return lut.astype(np.uint8)
+
+
+class FieldRenderer(object):
+    """
+    Maps a (size, size) scalar field, indexed as [x, y], to colors and scales it onto a surface.
+    - all intermediate buffers are allocated once, on the first `draw` for a given grid size.
+    """
+
+    def __init__(self, lut):
+        self.lut = lut
+        self.grid_surface = None
+        self.normalized = None
+        self.lut_indices = None
+        self.rgb = None
+
+    def draw(self, screen, field, lo, scale):
+        """
+        Draws `field` over the whole of `screen`.
+        :param screen: the surface to draw onto
+        :param field: a (size, size) array indexed as [x, y]
+        :param lo: the field value mapped to the start of the colormap
+        :param scale: the field range spanned by the colormap; values beyond it are clamped to the last color.
+        """
+
+        if self.rgb is None or self.rgb.shape[:2] != field.shape:
+            self.allocate_buffers(screen, field.shape)
+
+        # normalizing the field into lookup-table indices, in place:
+        max_index = len(self.lut) - 1
+        np.subtract(field, lo, out=self.normalized)
+        np.multiply(self.normalized, max_index / scale if scale else 0.0, out=self.normalized)
+        np.nan_to_num(self.normalized, copy=False)
+        np.clip(self.normalized, 0, max_index, out=self.normalized)
+        np.copyto(self.lut_indices, self.normalized, casting='unsafe')
+
+        # coloring every cell, then presenting in one blit:
+        np.take(self.lut, self.lut_indices, axis=0, out=self.rgb)
+        pygame.surfarray.blit_array(self.grid_surface, self.rgb)
+        pygame.transform.scale(self.grid_surface, screen.get_size(), screen)
+
+    def allocate_buffers(self, screen, grid_shape):
+        # sharing `screen`'s pixel format lets `pygame.transform.scale` write straight into it:
+        self.grid_surface = pygame.Surface(grid_shape, 0, screen)
+        self.normalized = np.empty(grid_shape, dtype=np.float32)
+        self.lut_indices = np.empty(grid_shape, dtype=np.intp)
+        self.rgb = np.empty(grid_shape + (3,), dtype=np.uint8)
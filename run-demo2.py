@@ -9,6 +9,7 @@ import app
 import sys
 
 import matplotlib.pyplot as plt
+import numpy as np
 
 import fluids
 
@@ -44,13 +45,14 @@ def create_sim():
     square_y_offset = 100
     square_size = 64
 
-    for x in range(square_x_offset, square_size + square_x_offset):
-        for y in range(square_y_offset, square_size + square_y_offset):
-            sim.add_density((x, y), square_density)
+    square_mask = np.zeros((sim.size, sim.size), dtype=bool)
+    square_mask[
+        square_x_offset:square_size + square_x_offset,
+        square_y_offset:square_size + square_y_offset
+    ] = True
 
-    for x in range(square_x_offset, square_size + square_x_offset):
-        for y in range(square_y_offset, square_size + square_y_offset):
-            sim.add_velocity((x, y), (square_x_velocity, square_y_velocity))
+    sim.add_density_where(square_mask, square_density, immediate=True)
+    sim.add_velocity_where(square_mask, square_x_velocity, square_y_velocity, immediate=True)
 
     return sim
 
@@ -59,12 +61,11 @@ def main():
     # setting up initial state:
     sim = create_sim()
 
-    def render_cb(screen):
-        # running K simulation steps:
-        k = 1
-        for i in range(k):
-            sim.step()
+    def step_cb():
+        # stepping is paced by `app.run` at a fixed rate, independently of rendering:
+        sim.step()
 
+    def render_cb(screen):
         # presenting:
         density_array = sim.dump_density_array()
         vx_array = sim.dump_vx_array()
@@ -85,7 +86,7 @@ def main():
         # debug: ensure we actually render
         # screen.fill((255, 0, 0))
 
-    app.run(256, 256, "demo-2", render_cb)
+    app.run(256, 256, "demo-2", render_cb=render_cb, step_cb=step_cb)
 
     # TODO: move this to config
     display_quiver_plot_after_completion = False
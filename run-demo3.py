@@ -9,6 +9,7 @@ import math
 
 from datetime import datetime
 
+import numpy as np
 import pygame
 
 import app
@@ -31,17 +32,17 @@ def create_sim(sim_size):
     square_y_offset = 2
     square_size = 8
 
-    for x in range(square_x_offset, square_size + square_x_offset):
-        for y in range(square_y_offset, square_size + square_y_offset):
-            sim.add_density((x, y), square_density)
+    xs, ys = np.mgrid[
+        square_x_offset:square_size + square_x_offset,
+        square_y_offset:square_size + square_y_offset
+    ]
+    sim.add_density_at(xs, ys, square_density, immediate=True)
 
-    for x in range(square_x_offset, square_size + square_x_offset):
-        for y in range(square_y_offset, square_size + square_y_offset):
-            # modulating velocity by Y-component
-            yn = math.pi * (y / square_size)
-            vx = square_x_velocity
-            vy = square_y_velocity * math.sin(yn)
-            sim.add_velocity((x, y), (vx, vy))
+    # modulating velocity by Y-component
+    yn = math.pi * (ys / square_size)
+    vx = np.full(xs.shape, square_x_velocity)
+    vy = square_y_velocity * np.sin(yn)
+    sim.add_velocity_at(xs, ys, vx, vy, immediate=True)
 
     return sim
 
@@ -75,14 +76,13 @@ def main():
 
         print(f"Initializing with mode={dimensions_in_pixels}")
 
+    def step_cb():
+        # stepping is paced by `app.run` at a fixed rate, independently of rendering:
+        sim.step()
+
     def render_cb(screen):
         nonlocal frame_index, last_frame_time
 
-        # running K simulation steps:
-        k = 1
-        for i in range(k):
-            sim.step()
-
         #
         # presenting:
         #
@@ -135,7 +135,11 @@ def main():
         # debug: ensure we actually render
         # screen.fill((255, 0, 0))
 
-    app.run(window_size, window_size, "demo-3", init_cb=init_cb, render_cb=render_cb, desired_updates_per_sec=60)
+    app.run(
+        window_size, window_size, "demo-3",
+        init_cb=init_cb, render_cb=render_cb, desired_updates_per_sec=60,
+        step_cb=step_cb, sim_updates_per_sec=sim.max_display_updates_per_sec
+    )
 
 
 if __name__ == "__main__":
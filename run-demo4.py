@@ -1,143 +1,64 @@
 #!/usr/bin/env python3.9
 
-import math
-
+import argparse
 from datetime import datetime
 
+import numpy as np
 import pygame
 import pygame_menu
 
 import app
-import fluids
-
-
-VELOCITY_FIELD_CODE_NONE = 'n'
-VELOCITY_FIELD_CODE_OUTFLOW = 'o'
-VELOCITY_FIELD_CODE_SPIRAL = 's'
-VELOCITY_FIELD_CODE_UP = 'u'
-VELOCITY_FIELD_CODE_DOWN = 'd'
-
-DEFAULT_VELOCITY_FIELD_CODE = VELOCITY_FIELD_CODE_NONE
-DEFAULT_VISCOSITY_VALUE = 1
-DEFAULT_DIFFUSION_VALUE = 1
-DEFAULT_TIME_RATE_VALUE = 0.001
-
-
-def create_sim(
-        sim_size,
-        viscosity_input=DEFAULT_VISCOSITY_VALUE,
-        diffusion_input=DEFAULT_DIFFUSION_VALUE,
-        time_rate_input=DEFAULT_TIME_RATE_VALUE,
-        velocity_field_code=DEFAULT_VELOCITY_FIELD_CODE
-):
-    sim = fluids.simulator.Simulator(
-        sim_size,
-        init_diffusion=diffusion_input,
-        init_viscosity=viscosity_input,
-        time_rate=time_rate_input
+import render
+from fluids import config
+from fluids.presets import (
+    VELOCITY_FIELD_CODE_NONE,
+    VELOCITY_FIELD_CODE_OUTFLOW,
+    VELOCITY_FIELD_CODE_SPIRAL,
+    VELOCITY_FIELD_CODE_UP,
+    VELOCITY_FIELD_CODE_DOWN,
+    DEFAULT_VELOCITY_FIELD_CODE,
+    create_sim,
+    reset_sim,
+)
 
-    )
-    reset_sim(sim, velocity_field_code)
-    return sim
-
-
-def reset_sim(sim, velocity_field_code, clear_all=True):
-    # positioning 'the square':
-    square_density = 1.0
-    square_size = 8
-    square_x_offset = (sim.size - square_size) // 2
-    square_y_offset = (sim.size - square_size) // 2
-
-    # clearing simulation if requested:
-    if clear_all:
-        # wiping out everything currently in the sim cells: density and velocity tables.
-        sim.clear_density_and_velocity()
-
-        # re-adding a centered solid square of fluid with constant velocity
-        for x in range(square_x_offset, square_size + square_x_offset):
-            for y in range(square_y_offset, square_size + square_y_offset):
-                sim.add_density((x, y), square_density)
-
-    # FIXME: why is the velocity field only applied to the initial square?
-    #       - why not the whole state?
-    #       - must change bounds of `range` below: simple fix.
-
-    # applying the appropriate initial velocity field:
-    if velocity_field_code == VELOCITY_FIELD_CODE_OUTFLOW:
-        strength_factor = 1.0
-
-        for x in range(square_x_offset, square_size + square_x_offset):
-            for y in range(square_y_offset, square_size + square_y_offset):
-                # modulating velocity by Y-component
-                vx = strength_factor * (10 * (x - (square_size/2 + square_x_offset)))
-                vy = strength_factor * (10 * (y - (square_size/2 + square_y_offset)))
-                sim.add_velocity((x, y), (vx, vy))
-
-    elif velocity_field_code == VELOCITY_FIELD_CODE_SPIRAL:
-        strength_factor = 0.05
-
-        for x in range(int(square_x_offset/2), 2*square_size + square_x_offset):
-            for y in range(int(square_y_offset/2), 2*square_size + square_y_offset):
-                # modulating velocity by Y-component
-
-                x_diff = x - (square_size//2 + square_x_offset)
-                y_diff = y - (square_size//2 + square_y_offset)
-                if x_diff > 0:
-                    theta = math.atan(y_diff/(x_diff+.00001))
-
-                else:
-                    theta = math.atan(y_diff/(x_diff+.00001)) + math.pi
-                """
-                elif (x_diff == 0) && (y_diff > 0):
-                    theta = math.pi/2
-                """
-
-                rad = math.sqrt(x_diff**2 + y_diff**2)
-
-                vx = 100*rad*(math.sin(theta))
-                vy = 100*rad*(math.cos(theta))
-
-                vx *= strength_factor
-                vy *= strength_factor
-
-                sim.add_velocity((x, y), (vx, vy))
-
-    elif velocity_field_code == VELOCITY_FIELD_CODE_UP or velocity_field_code == VELOCITY_FIELD_CODE_DOWN:
-        strength_factor = 100.0
-
-        for x in range(0, square_size):
-            for y in range(0, square_size):
-                vx = 0 * strength_factor
-                vy = -100 * strength_factor
-
-                if velocity_field_code == VELOCITY_FIELD_CODE_UP:
-                    sim.add_velocity((x, y), (vx, vy))
-                elif velocity_field_code == VELOCITY_FIELD_CODE_DOWN:
-                    sim.add_velocity((x, y), (vx, -vy))
-
-    elif velocity_field_code == VELOCITY_FIELD_CODE_NONE:
-        # do nothing.
-        pass
 
-    else:
-        print(f'Invalid velocity field code: {velocity_field_code}')
-        raise NotImplementedError("Invalid velocity field selected in menu.")
+def main():
+    parser = argparse.ArgumentParser(description="Runs demo-4: an interactive square of fluid.")
+    parser.add_argument("--config", default=None,
+                        help="a TOML or JSON settings file (see `fluids.config`), re-applied whenever it changes")
+    args = parser.parse_args()
 
+    # following the settings file, if any, from a background thread:
+    config_watcher = config.ConfigWatcher(args.config) if args.config is not None else None
 
-def main():
     # configuring:
     pygame.font.init()
     # debug_font = pygame.font.SysFont("monospace", 15)
     debug_font = pygame.font.Font("./fonts/Nanum_Gothic_Coding/NanumGothicCoding-Regular.ttf", 18)
     draw_grid_lines = False
+    show_profile_overlay = False
     grid_size = 24
-    sim_size = 32
-    window_size = sim_size * grid_size
+    sim_size = 32 if config_watcher is None else config_watcher.config['n']
+    # the window keeps its size whatever the grid's: the renderer stretches the cells across it.
+    window_size = 32 * grid_size
     grid_color = (0xa0, 0xa0, 0xc0)
     active_v_field_menu_index = 0
 
+    # shades of blue: empty cells are white, the densest cells are blue.
+    blue_stop = (0x00, 0xbb, 0xff)
+    white_stop = (0xff, 0xff, 0xff)
+    density_renderer = render.FieldRenderer(render.build_colormap_lut([white_stop, blue_stop]))
+
     # setting up initial state for the simulation using config:
-    sim = create_sim(sim_size)
+    if config_watcher is None:
+        sim = create_sim(sim_size)
+    else:
+        sim = config.create_simulator(config_watcher.config)
+        reset_sim(sim, DEFAULT_VELOCITY_FIELD_CODE)
+
+    # the state the next frame draws, copied from the simulation between two steps (see `capture_cb`):
+    density_frame = None
+    profile_summary = None
 
     # these variables are used to display frame-rate statistics during the simulation:
     frame_index = 0
@@ -151,78 +72,61 @@ def main():
     def init_cb(screen, listener_list):
         pass
 
+    def step_cb():
+        # applying the settings file's last changes, if any, between two steps:
+        if config_watcher is not None:
+            rebuild_names = config_watcher.apply_pending(sim)
+            if rebuild_names:
+                print(f"restart demo-4 to apply the new {', '.join(rebuild_names)}")
+            if config_watcher.last_error is not None:
+                print(f"ignoring the settings file's last change: {config_watcher.last_error}")
+                config_watcher.last_error = None
+
+        # stepping is paced by `app.run` at a fixed rate, independently of rendering:
+        sim.step()
+
+    def capture_cb():
+        # runs while steps are held off: copying, rather than drawing, keeps the worker thread waiting briefly.
+        nonlocal density_frame, profile_summary
+        density_view = sim.density_view()
+        if density_frame is None or density_frame.shape != density_view.shape:
+            density_frame = np.empty_like(density_view)
+        sim.copy_density_into(density_frame)
+        profile_summary = sim.profile_summary() if show_profile_overlay else None
+
     def render_cb(screen):
         nonlocal frame_index, last_frame_time
 
-        # running K simulation steps:
-        k = 1
-        for i in range(k):
-            sim.step()
-
         #
         # acquiring density and velocity arrays and ranges:
+        # - from the copy `capture_cb` took, since the worker thread keeps stepping while this frame is drawn.
         #
 
-        density_array = sim.dump_density_array()
+        density_array = density_frame
         min_density = density_array.min()
         max_density = density_array.max()
         assert min_density < max_density
 
-        vx_array = sim.dump_vx_array()
-        vy_array = sim.dump_vy_array()
-
         #
         # presenting:
         #
 
         #
         # drawing densities:
+        # - density is normalized given min/max of aperture, then colored through the LUT in one vectorized pass.
         #
 
-        for grid_x in range(sim.size):
-            for grid_y in range(sim.size):
-                # updating this cell's pixel rectangle:
-                pixel_rect = (
-                    grid_x * grid_size,
-                    grid_y * grid_size,
-                    (grid_x + 1) * grid_size,
-                    (grid_y + 1) * grid_size
-                )
-
-                # acquiring a density and velocity readings:
-                cell_index = sim.ix(grid_x, grid_y)
-                density = density_array[cell_index]
-                vx, vy = vx_array[cell_index], vy_array[cell_index]
-
-                # normalizing density given min/max of aperture:
-                density_normalized = (density - min_density) / max_density
-
-                # density_byte = normal_float_to_byte(density_normalized)
-
-                # ensuring non-zero density is represented by the faintest value possible:
-                # if density > 0 and density_byte == 0:
-                #     density_byte = 1
-
-                # selecting 'white' color:
-                # color = (density_byte, density_byte, density_byte)
-
-                # shades of blue:
-                blue_stop = (0x00, 0xbb, 0xff)
-                white_stop = (0xff, 0xff, 0xff)
-                color = blend_rgb_colors(blue_stop, white_stop, density_normalized)
-
-                # setting the color:
-                screen.fill(color, rect=pixel_rect)
-
-                # screen.set_at((grid_x, grid_y), color)
+        density_renderer.draw(screen, density_array, min_density, max_density)
 
         #
         # drawing grid:
         #
 
         if draw_grid_lines:
+            # the renderer stretches all `sim.size` cells (borders included) across the window:
+            cell_size = window_size / sim.size
             for grid_x in range(sim.size):
-                pixel_x = grid_size * grid_x
+                pixel_x = cell_size * grid_x
                 pygame.draw.line(
                     screen, grid_color,
                     start_pos=(pixel_x, 0),
@@ -230,7 +134,7 @@ def main():
                 )
 
             for grid_y in range(sim.size):
-                pixel_y = grid_size * grid_y
+                pixel_y = cell_size * grid_y
                 pygame.draw.line(
                     screen, grid_color,
                     start_pos=(0, pixel_y),
@@ -265,11 +169,21 @@ def main():
         help_label = debug_font.render(text, True, text_color)
         screen.blit(help_label, (window_size - 510, window_size - 50))
 
+        # drawing the step profiler's times, which leave out rendering, over its last `sim.profile_window` steps:
+        if profile_summary is not None:
+            for line_index, (stage_name, stage_summary) in enumerate(profile_summary.items()):
+                text = (
+                    f"{stage_name:>10}: mean={stage_summary['mean_ms']:7.3f}ms | "
+                    f"p95={stage_summary['p95_ms']:7.3f}ms | max={stage_summary['max_ms']:7.3f}ms"
+                )
+                profile_label = debug_font.render(text, True, text_color)
+                screen.blit(profile_label, (10, 10 + 20 * line_index))
+
         # debug: ensure we actually render
         # screen.fill((255, 0, 0))
 
     def run_main_menu_cb(screen):
-        nonlocal sim, active_v_field_menu_index, draw_grid_lines
+        nonlocal sim, active_v_field_menu_index, draw_grid_lines, show_profile_overlay
 
         # Writing callbacks:
         # - these functions are called by PyGame-Menu when the user clicks a button or enters text.
@@ -340,6 +254,12 @@ def main():
             nonlocal draw_grid_lines
             draw_grid_lines = value
 
+        def toggle_profile_overlay_cb(key, value):
+            nonlocal show_profile_overlay
+            show_profile_overlay = value
+            # the profiler only runs while its overlay is shown:
+            sim.profiling = value
+
         #
         # Create the menu widgets:
         #
@@ -387,6 +307,14 @@ def main():
         default_ix = int(draw_grid_lines)       # 0 or 1? it indexes the right option.
         grid_widget = menu.add.selector("Grid Lines", grid_opts, onchange=toggle_grid_line_cb, default=default_ix)
 
+        # this widget controls whether or not the step profiler's times are drawn:
+        profile_opts = [
+            ("Off", False),
+            ("On", True)
+        ]
+        profile_widget = menu.add.selector("Profiler Overlay", profile_opts, onchange=toggle_profile_overlay_cb,
+                                           default=int(show_profile_overlay))
+
         # thie widget allows the user to exit the whole app:
         quit_btn = menu.add.button("Quit", exit_game_cb)
 
@@ -406,53 +334,23 @@ def main():
         pass
 
     # running the app:
+    if config_watcher is not None:
+        config_watcher.start()
     app.run(
         window_size, window_size,
         "demo-4",
         init_cb=init_cb,
         render_cb=render_cb,
+        capture_cb=capture_cb,
         run_menu_cb=run_main_menu_cb,
         de_init_cb=de_init_cb,
-        desired_updates_per_sec=60
+        desired_updates_per_sec=60,
+        step_cb=step_cb,
+        sim_updates_per_sec=sim.max_display_updates_per_sec,
+        step_in_worker_thread=True
     )
-
-
-def normal_float_to_byte(x, default=0):
-    try:
-        xi = abs(int(255.0 * x))
-        return clamp(xi, 0, 255)
-    except ValueError:
-        return default
-
-
-def blend_rgb_colors(color1, color2, x):
-    r1, g1, b1 = color1
-    r2, g2, b2 = color2
-    return (
-        lerp(x, r1, r2),
-        lerp(x, g1, g2),
-        lerp(x, b1, b2)
-    )
-
-
-def lerp(x, a, b):
-    """
-    linearly interpolate between two stops
-    :param x: a value in [0,1] where 0 indicates all a, and 1 indicates all b
-    :param a: the 'a' stop
-    :param b: the 'b' stop
-    :return: a value y in [a,b] such that (y-a)/(b-a) = 1-x
-    """
-    return a + (1-x)*(b-a)
-
-
-def clamp(x, a, b):
-    if x < a:
-        return a
-    elif x > b:
-        return b
-    else:
-        return x
+    if config_watcher is not None:
+        config_watcher.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3.9
+
+"""
+Plays back a recording made with `fluids.recording`, through the same density renderer as demo-4.
+Press [SPACE], [ESCAPE], or [RETURN] to quit.
+"""
+
+import argparse
+
+import pygame
+
+import app
+import render
+from fluids import recording
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays back a simulation recording.")
+    parser.add_argument("path", help="the recording file to play")
+    parser.add_argument("--window-size", type=int, default=768, help="window width and height, in pixels")
+    parser.add_argument("--frames-per-sec", type=float, default=60.0, help="playback rate, in recorded frames/sec")
+    parser.add_argument("--no-loop", action="store_true", help="hold the last frame instead of looping")
+    args = parser.parse_args()
+
+    sim = recording.ReplaySimulator.open(args.path, loop=not args.no_loop)
+    window_size = args.window_size
+
+    # same colors as demo-4: empty cells are white, the densest cells are blue.
+    blue_stop = (0x00, 0xbb, 0xff)
+    white_stop = (0xff, 0xff, 0xff)
+    density_renderer = render.FieldRenderer(render.build_colormap_lut([white_stop, blue_stop]))
+
+    pygame.font.init()
+    debug_font = pygame.font.Font("./fonts/Nanum_Gothic_Coding/NanumGothicCoding-Regular.ttf", 18)
+    text_color = (0x00, 0x00, 0x00, 0xae)
+
+    is_first_menu_visit = True
+
+    def run_menu_cb(screen):
+        # there is no menu: the first visit starts playback, the next one (on a menu key press) quits.
+        nonlocal is_first_menu_visit
+        keep_running_app = is_first_menu_visit
+        is_first_menu_visit = False
+        return keep_running_app
+
+    def step_cb():
+        sim.step()
+
+    def render_cb(screen):
+        density_array = sim.density_view()
+        min_density = density_array.min()
+        max_density = density_array.max()
+        density_renderer.draw(screen, density_array, min_density, max_density - min_density)
+
+        step_index = sim.last_step_stats['step_index']
+        report = f"[frame={sim.frame_index}/{sim.replay.frame_count} | step={step_index} | t={step_index * sim.dt:.3f}]"
+        stats_label = debug_font.render(report, True, text_color)
+        screen.blit(stats_label, (10, window_size - 25))
+
+    app.run(
+        window_size, window_size,
+        f"replay - {args.path}",
+        run_menu_cb=run_menu_cb,
+        render_cb=render_cb,
+        desired_updates_per_sec=60,
+        step_cb=step_cb,
+        sim_updates_per_sec=args.frames_per_sec
+    )
+
+    sim.dispose()
+
+
+if __name__ == "__main__":
+    main()
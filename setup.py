@@ -2,7 +2,7 @@
 
 import sys
 
-from setuptools import setup
+from setuptools import setup, Extension
 from Cython.Build import cythonize
 
 
@@ -11,12 +11,37 @@ def main():
         print("ERROR: Args must contain `build_ext` and `--inplace` in that order.")
         return 1
 
+    compile_args, link_args = openmp_flags()
+    extensions = [
+        Extension(
+            "fluids.simulator", ["fluids/simulator.pyx"],
+            extra_compile_args=compile_args, extra_link_args=link_args
+        ),
+        Extension(
+            "fluids.simulator3d", ["fluids/simulator3d.pyx"],
+            extra_compile_args=compile_args, extra_link_args=link_args
+        ),
+    ]
+
     setup(
-        ext_modules=cythonize("fluids/simulator.pyx")
+        ext_modules=cythonize(extensions)
     )
     return 0
 
 
+def openmp_flags():
+    """
+    :return: the (compile, link) flags that enable OpenMP, used by the `prange` loops in the kernel.
+    """
+    if sys.platform == "win32":
+        return ["/openmp"], []
+    elif sys.platform == "darwin":
+        # Apple's clang ships without OpenMP: `prange` then compiles to ordinary serial loops.
+        return [], []
+    else:
+        return ["-fopenmp"], ["-fopenmp"]
+
+
 def list_contains(bigger_list, smaller_list):
     if len(bigger_list) < len(smaller_list):
         return False
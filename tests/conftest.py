@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from fluids import simulator
+
+
+def run_with_deferred_sources(n, step_count=3, ny=None, precision=simulator.PRECISION_SINGLE, **settings):
+    """
+    Steps a fresh simulator with fractional diffusion and viscosity, adding density and velocity sources to the source
+    buffers (immediate=False) before every step, as interactive runs do.
+    :param settings: `Simulator` properties to set, e.g. relaxation_block_depth=5
+    :return: copies of the final (density, vx, vy) fields, and the last step's `last_step_stats`.
+    """
+
+    sim = simulator.Simulator(n, init_diffusion=0.37, init_viscosity=0.61, time_rate=1.0, precision=precision, ny=ny)
+    sim.pressure_tolerance = 0
+    for name, value in settings.items():
+        setattr(sim, name, value)
+
+    xs, ys = np.indices(sim.shape)
+    density_source = np.exp(-((xs - sim.nx / 3) ** 2 + (ys - sim.ny / 2) ** 2) / 8.0)
+    velocity_source_x = np.sin(ys / 3.0) * density_source
+    velocity_source_y = np.cos(xs / 4.0) * density_source
+
+    for i in range(step_count):
+        sim.add_density_field(density_source)
+        sim.add_velocity_field(velocity_source_x, velocity_source_y)
+        sim.step()
+
+    fields = tuple(np.array(view) for view in (sim.density_view(), sim.vx_view(), sim.vy_view()))
+    stats = sim.last_step_stats
+    sim.dispose()
+    return fields, stats
+
+
+@pytest.fixture
+def deferred_source_run():
+    return run_with_deferred_sources
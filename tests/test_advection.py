@@ -0,0 +1,27 @@
+import numpy as np
+
+from fluids import bench
+from fluids import simulator
+
+
+def test_step_density_leaves_velocity_and_velocity_sources_alone():
+    sim = simulator.Simulator(16, 0.1, 0.1)
+    sim.density_view()[:] = 1.0
+    sim.vx_view()[:], sim.vy_view()[:] = bench.rotating_flow(sim, 1.0)
+    sim.add_velocity_field(np.ones(sim.shape), np.ones(sim.shape))
+    velocity = (np.array(sim.vx_view()), np.array(sim.vy_view()))
+
+    sim.step_density()
+    np.testing.assert_array_equal(sim.vx_view(), velocity[0])
+    np.testing.assert_array_equal(sim.vy_view(), velocity[1])
+    assert sim.source_views()[1].max() > 0
+    assert sim.last_step_stats['step_index'] == 1
+    sim.dispose()
+
+
+def test_corrected_schemes_rank_below_semi_lagrangian():
+    errors = {result['advection_scheme']: result['l1_error'] for result in bench.compare_advection_schemes(64)}
+    assert (
+        errors[simulator.ADVECTION_BFECC] < errors[simulator.ADVECTION_MACCORMACK] <
+        errors[simulator.ADVECTION_SEMI_LAGRANGIAN]
+    )
@@ -0,0 +1,14 @@
+import pytest
+
+from fluids import simulator
+
+
+def test_member_rejects_thread_count():
+    batch = simulator.BatchSimulator(3, 8, 0.1, 0.1)
+    member_sim = batch.member(1)
+    with pytest.raises(ValueError):
+        member_sim.thread_count = 4
+    assert member_sim.thread_count == 1
+    with pytest.raises(ValueError):
+        batch.configure(thread_count=4)
+    batch.dispose()
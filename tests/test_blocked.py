@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from fluids import simulator
+
+
+@pytest.mark.parametrize('relaxation', [simulator.RELAXATION_GAUSS_SEIDEL, simulator.RELAXATION_RED_BLACK])
+@pytest.mark.parametrize('block_depth', [2, 5])
+@pytest.mark.parametrize('step_count', [1, 3])
+def test_blocked_sweeps_match_unblocked(deferred_source_run, relaxation, block_depth, step_count):
+    unblocked_fields, unblocked_stats = deferred_source_run(16, step_count, relaxation=relaxation)
+    blocked_fields, blocked_stats = deferred_source_run(
+        16, step_count, relaxation=relaxation, relaxation_block_depth=block_depth
+    )
+
+    for unblocked_field, blocked_field in zip(unblocked_fields, blocked_fields):
+        np.testing.assert_array_equal(blocked_field, unblocked_field)
+    assert blocked_stats == unblocked_stats
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from fluids import config
+from fluids import simulator
+
+
+def write_config(path, **settings):
+    path.write_text(json.dumps(settings))
+    return str(path)
+
+
+def test_apply_config_reports_grid_changes_on_rectangular_simulator():
+    sim = simulator.Simulator(32, 0.1, 0.1, ny=16)
+    settings = dict(config.DEFAULT_CONFIG, viscosity=0.5)
+
+    assert config.apply_config(sim, settings) == ['n']
+    assert sim.viscosity == pytest.approx(0.5)
+    sim.dispose()
+
+
+def test_apply_config_rolls_back_on_rejected_setting():
+    sim = simulator.Simulator(16, 0.1, 0.1)
+    settings = dict(config.DEFAULT_CONFIG, n=16, viscosity=0.5, relaxation='sideways')
+
+    with pytest.raises(ValueError):
+        config.apply_config(sim, settings)
+    assert sim.viscosity == pytest.approx(0.1)
+    sim.dispose()
+
+
+def test_watcher_applies_new_version_to_rectangular_simulator(tmp_path):
+    path = write_config(tmp_path / "settings.json", n=32, viscosity=0.1)
+    watcher = config.ConfigWatcher(path)
+    sim = simulator.Simulator(32, 0.1, 0.1, ny=16)
+
+    write_config(tmp_path / "settings.json", n=32, viscosity=0.25, time_rate=0.5)
+    watcher.signature = None
+    assert watcher.poll()
+    assert watcher.apply_pending(sim) == ['n']
+    assert watcher.last_error is None
+    assert watcher.config['viscosity'] == 0.25
+    assert sim.viscosity == pytest.approx(0.25)
+    sim.dispose()
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from fluids import simulator
+
+
+@pytest.mark.parametrize('relaxation', [simulator.RELAXATION_GAUSS_SEIDEL, simulator.RELAXATION_RED_BLACK])
+@pytest.mark.parametrize('block_depth', [1, 4])
+@pytest.mark.parametrize('precision', list(simulator.precision_codes))
+@pytest.mark.parametrize('n, ny', [(16, None), (24, 10)])
+def test_fused_step_matches_staged_step(deferred_source_run, relaxation, block_depth, precision, n, ny):
+    settings = {'relaxation': relaxation, 'relaxation_block_depth': block_depth}
+    staged_fields, staged_stats = deferred_source_run(n, 3, ny, precision, fused_step=False, **settings)
+    fused_fields, fused_stats = deferred_source_run(n, 3, ny, precision, fused_step=True, **settings)
+
+    for staged_field, fused_field in zip(staged_fields, fused_fields):
+        np.testing.assert_array_equal(fused_field, staged_field)
+    assert fused_stats == staged_stats
@@ -0,0 +1,53 @@
+import struct
+
+import numpy as np
+import pytest
+
+from fluids import recording
+from fluids import simulator
+
+
+def record_rectangular_run(path, step_count=3):
+    sim = simulator.Simulator(16, 0.1, 0.1, ny=8)
+    sim.add_density_field(np.ones(sim.shape))
+    frames = []
+    with recording.FrameRecorder.for_simulator(path, sim) as recorder:
+        for i in range(step_count):
+            sim.step()
+            recorder.append_simulator(sim)
+            frames.append(np.array(sim.density_view()))
+    sim.dispose()
+    return frames
+
+
+def test_rectangular_recording_replays_with_its_shape(tmp_path):
+    path = tmp_path / "run.flrec"
+    frames = record_rectangular_run(path)
+
+    with recording.ReplaySimulator.open(path, loop=False) as replay_sim:
+        assert (replay_sim.nx, replay_sim.ny) == (16, 8)
+        assert replay_sim.shape == (18, 10)
+        assert replay_sim.ix(3, 5) == 3 * 10 + 5
+        with pytest.raises(ValueError):
+            replay_sim.size
+        for i, frame in enumerate(frames):
+            replay_sim.seek(i)
+            np.testing.assert_array_equal(replay_sim.density_view(), frame)
+
+
+def test_version_1_recording_still_loads(tmp_path):
+    path = tmp_path / "run.flrec"
+    sim = simulator.Simulator(12, 0.1, 0.1)
+    with recording.FrameRecorder.for_simulator(path, sim) as recorder:
+        recorder.append_simulator(sim, step_index=0)
+    sim.dispose()
+
+    # a version 1 file: the same header, with (n, size) in place of (nx, ny).
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<III", data, 8, 1, 12, 14)
+    path.write_bytes(bytes(data))
+
+    with recording.FrameReplay(path) as replay:
+        assert replay.shape == (14, 14)
+        assert replay.size == 14
+        assert replay.frame(0)[0].shape == (14, 14)
@@ -0,0 +1,64 @@
+import struct
+
+import numpy as np
+import pytest
+
+from fluids import simulator
+
+
+def stepped_simulator(time_rate, max_display_updates_per_sec=60.0):
+    sim = simulator.Simulator(
+        16, 0.37, 0.61, max_display_updates_per_sec=max_display_updates_per_sec, time_rate=time_rate, ny=12
+    )
+    sim.add_density_field(np.ones(sim.shape))
+    sim.step()
+    return sim
+
+
+@pytest.mark.parametrize('time_rate', [1.0, 0.37, 0.0])
+def test_restore_keeps_time_rate_exactly(tmp_path, time_rate):
+    sim = stepped_simulator(time_rate)
+    snapshot = sim.snapshot()
+    sim.save_snapshot(tmp_path / "state.snp")
+    dt = sim.dt
+
+    sim.time_rate = 2.5
+    sim.restore(snapshot)
+    assert sim.time_rate == time_rate
+    assert sim.dt == dt
+
+    sim.time_rate = 2.5
+    sim.load_snapshot(tmp_path / "state.snp")
+    assert sim.time_rate == time_rate
+    assert sim.dt == dt
+    sim.dispose()
+
+
+def test_restore_keeps_time_rate_across_display_rates():
+    sim = stepped_simulator(0.5)
+    other_sim = simulator.Simulator(16, 0.1, 0.1, max_display_updates_per_sec=30.0, ny=12)
+
+    other_sim.restore(sim.snapshot())
+    assert other_sim.time_rate == 0.5
+    assert other_sim.dt == 0.5 / 30.0
+    sim.dispose()
+    other_sim.dispose()
+
+
+def test_load_version_2_snapshot_derives_time_rate_from_dt(tmp_path):
+    sim = stepped_simulator(1.0)
+    path = tmp_path / "state.snp"
+    sim.save_snapshot(path)
+
+    # a version 2 file: the same header, with the version field at offset 8 and zero padding for the time rate.
+    data = bytearray(path.read_bytes())
+    struct.pack_into("<I", data, 8, 2)
+    struct.pack_into("<d", data, 52, 0.0)
+    path.write_bytes(bytes(data))
+
+    snapshot = simulator.load_grid_snapshot(path)
+    assert snapshot.time_rate is None
+    sim.time_rate = 2.5
+    sim.restore(snapshot)
+    assert sim.time_rate == pytest.approx(1.0)
+    sim.dispose()